@@ -204,6 +204,41 @@ def parse_args(args=None, namespace=None):
         default=True,
         help='Whether or not warnings are displayed')
 
+    parser.add_argument('--early_stop_threshold', type=float, default=None,
+                        help='stop training once the predicted final inception score is confidently below it')
+    parser.add_argument('--early_stop_freq', type=int, default=200,
+                        help='number of iterations between intermediate inception scores')
+    parser.add_argument('--early_stop_num_imgs', type=int, default=1000,
+                        help='number of images sampled for an intermediate inception score')
+    parser.add_argument('--early_stop_min_points', type=int, default=3,
+                        help='number of intermediate scores needed before extrapolating')
+    parser.add_argument('--early_stop_confidence', type=float, default=2.0,
+                        help='standard deviations the prediction must stay below the threshold')
+
+    parser.add_argument('--inherit_path', type=str, default=None,
+                        help='experiment directory of a trained parent to initialize the unchanged modules from')
+    parser.add_argument('--inherit_arch', nargs='+', type=int, default=None,
+                        help='the architecture vector the parent in --inherit_path was trained with')
+
+    parser.add_argument(
+        '--lean_gen',
+        type=str2bool,
+        default=False,
+        help='build a generator holding only the modules of --arch instead of the whole shared_gan supernet')
+
+    parser.add_argument('--compile_mode', type=str, default='eager', choices=['eager', 'compile'],
+                        help='compile the derived generator and discriminator with torch.compile')
+    parser.add_argument(
+        '--stack_discriminators',
+        type=str2bool,
+        default=False,
+        help='in lockstep training, run the discriminators of the candidates as one vmapped module')
+    parser.add_argument(
+        '--distributed',
+        type=str2bool,
+        default=False,
+        help='data parallel training over the processes of a torchrun launch, with the gloo backend')
+
     parser.add_argument('--arch', nargs='+', type=int,
                     help='the vector of a discovered architecture')
 
@@ -5,6 +5,7 @@
 # @Version : 0.0
 
 import torch
+import torch.distributed as dist
 import torchvision.datasets as datasets
 import torchvision.transforms as transforms
 from torch.utils.data import Dataset
@@ -31,12 +32,21 @@ class ImageDataset(object):
         else:
             raise NotImplementedError('Unknown dataset: {}'.format(args.dataset))
 
+        # in data parallel training every rank loads its own shard of the training set
         if args.dataset.lower() == 'stl10':
-            self.train = torch.utils.data.DataLoader(
-                Dt(root=args.data_path, split='train+unlabeled', transform=transform, download=True),
-                batch_size=args.dis_batch_size, shuffle=True,
-                num_workers=args.num_workers, pin_memory=True)
+            train_set = Dt(root=args.data_path, split='train+unlabeled', transform=transform, download=True)
+        else:
+            train_set = Dt(root=args.data_path, train=True, transform=transform, download=True)
+        if dist.is_initialized():
+            self.train_sampler = torch.utils.data.distributed.DistributedSampler(train_set)
+        else:
+            self.train_sampler = None
+        self.train = torch.utils.data.DataLoader(
+            train_set,
+            batch_size=args.dis_batch_size, shuffle=self.train_sampler is None, sampler=self.train_sampler,
+            num_workers=args.num_workers, pin_memory=True)
 
+        if args.dataset.lower() == 'stl10':
             self.valid = torch.utils.data.DataLoader(
                 Dt(root=args.data_path, split='test', transform=transform),
                 batch_size=args.dis_batch_size, shuffle=False,
@@ -44,11 +54,6 @@ class ImageDataset(object):
 
             self.test = self.valid
         else:
-            self.train = torch.utils.data.DataLoader(
-                Dt(root=args.data_path, train=True, transform=transform, download=True),
-                batch_size=args.dis_batch_size, shuffle=True,
-                num_workers=args.num_workers, pin_memory=True)
-
             self.valid = torch.utils.data.DataLoader(
                 Dt(root=args.data_path, train=False, transform=transform),
                 batch_size=args.dis_batch_size, shuffle=False,
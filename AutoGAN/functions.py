@@ -12,12 +12,15 @@ from copy import deepcopy
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from imageio import imsave
 from torchvision.utils import make_grid
 from tqdm import tqdm
 
 from .utils.fid_score import calculate_fid_given_paths
 from .utils.inception_score import get_inception_score
+from .utils.distributed import all_reduce_grads
+from .utils.stacking import StackedModules, can_stack
 
 logger = logging.getLogger(__name__)
 
@@ -61,8 +64,8 @@ def train_shared(args, gen_net: nn.Module, dis_net: nn.Module, g_loss_history, d
             fake_validity = dis_net(fake_imgs)
 
             # cal loss
-            d_loss = torch.mean(nn.ReLU(inplace=True)(1.0 - real_validity)) + \
-                     torch.mean(nn.ReLU(inplace=True)(1 + fake_validity))
+            d_loss = torch.mean(F.relu(1.0 - real_validity)) + \
+                     torch.mean(F.relu(1 + fake_validity))
             d_loss.backward()
             dis_optimizer.step()
 
@@ -110,23 +113,90 @@ def train_shared(args, gen_net: nn.Module, dis_net: nn.Module, g_loss_history, d
     return dynamic_reset
 
 
+def train_supernet(args, gen_net: nn.Module, dis_net: nn.Module, gen_optimizer, dis_optimizer, train_loader,
+                   sample_arch, n_epoch):
+    """
+    Train the shared GAN on architectures drawn from sample_arch, a new one every iteration.
+    Unlike train_shared there is no controller and no dynamic reset.
+    """
+    logger.info('=> train supernet...')
+    gen_step = 0
+
+    # train mode
+    gen_net.train()
+    dis_net.train()
+    dis_net.cur_stage = 2
+    device = next(gen_net.parameters()).device
+
+    for epoch in range(n_epoch):
+        for iter_idx, (imgs, _) in enumerate(train_loader):
+
+            # sample an arch
+            gen_net.set_arch(sample_arch(), cur_stage=2)
+            real_imgs = imgs.to(device, torch.float)
+
+            # Sample noise as generator input
+            z = torch.tensor(np.random.normal(0, 1, (imgs.shape[0], args.latent_dim)), dtype=torch.float,
+                             device=device)
+
+            # ---------------------
+            #  Train Discriminator
+            # ---------------------
+            dis_optimizer.zero_grad()
+
+            real_validity = dis_net(real_imgs)
+            fake_imgs = gen_net(z).detach()
+            fake_validity = dis_net(fake_imgs)
+
+            # cal loss
+            d_loss = torch.mean(F.relu(1.0 - real_validity)) + \
+                     torch.mean(F.relu(1 + fake_validity))
+            d_loss.backward()
+            dis_optimizer.step()
+
+            # -----------------
+            #  Train Generator
+            # -----------------
+            if iter_idx % args.n_critic == 0:
+                gen_optimizer.zero_grad()
+
+                gen_z = torch.tensor(np.random.normal(0, 1, (args.gen_batch_size, args.latent_dim)), dtype=torch.float,
+                                     device=device)
+                gen_imgs = gen_net(gen_z)
+                fake_validity = dis_net(gen_imgs)
+
+                # cal loss
+                g_loss = -torch.mean(fake_validity)
+                g_loss.backward()
+                gen_optimizer.step()
+                gen_step += 1
+
+            # verbose
+            if gen_step and iter_idx % args.print_freq == 0:
+                logger.info(
+                    "[Epoch %d/%d] [Batch %d/%d] [D loss: %f] [G loss: %f]" %
+                    (epoch, n_epoch, iter_idx % len(train_loader), len(train_loader), d_loss.item(),
+                     g_loss.item()))
+
+
 def train(args, gen_net: nn.Module, dis_net: nn.Module, gen_optimizer, dis_optimizer, gen_avg_param, train_loader,
-          epoch, writer_dict, schedulers=None):
+          epoch, writer_dict, schedulers=None, monitor=None):
     writer = writer_dict['writer']
     gen_step = 0
 
     # train mode
     gen_net = gen_net.train()
     dis_net = dis_net.train()
+    device = next(gen_net.parameters()).device
 
     for iter_idx, (imgs, _) in enumerate(tqdm(train_loader)):
         global_steps = writer_dict['train_global_steps']
 
         # Adversarial ground truths
-        real_imgs = imgs.type(torch.cuda.FloatTensor)
+        real_imgs = imgs.to(device, torch.float)
 
         # Sample noise as generator input
-        z = torch.cuda.FloatTensor(np.random.normal(0, 1, (imgs.shape[0], args.latent_dim)))
+        z = torch.tensor(np.random.normal(0, 1, (imgs.shape[0], args.latent_dim)), dtype=torch.float, device=device)
 
         # ---------------------
         #  Train Discriminator
@@ -140,9 +210,10 @@ def train(args, gen_net: nn.Module, dis_net: nn.Module, gen_optimizer, dis_optim
         fake_validity = dis_net(fake_imgs)
 
         # cal loss
-        d_loss = torch.mean(nn.ReLU(inplace=True)(1.0 - real_validity)) + \
-                 torch.mean(nn.ReLU(inplace=True)(1 + fake_validity))
+        d_loss = torch.mean(F.relu(1.0 - real_validity)) + \
+                 torch.mean(F.relu(1 + fake_validity))
         d_loss.backward()
+        all_reduce_grads(dis_net)
         dis_optimizer.step()
 
         writer.add_scalar('d_loss', d_loss.item(), global_steps)
@@ -153,13 +224,15 @@ def train(args, gen_net: nn.Module, dis_net: nn.Module, gen_optimizer, dis_optim
         if global_steps % args.n_critic == 0:
             gen_optimizer.zero_grad()
 
-            gen_z = torch.cuda.FloatTensor(np.random.normal(0, 1, (args.gen_batch_size, args.latent_dim)))
+            gen_z = torch.tensor(np.random.normal(0, 1, (args.gen_batch_size, args.latent_dim)), dtype=torch.float,
+                                 device=device)
             gen_imgs = gen_net(gen_z)
             fake_validity = dis_net(gen_imgs)
 
             # cal loss
             g_loss = -torch.mean(fake_validity)
             g_loss.backward()
+            all_reduce_grads(gen_net)
             gen_optimizer.step()
 
             # adjust learning rate
@@ -183,9 +256,126 @@ def train(args, gen_net: nn.Module, dis_net: nn.Module, gen_optimizer, dis_optim
                 "[Epoch %d/%d] [Batch %d/%d] [D loss: %f] [G loss: %f]" %
                 (epoch, args.max_epoch, iter_idx % len(train_loader), len(train_loader), d_loss.item(), g_loss.item()))
 
+        # intermediate scoring, may raise EarlyTermination
+        if monitor:
+            monitor(global_steps, gen_net, gen_avg_param)
+
         writer_dict['train_global_steps'] = global_steps + 1
 
 
+def train_lockstep(args, gen_nets, dis_nets, gen_optimizers, dis_optimizers, gen_avg_params, train_loader, epoch,
+                   writer_dicts, schedulers=None, stack=False):
+    """
+    One epoch of train for several candidates on the same real minibatches.
+    With stack, discriminators that can_stack run as one vmapped module.
+    """
+    n_runs = len(gen_nets)
+    schedulers = schedulers or [None] * n_runs
+    stacked_dis = StackedModules(dis_nets) if stack and can_stack(dis_nets) else None
+    gen_step = 0
+
+    # train mode
+    for gen_net, dis_net in zip(gen_nets, dis_nets):
+        gen_net.train()
+        dis_net.train()
+    device = next(gen_nets[0].parameters()).device
+
+    for iter_idx, (imgs, _) in enumerate(tqdm(train_loader)):
+        global_steps = writer_dicts[0]['train_global_steps']
+
+        # the real minibatch is moved to the device once for every candidate
+        real_imgs = imgs.to(device, torch.float)
+
+        # ---------------------
+        #  Train Discriminators
+        # ---------------------
+        for dis_optimizer in dis_optimizers:
+            dis_optimizer.zero_grad()
+
+        fake_imgs = []
+        for gen_net in gen_nets:
+            z = torch.tensor(np.random.normal(0, 1, (imgs.shape[0], args.latent_dim)), dtype=torch.float,
+                             device=device)
+            fake_imgs.append(gen_net(z).detach())
+            assert fake_imgs[-1].size() == real_imgs.size()
+
+        if stacked_dis:
+            stacked_dis.stack()
+            real_validity = stacked_dis(real_imgs, shared=True)
+            fake_validity = stacked_dis(torch.stack(fake_imgs))
+            d_losses = torch.mean(F.relu(1.0 - real_validity), dim=(1, 2)) + \
+                       torch.mean(F.relu(1 + fake_validity), dim=(1, 2))
+            d_losses.sum().backward()
+            stacked_dis.scatter_grads()
+        else:
+            d_losses = []
+            for dis_net, fake in zip(dis_nets, fake_imgs):
+                d_loss = torch.mean(F.relu(1.0 - dis_net(real_imgs))) + \
+                         torch.mean(F.relu(1 + dis_net(fake)))
+                d_loss.backward()
+                d_losses.append(d_loss)
+        for dis_optimizer in dis_optimizers:
+            dis_optimizer.step()
+        d_losses = [d_loss.item() for d_loss in d_losses]
+
+        for writer_dict, d_loss in zip(writer_dicts, d_losses):
+            writer_dict['writer'].add_scalar('d_loss', d_loss, global_steps)
+
+        # -----------------
+        #  Train Generators
+        # -----------------
+        if global_steps % args.n_critic == 0:
+            for gen_optimizer in gen_optimizers:
+                gen_optimizer.zero_grad()
+
+            gen_imgs = []
+            for gen_net in gen_nets:
+                gen_z = torch.tensor(np.random.normal(0, 1, (args.gen_batch_size, args.latent_dim)), dtype=torch.float,
+                                     device=device)
+                gen_imgs.append(gen_net(gen_z))
+
+            if stacked_dis:
+                stacked_dis.stack()
+                g_losses = -torch.mean(stacked_dis(torch.stack(gen_imgs)), dim=(1, 2))
+                g_losses.sum().backward()
+            else:
+                g_losses = []
+                for dis_net, gen_img in zip(dis_nets, gen_imgs):
+                    g_loss = -torch.mean(dis_net(gen_img))
+                    g_loss.backward()
+                    g_losses.append(g_loss)
+            g_losses = [g_loss.item() for g_loss in g_losses]
+
+            for k in range(n_runs):
+                gen_optimizers[k].step()
+                writer = writer_dicts[k]['writer']
+
+                # adjust learning rate
+                if schedulers[k]:
+                    gen_scheduler, dis_scheduler = schedulers[k]
+                    g_lr = gen_scheduler.step(global_steps)
+                    d_lr = dis_scheduler.step(global_steps)
+                    writer.add_scalar('LR/g_lr', g_lr, global_steps)
+                    writer.add_scalar('LR/d_lr', d_lr, global_steps)
+
+                # moving average weight
+                for p, avg_p in zip(gen_nets[k].parameters(), gen_avg_params[k]):
+                    avg_p.mul_(0.999).add_(0.001, p.data)
+
+                writer.add_scalar('g_loss', g_losses[k], global_steps)
+            gen_step += 1
+
+        # verbose
+        if gen_step and iter_idx % args.print_freq == 0:
+            tqdm.write(
+                "[Epoch %d/%d] [Batch %d/%d] [D loss: %s] [G loss: %s]" %
+                (epoch, args.max_epoch, iter_idx % len(train_loader), len(train_loader),
+                 ' '.join('%f' % d_loss for d_loss in d_losses), ' '.join('%f' % g_loss for g_loss in g_losses)))
+
+        for writer_dict in writer_dicts:
+            writer_dict['train_global_steps'] = global_steps + 1
+
+
 def train_controller(args, controller, ctrl_optimizer, gen_net, prev_hiddens, prev_archs, writer_dict):
     logger.info("=> train controller...")
     writer = writer_dict['writer']
@@ -249,11 +439,13 @@ def get_is(args, gen_net: nn.Module, num_img):
 
     # eval mode
     gen_net = gen_net.eval()
+    device = next(gen_net.parameters()).device
 
     eval_iter = num_img // args.eval_batch_size
     img_list = list()
     for _ in range(eval_iter):
-        z = torch.cuda.FloatTensor(np.random.normal(0, 1, (args.eval_batch_size, args.latent_dim)))
+        z = torch.tensor(np.random.normal(0, 1, (args.eval_batch_size, args.latent_dim)), dtype=torch.float,
+                         device=device)
 
         # Generate a batch of images
         gen_imgs = gen_net(z).mul_(127.5).add_(127.5).clamp_(0.0, 255.0).permute(0, 2, 3, 1).to('cpu',
@@ -274,8 +466,9 @@ def validate(args, fixed_z, fid_stat, gen_net: nn.Module, writer_dict, clean_dir
     # eval mode
     gen_net = gen_net.eval()
 
-    # generate images
-    sample_imgs = gen_net(fixed_z)
+    # generate images, no graph is needed for sampling
+    with torch.no_grad():
+        sample_imgs = gen_net(fixed_z)
     img_grid = make_grid(sample_imgs, nrow=5, normalize=True, scale_each=True)
 
     # get fid and inception score
@@ -286,11 +479,13 @@ def validate(args, fixed_z, fid_stat, gen_net: nn.Module, writer_dict, clean_dir
     eval_iter = args.num_eval_imgs // args.eval_batch_size
     img_list = list()
     for iter_idx in tqdm(range(eval_iter), desc='sample images'):
-        z = torch.cuda.FloatTensor(np.random.normal(0, 1, (args.eval_batch_size, args.latent_dim)))
+        z = torch.tensor(np.random.normal(0, 1, (args.eval_batch_size, args.latent_dim)), dtype=torch.float,
+                         device=fixed_z.device)
 
         # Generate a batch of images
-        gen_imgs = gen_net(z).mul_(127.5).add_(127.5).clamp_(0.0, 255.0).permute(0, 2, 3, 1).to('cpu',
-                                                                                                torch.uint8).numpy()
+        with torch.no_grad():
+            gen_imgs = gen_net(z).mul_(127.5).add_(127.5).clamp_(0.0, 255.0).permute(0, 2, 3, 1).to('cpu',
+                                                                                                    torch.uint8).numpy()
         if (args.calc_fid):
             for img_idx, img in enumerate(gen_imgs):
                 file_name = os.path.join(fid_buffer_dir, f'iter{iter_idx}_b{img_idx}.png')
@@ -46,7 +46,7 @@ class PreGenBlock(nn.Module):
             h = x
 
         # activation
-        h = nn.ReLU()(h)
+        h = F.relu(h)
 
         # whether this is a upsample block
         if self.up_block:
@@ -97,7 +97,7 @@ class PostGenBlock(nn.Module):
                 raise NotImplementedError(self.norm_type)
 
         # activation
-        out = nn.ReLU()(h)
+        out = F.relu(h)
 
         return out
 
@@ -153,17 +153,19 @@ class Cell(nn.Module):
         else:
             raise NotImplementedError(self.norm_type)
         _, _, ht, wt = h.size()
-        h_skip_out = h
         # second conv
         if self.num_skip_in:
             assert len(self.skip_in_ops) == len(self.skip_ins)
             for skip_flag, ft, skip_in_op in zip(self.skip_ins, skip_ft, self.skip_in_ops):
                 if skip_flag:
+                    # out of place, the activation h comes from is needed by its backward
                     if self.up_type != 'deconv':
-                        h += skip_in_op(F.interpolate(ft, size=(ht, wt), mode=self.up_type))
+                        h = h + skip_in_op(F.interpolate(ft, size=(ht, wt), mode=self.up_type))
                     else:
                         scale = wt // ft.size()[-1]
-                        h += skip_in_op(getattr(self, f'skip_deconvx{scale}')(ft))
+                        h = h + skip_in_op(getattr(self, f'skip_deconvx{scale}')(ft))
+        # the skip output of the cell includes its own skip inputs
+        h_skip_out = h
 
         if self.conv_type == 'post':
             final_out = self.post_conv2(h)
@@ -175,16 +177,16 @@ class Cell(nn.Module):
         # shortcut
         if self.short_cut:
             if self.up_type != 'deconv':
-                final_out += self.c_sc(F.interpolate(x, scale_factor=2, mode=self.up_type))
+                final_out = final_out + self.c_sc(F.interpolate(x, scale_factor=2, mode=self.up_type))
             else:
-                final_out += self.c_sc(self.deconv_sc(x))
+                final_out = final_out + self.c_sc(self.deconv_sc(x))
 
         return h_skip_out, final_out
 
 
 def _downsample(x):
     # Downsample (Mean Avg Pooling with 2x2 kernel)
-    return nn.AvgPool2d(kernel_size=2)(x)
+    return F.avg_pool2d(x, kernel_size=2)
 
 
 class OptimizedDisBlock(nn.Module):
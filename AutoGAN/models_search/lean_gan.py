@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# Generator specialized to one fixed architecture of the shared_gan search space.
+import torch.nn as nn
+import torch.nn.functional as F
+
+from collections import OrderedDict
+
+from .building_blocks_search import CONV_TYPE, NORM_TYPE, UP_TYPE, SHORT_CUT_TYPE, decimal2binary
+
+
+class LeanPreGenBlock(nn.Module):
+    """
+    PreGenBlock with its norm and upsampling fixed, holding only the layers they use
+    """
+    def __init__(self, in_channels, out_channels, up_block, up_type, norm_type, ksize=3):
+        super(LeanPreGenBlock, self).__init__()
+        self.up_block = up_block
+        self.up_type = up_type
+        self.norm_type = norm_type
+        if norm_type == 'bn':
+            self.bn = nn.BatchNorm2d(in_channels)
+        elif norm_type == 'in':
+            self.inn = nn.InstanceNorm2d(in_channels)
+        if up_block and up_type == 'deconv':
+            self.deconv = nn.ConvTranspose2d(in_channels, in_channels, kernel_size=2, stride=2)
+        self.conv = nn.Conv2d(in_channels, out_channels, ksize, padding=ksize//2)
+
+    def forward(self, x):
+        h = x
+        if self.norm_type == 'bn':
+            h = self.bn(h)
+        elif self.norm_type == 'in':
+            h = self.inn(h)
+        h = F.relu(h)
+        if self.up_block:
+            if self.up_type == 'deconv':
+                h = self.deconv(h)
+            else:
+                h = F.interpolate(h, scale_factor=2, mode=self.up_type)
+        return self.conv(h)
+
+
+class LeanPostGenBlock(nn.Module):
+    """
+    PostGenBlock with its norm and upsampling fixed, holding only the layers they use
+    """
+    def __init__(self, in_channels, out_channels, up_block, up_type, norm_type, ksize=3):
+        super(LeanPostGenBlock, self).__init__()
+        self.up_block = up_block
+        self.up_type = up_type
+        self.norm_type = norm_type
+        if up_block and up_type == 'deconv':
+            self.deconv = nn.ConvTranspose2d(in_channels, in_channels, kernel_size=2, stride=2)
+        self.conv = nn.Conv2d(in_channels, out_channels, ksize, padding=ksize//2)
+        if norm_type == 'bn':
+            self.bn = nn.BatchNorm2d(out_channels)
+        elif norm_type == 'in':
+            self.inn = nn.InstanceNorm2d(out_channels)
+
+    def forward(self, x):
+        h = x
+        if self.up_block:
+            if self.up_type == 'deconv':
+                h = self.deconv(h)
+            else:
+                h = F.interpolate(h, scale_factor=2, mode=self.up_type)
+        h = self.conv(h)
+        if self.norm_type == 'bn':
+            h = self.bn(h)
+        elif self.norm_type == 'in':
+            h = self.inn(h)
+        return F.relu(h)
+
+
+class LeanCell(nn.Module):
+    """
+    Cell with its architecture fixed at construction. Modules keep the names
+    they have in Cell, so its state dict is a subset of the Cell state dict.
+    """
+    def __init__(self, in_channels, out_channels, num_skip_in, conv_id, norm_id, up_id, short_cut_id, skip_ins,
+                 ksize=3):
+        super(LeanCell, self).__init__()
+        self.conv_type = CONV_TYPE[conv_id]
+        self.up_type = UP_TYPE[up_id]
+        self.short_cut = SHORT_CUT_TYPE[short_cut_id]
+        norm_type = NORM_TYPE[norm_id]
+        block = LeanPreGenBlock if self.conv_type == 'pre' else LeanPostGenBlock
+        setattr(self, f'{self.conv_type}_conv1',
+                block(in_channels, out_channels, up_block=True, up_type=self.up_type, norm_type=norm_type, ksize=ksize))
+        setattr(self, f'{self.conv_type}_conv2',
+                block(out_channels, out_channels, up_block=False, up_type=self.up_type, norm_type=norm_type, ksize=ksize))
+
+        if self.short_cut:
+            if self.up_type == 'deconv':
+                self.deconv_sc = nn.ConvTranspose2d(in_channels, in_channels, kernel_size=2, stride=2)
+            self.c_sc = nn.Conv2d(in_channels, out_channels, kernel_size=1)
+
+        # same decoding as Cell.set_arch: the lowest bit is the last skip input
+        self.num_skip_in = num_skip_in
+        self.skip_ins = [0 for _ in range(num_skip_in)]
+        if num_skip_in:
+            for skip_idx, skip_in in enumerate(decimal2binary(skip_ins)[::-1]):
+                self.skip_ins[-(skip_idx + 1)] = int(skip_in)
+        # skip input i is the output of cell i, 2 ** (num_skip_in - i) times smaller
+        self.skip_scales = [2 ** (num_skip_in - i) for i in range(num_skip_in)]
+        self.skip_in_ops = nn.ModuleDict([
+            (str(i), nn.Conv2d(in_channels, out_channels, kernel_size=1))
+            for i in range(num_skip_in) if self.skip_ins[i]
+        ])
+        if self.up_type == 'deconv':
+            scales = {scale for scale, flag in zip(self.skip_scales, self.skip_ins) if flag}
+            if 2 in scales:
+                self.skip_deconvx2 = nn.ConvTranspose2d(in_channels, out_channels, kernel_size=2, stride=2)
+            if 4 in scales:
+                self.skip_deconvx4 = nn.Sequential(
+                    nn.ConvTranspose2d(in_channels, out_channels, kernel_size=2, stride=2),
+                    nn.ConvTranspose2d(out_channels, out_channels, kernel_size=2, stride=2)
+                )
+
+    def forward(self, x, skip_ft=None):
+        h = getattr(self, f'{self.conv_type}_conv1')(x)
+        _, _, ht, wt = h.size()
+        for i, ft in enumerate(skip_ft or ()):
+            if self.skip_ins[i]:
+                if self.up_type != 'deconv':
+                    h = h + self.skip_in_ops[str(i)](F.interpolate(ft, size=(ht, wt), mode=self.up_type))
+                else:
+                    h = h + self.skip_in_ops[str(i)](getattr(self, f'skip_deconvx{self.skip_scales[i]}')(ft))
+        h_skip_out = h
+
+        final_out = getattr(self, f'{self.conv_type}_conv2')(h)
+        if self.short_cut:
+            if self.up_type != 'deconv':
+                final_out = final_out + self.c_sc(F.interpolate(x, scale_factor=2, mode=self.up_type))
+            else:
+                final_out = final_out + self.c_sc(self.deconv_sc(x))
+        return h_skip_out, final_out
+
+
+class LeanGenerator(nn.Module):
+    """
+    shared_gan Generator materialized for the fixed architecture args.arch:
+    it only holds, trains and checkpoints the modules that architecture uses.
+    """
+    def __init__(self, args):
+        super(LeanGenerator, self).__init__()
+        self.args = args
+        self.ch = args.gf_dim
+        self.bottom_width = args.bottom_width
+        self.arch = [int(x) for x in args.arch]
+        self.cur_stage = 2
+        self.l1 = nn.Linear(args.latent_dim, (self.bottom_width ** 2) * args.gf_dim)
+        self.cell1 = LeanCell(args.gf_dim, args.gf_dim, 0, *self.arch[:4], skip_ins=0)
+        self.cell2 = LeanCell(args.gf_dim, args.gf_dim, 1, *self.arch[4:9])
+        self.cell3 = LeanCell(args.gf_dim, args.gf_dim, 2, *self.arch[9:14])
+        self.to_rgb = nn.Sequential(
+            nn.BatchNorm2d(args.gf_dim),
+            nn.ReLU(),
+            nn.Conv2d(args.gf_dim, 3, 3, 1, 1),
+            nn.Tanh()
+        )
+
+    def set_arch(self, arch_id, cur_stage):
+        """
+        The architecture is fixed, this only checks that it is the requested one
+        """
+        if not isinstance(arch_id, list):
+            arch_id = arch_id.to('cpu').numpy().tolist()
+        if [int(x) for x in arch_id] != self.arch or cur_stage != 2:
+            raise Exception(f"LeanGenerator is built for {self.arch} at stage 2, not {arch_id} at stage {cur_stage}")
+
+    def forward(self, z):
+        h = self.l1(z).view(-1, self.ch, self.bottom_width, self.bottom_width)
+        h1_skip_out, h1 = self.cell1(h)
+        h2_skip_out, h2 = self.cell2(h1, (h1_skip_out,))
+        _, h3 = self.cell3(h2, (h1_skip_out, h2_skip_out))
+        return self.to_rgb(h3)
+
+    def load_supernet_state_dict(self, state_dict):
+        """
+        Load the weights of this architecture from a shared_gan Generator state dict
+        """
+        self.load_state_dict(lean_state_dict(self, state_dict))
+
+
+def lean_state_dict(gen_net, state_dict):
+    """
+    The entries of a shared_gan Generator state dict that gen_net has,
+    supernet keys are mapped onto the lean ones by name
+    """
+    keys = list(gen_net.state_dict().keys())
+    missing = [key for key in keys if key not in state_dict]
+    if missing:
+        raise Exception(f"State dict lacks {len(missing)} generator entries, e.g. {missing[0]}")
+    return OrderedDict((key, state_dict[key]) for key in keys)
+
+
+def load_generator_state_dict(gen_net, state_dict):
+    """
+    Load a generator checkpoint whether it was saved from a shared_gan Generator
+    or a LeanGenerator. A supernet loading a lean checkpoint keeps its
+    current weights for the modules the lean architecture does not have.
+    """
+    if isinstance(gen_net, LeanGenerator):
+        gen_net.load_supernet_state_dict(state_dict)
+        return
+    own_keys = gen_net.state_dict()
+    unexpected = [key for key in state_dict if key not in own_keys]
+    if unexpected:
+        raise Exception(f"State dict has {len(unexpected)} entries the generator lacks, e.g. {unexpected[0]}")
+    gen_net.load_state_dict(state_dict, strict=False)
@@ -4,6 +4,7 @@
 # @Link    : None
 # @Version : 0.0
 import torch.nn as nn
+import torch.nn.functional as F
 
 from .building_blocks_search import Cell
 
@@ -56,9 +57,71 @@ class Generator(nn.Module):
             return self.to_rgb(h3)
 
 
+def init_weights(net, init_type):
+    def weights_init(m):
+        classname = m.__class__.__name__
+        if classname.find('Conv2d') != -1:
+            if init_type == 'normal':
+                nn.init.normal_(m.weight.data, 0.0, 0.02)
+            elif init_type == 'orth':
+                nn.init.orthogonal_(m.weight.data)
+            elif init_type == 'xavier_uniform':
+                nn.init.xavier_uniform(m.weight.data, 1.)
+            else:
+                raise NotImplementedError('{} unknown inital type'.format(init_type))
+        elif classname.find('BatchNorm2d') != -1:
+            nn.init.normal_(m.weight.data, 1.0, 0.02)
+            nn.init.constant_(m.bias.data, 0.0)
+
+    net.apply(weights_init)
+
+
+# genes each group of cell modules depends on, as positions within the cell's arch slice:
+# conv, norm, up, shortcut, skip
+_CELL_MODULE_GENES = [
+    (('pre_conv1', 'pre_conv2', 'post_conv1', 'post_conv2'), (0, 1, 2)),
+    (('deconv_sc', 'c_sc'), (2, 3)),
+    (('skip_deconvx2', 'skip_deconvx4', 'skip_in_ops'), (2, 4)),
+]
+_CELL_ARCH_SLICES = [('cell1', 0, 4), ('cell2', 4, 9), ('cell3', 9, 14)]
+
+
+def inherited_modules(parent_arch, child_arch):
+    """
+    Names of the generator modules whose architecture choices are the same
+    in parent_arch and child_arch, so that their trained weights carry over
+    """
+    modules = ['l1', 'to_rgb']
+    for cell, start, end in _CELL_ARCH_SLICES:
+        parent_genes = [int(x) for x in parent_arch[start:end]]
+        child_genes = [int(x) for x in child_arch[start:end]]
+        for names, genes in _CELL_MODULE_GENES:
+            genes = [g for g in genes if g < end - start]
+            if all(parent_genes[g] == child_genes[g] for g in genes):
+                modules.extend(f'{cell}.{name}' for name in names)
+    return modules
+
+
+def inherit_weights(gen_net, parent_state_dict, parent_arch, child_arch):
+    """
+    Copy the parent generator weights of every module unaffected by the
+    differences between the two architectures, the others keep their
+    current (freshly initialized) weights
+    :return: names of the inherited modules
+    """
+    modules = inherited_modules(parent_arch, child_arch)
+    prefixes = tuple(name + '.' for name in modules)
+    state_dict = gen_net.state_dict()
+    for key, value in parent_state_dict.items():
+        if key.startswith(prefixes) and key in state_dict:
+            state_dict[key] = value
+    gen_net.load_state_dict(state_dict)
+    return modules
+
+
 def _downsample(x):
     # Downsample (Mean Avg Pooling with 2x2 kernel)
-    return nn.AvgPool2d(kernel_size=2)(x)
+    return F.avg_pool2d(x, kernel_size=2)
 
 
 class OptimizedDisBlock(nn.Module):
@@ -204,8 +267,8 @@ class Discriminator(nn.Module):
     def forward(self, x):
         h = x
         layers = [self.block1, self.block2, self.block3]
-        variable_model = nn.Sequential(*layers[:(self.cur_stage + 1)])
-        h = variable_model(h)
+        for layer in layers[:(self.cur_stage + 1)]:
+            h = layer(h)
         h = self.block4(h)
         h = self.activation(h)
         # Global average pooling
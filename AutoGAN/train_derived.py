@@ -8,16 +8,23 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from .models_search.shared_gan import Generator, Discriminator
+from .models_search.shared_gan import Generator, Discriminator, inherit_weights, init_weights
+from .models_search.lean_gan import LeanGenerator, load_generator_state_dict
 from . import datasets
-from .functions import train, validate, LinearLrDecay, load_params, copy_params
+from .functions import train, train_lockstep, validate, LinearLrDecay, load_params, copy_params
 from .utils.utils import set_log_dir, save_checkpoint, create_logger
 from .utils.inception_score import _init_inception
+from .utils.learning_curve import EarlyStopMonitor, EarlyTermination
+from .utils.compilation import compile_model
+from .utils.distributed import (init_distributed, cleanup_distributed, is_main_process, get_device,
+                                broadcast_module, NullWriter)
 from .utils.fid_score import create_inception_graph, check_or_download_inception
 
+import logging
 import warnings
 import torch
 import os
+import shutil
 import numpy as np
 import torch.nn as nn
 from tensorboardX import SummaryWriter
@@ -28,163 +35,283 @@ torch.backends.cudnn.enabled = True
 torch.backends.cudnn.benchmark = True
 
 
-def train_derived(args):
+class TrainingContext(object):
+    """
+    Process wide setup shared by consecutive calls to train_derived:
+    the inception graphs and the data loader.
+    """
+    def __init__(self, args):
+        # set tf env, only rank 0 of a data parallel run validates
+        if is_main_process():
+            _init_inception()
+            inception_path = check_or_download_inception(None)
+            create_inception_graph(inception_path)
 
-    if (args.warnings_enabled == False):
-        warnings.filterwarnings("ignore")
+        # set up data_loader
+        self.dataset = datasets.ImageDataset(args)
 
 
-    torch.cuda.manual_seed(args.random_seed)
+class DerivedRun(object):
+    """
+    Networks, optimizers, logging and checkpoints of one derived GAN being
+    trained: freshly initialized, inherited from a parent or resumed from
+    args.load_path.
+    """
+    def __init__(self, args, train_loader):
+        self.args = args
+        self.device = get_device(args)
+
+        # import network
+        if args.lean_gen:
+            self.gen_net = LeanGenerator(args=args).to(self.device)
+        else:
+            self.gen_net = Generator(args=args).to(self.device)
+        self.dis_net = Discriminator(args=args).to(self.device)
+
+        self.gen_net.set_arch(args.arch, cur_stage=2)
+        self.dis_net.cur_stage = 2
+
+        # weight init
+        init_weights(self.gen_net, args.init_type)
+        init_weights(self.dis_net, args.init_type)
 
-    # set tf env
-    _init_inception()
-    inception_path = check_or_download_inception(None)
-    create_inception_graph(inception_path)
-
-    # import network
-    gen_net = Generator(args=args).cuda()
-    dis_net = Discriminator(args=args).cuda()
-
-    gen_net.set_arch(args.arch, cur_stage=2)
-    dis_net.cur_stage = 2
-
-    # weight init
-    def weights_init(m):
-        classname = m.__class__.__name__
-        if classname.find('Conv2d') != -1:
-            if args.init_type == 'normal':
-                nn.init.normal_(m.weight.data, 0.0, 0.02)
-            elif args.init_type == 'orth':
-                nn.init.orthogonal_(m.weight.data)
-            elif args.init_type == 'xavier_uniform':
-                nn.init.xavier_uniform(m.weight.data, 1.)
+        # lamarckian inheritance: start from the parent's weights where the architecture agrees
+        if args.inherit_path and not args.load_path:
+            checkpoint_file = os.path.join(args.inherit_path, 'Model', 'checkpoint.pth')
+            assert os.path.exists(checkpoint_file)
+            assert args.inherit_arch
+            checkpoint = torch.load(checkpoint_file, map_location=self.device)
+            inherited = inherit_weights(self.gen_net, checkpoint['gen_state_dict'], args.inherit_arch, args.arch)
+            self.dis_net.load_state_dict(checkpoint['dis_state_dict'])
+            print(f'=> inherited {len(inherited)} generator modules and the discriminator from {args.inherit_path}')
+            del checkpoint
+
+        # every rank of a data parallel run starts from the weights of rank 0
+        broadcast_module(self.gen_net)
+        broadcast_module(self.dis_net)
+
+        # set optimizer
+        self.gen_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, self.gen_net.parameters()),
+                                              args.g_lr, (args.beta1, args.beta2))
+        self.dis_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, self.dis_net.parameters()),
+                                              args.d_lr, (args.beta1, args.beta2))
+        self.gen_scheduler = LinearLrDecay(self.gen_optimizer, args.g_lr, 0.0, 0, args.max_iter * args.n_critic)
+        self.dis_scheduler = LinearLrDecay(self.dis_optimizer, args.d_lr, 0.0, 0, args.max_iter * args.n_critic)
+
+        # fid stat
+        if (args.calc_fid):
+            if args.dataset.lower() == 'cifar10':
+                self.fid_stat = 'evogan-env/fid_stat/fid_stats_cifar10_train.npz'
+            elif args.dataset.lower() == 'stl10':
+                self.fid_stat = 'evogan-env/fid_stat/stl10_train_unlabeled_fid_stats_48.npz'
             else:
-                raise NotImplementedError('{} unknown inital type'.format(args.init_type))
-        elif classname.find('BatchNorm2d') != -1:
-            nn.init.normal_(m.weight.data, 1.0, 0.02)
-            nn.init.constant_(m.bias.data, 0.0)
-
-    gen_net.apply(weights_init)
-    dis_net.apply(weights_init)
-
-    # set optimizer
-    gen_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, gen_net.parameters()),
-                                     args.g_lr, (args.beta1, args.beta2))
-    dis_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, dis_net.parameters()),
-                                     args.d_lr, (args.beta1, args.beta2))
-    gen_scheduler = LinearLrDecay(gen_optimizer, args.g_lr, 0.0, 0, args.max_iter * args.n_critic)
-    dis_scheduler = LinearLrDecay(dis_optimizer, args.d_lr, 0.0, 0, args.max_iter * args.n_critic)
-
-    # set up data_loader
-    dataset = datasets.ImageDataset(args)
-    train_loader = dataset.train
-
-    # fid stat
-    if (args.calc_fid):
-        if args.dataset.lower() == 'cifar10':
-            fid_stat = 'evogan-env/fid_stat/fid_stats_cifar10_train.npz'
-        elif args.dataset.lower() == 'stl10':
-            fid_stat = 'evogan-env/fid_stat/stl10_train_unlabeled_fid_stats_48.npz'
+                raise NotImplementedError(f'no fid stat for {args.dataset.lower()}')
+            assert os.path.exists(self.fid_stat)
         else:
-            raise NotImplementedError(f'no fid stat for {args.dataset.lower()}')
-        assert os.path.exists(fid_stat)
-    else:
-        fid_stat = None
-
-    # epoch number for dis_net
-    # args.max_epoch = args.max_epoch * args.n_critic
-    #if args.max_iter:
-    #    args.max_epoch = np.ceil(args.max_iter * args.n_critic / len(train_loader))
-
-    # initial
-    fixed_z = torch.cuda.FloatTensor(np.random.normal(0, 1, (25, args.latent_dim)))
-    gen_avg_param = copy_params(gen_net)
-    start_epoch = 0
-    best_inception = 0
-
-    if args.calc_fid:
-        best_fid = 1e4
-    else:
-        best_fid = None
-    
-    # set writer
-    if args.load_path:
-        print(f'=> resuming from {args.load_path}')
-        assert os.path.exists(args.load_path)
-        checkpoint_file = os.path.join(args.load_path, 'Model', 'checkpoint.pth')
-        assert os.path.exists(checkpoint_file)
-        checkpoint = torch.load(checkpoint_file)
-        start_epoch = checkpoint['epoch']
-        best_fid = checkpoint['best_fid']
-        best_inception = checkpoint['best_inception']
-        gen_net.load_state_dict(checkpoint['gen_state_dict'])
-        dis_net.load_state_dict(checkpoint['dis_state_dict'])
-        gen_optimizer.load_state_dict(checkpoint['gen_optimizer'])
-        dis_optimizer.load_state_dict(checkpoint['dis_optimizer'])
-        avg_gen_net = deepcopy(gen_net)
-        avg_gen_net.load_state_dict(checkpoint['avg_gen_state_dict'])
-        gen_avg_param = copy_params(avg_gen_net)
-        del avg_gen_net
+            self.fid_stat = None
 
-        args.path_helper = checkpoint['path_helper']
-        logger = create_logger(args.path_helper['log_path'])
-        logger.info(f'=> loaded checkpoint {checkpoint_file} (epoch {start_epoch})')
-    else:
-        # create new log dir
-        assert args.exp_name
-        args.path_helper = set_log_dir('logs', args.exp_name)
-        logger = create_logger(args.path_helper['log_path'])
-
-    logger.info(args)
-    writer_dict = {
-        'writer': SummaryWriter(args.path_helper['log_path']),
-        'train_global_steps': start_epoch * len(train_loader),
-        'valid_global_steps': start_epoch // args.val_freq,
-    }
+        # epoch number for dis_net
+        # args.max_epoch = args.max_epoch * args.n_critic
+        #if args.max_iter:
+        #    args.max_epoch = np.ceil(args.max_iter * args.n_critic / len(train_loader))
 
-    # train loop
-    for epoch in tqdm(range(int(start_epoch), int(args.max_epoch)), desc='total progress'):
-        lr_schedulers = (gen_scheduler, dis_scheduler) if args.lr_decay else None
-        train(args, gen_net, dis_net, gen_optimizer, dis_optimizer, gen_avg_param, train_loader, epoch, writer_dict,
-              lr_schedulers)
+        # initial
+        self.fixed_z = torch.tensor(np.random.normal(0, 1, (25, args.latent_dim)), dtype=torch.float,
+                                    device=self.device)
+        self.gen_avg_param = copy_params(self.gen_net)
+        self.start_epoch = 0
+        self.best_inception = 0
 
+        if args.calc_fid:
+            self.best_fid = 1e4
+        else:
+            self.best_fid = None
+
+        # set writer, a resumed run gets its own log dir so that the checkpoint
+        # it resumes from still matches the epoch budget it was trained for
+        if is_main_process():
+            # create new log dir
+            assert args.exp_name
+            args.path_helper = set_log_dir('logs', args.exp_name)
+            self.logger = create_logger(args.path_helper['log_path'])
+        else:
+            # only rank 0 of a data parallel run writes logs and checkpoints
+            args.path_helper = None
+            self.logger = logging.getLogger()
+
+        if args.load_path:
+            print(f'=> resuming from {args.load_path}')
+            assert os.path.exists(args.load_path)
+            checkpoint_file = os.path.join(args.load_path, 'Model', 'checkpoint.pth')
+            assert os.path.exists(checkpoint_file)
+            checkpoint = torch.load(checkpoint_file, map_location=self.device)
+            self.start_epoch = checkpoint['epoch']
+            self.best_fid = checkpoint['best_fid']
+            self.best_inception = checkpoint['best_inception']
+            load_generator_state_dict(self.gen_net, checkpoint['gen_state_dict'])
+            self.dis_net.load_state_dict(checkpoint['dis_state_dict'])
+            # the generator optimizer state only fits a generator of the same kind
+            if checkpoint.get('lean_gen', False) == args.lean_gen:
+                self.gen_optimizer.load_state_dict(checkpoint['gen_optimizer'])
+            else:
+                print('=> generator optimizer state not restored, the checkpoint generator is of another kind')
+            self.dis_optimizer.load_state_dict(checkpoint['dis_optimizer'])
+            avg_gen_net = deepcopy(self.gen_net)
+            load_generator_state_dict(avg_gen_net, checkpoint['avg_gen_state_dict'])
+            self.gen_avg_param = copy_params(avg_gen_net)
+            del avg_gen_net
+
+            if is_main_process():
+                shutil.copytree(os.path.join(args.load_path, 'Model'), args.path_helper['ckpt_path'],
+                                dirs_exist_ok=True)
+            self.logger.info(f'=> loaded checkpoint {checkpoint_file} (epoch {self.start_epoch})')
+
+        # compiled once every weight is loaded, the architecture does not change from here
+        self.gen_net = compile_model(self.gen_net, args.compile_mode)
+        self.dis_net = compile_model(self.dis_net, args.compile_mode)
+
+        self.logger.info(args)
+        self.writer_dict = {
+            'writer': SummaryWriter(args.path_helper['log_path']) if is_main_process() else NullWriter(),
+            'train_global_steps': self.start_epoch * len(train_loader),
+            'valid_global_steps': self.start_epoch // args.val_freq,
+        }
+
+        if args.early_stop_threshold is not None:
+            assert not args.distributed, 'early stopping is not supported in data parallel training'
+            self.monitor = EarlyStopMonitor(args, int(args.max_epoch) * len(train_loader))
+        else:
+            self.monitor = None
+
+    def lr_schedulers(self):
+        return (self.gen_scheduler, self.dis_scheduler) if self.args.lr_decay else None
+
+    def end_epoch(self, epoch):
+        """
+        Validate when due and save the checkpoint of a trained epoch, on rank 0 only
+        """
+        if not is_main_process():
+            return
+        args = self.args
         if epoch and epoch % args.val_freq == 0 or epoch == int(args.max_epoch)-1:
-            backup_param = copy_params(gen_net)
-            load_params(gen_net, gen_avg_param)
-            inception_score, fid_score = validate(args, fixed_z, fid_stat, gen_net, writer_dict)
-            logger.info(f'Inception score: {inception_score}, FID score: {fid_score} || @ epoch {epoch}.')
-            load_params(gen_net, backup_param)
+            backup_param = copy_params(self.gen_net)
+            load_params(self.gen_net, self.gen_avg_param)
+            inception_score, fid_score = validate(args, self.fixed_z, self.fid_stat, self.gen_net, self.writer_dict)
+            self.logger.info(f'Inception score: {inception_score}, FID score: {fid_score} || @ epoch {epoch}.')
+            load_params(self.gen_net, backup_param)
             if (args.calc_fid):
-                if fid_score < best_fid:
-                    best_fid = fid_score
+                if fid_score < self.best_fid:
+                    self.best_fid = fid_score
                     is_best = True
                 else:
                     is_best = False
             else:
-                if inception_score > best_inception:
-                    best_inception = inception_score
+                if inception_score > self.best_inception:
+                    self.best_inception = inception_score
                     is_best = True
                 else:
-                    is_best = False   
+                    is_best = False
         else:
             is_best = False
 
-        avg_gen_net = deepcopy(gen_net)
-        load_params(avg_gen_net, gen_avg_param)
+        avg_gen_net = deepcopy(self.gen_net)
+        load_params(avg_gen_net, self.gen_avg_param)
         save_checkpoint({
             'epoch': epoch + 1,
             'gen_model': args.gen_model,
+            'lean_gen': args.lean_gen,
             'dis_model': args.dis_model,
-            'gen_state_dict': gen_net.state_dict(),
-            'dis_state_dict': dis_net.state_dict(),
+            'gen_state_dict': self.gen_net.state_dict(),
+            'dis_state_dict': self.dis_net.state_dict(),
             'avg_gen_state_dict': avg_gen_net.state_dict(),
-            'gen_optimizer': gen_optimizer.state_dict(),
-            'dis_optimizer': dis_optimizer.state_dict(),
-            'best_fid': best_fid,
-            'best_inception': best_inception,
+            'gen_optimizer': self.gen_optimizer.state_dict(),
+            'dis_optimizer': self.dis_optimizer.state_dict(),
+            'best_fid': self.best_fid,
+            'best_inception': self.best_inception,
             'path_helper': args.path_helper
         }, is_best, args.path_helper['ckpt_path'])
         del avg_gen_net
-        
-    return best_inception
 
+    def close(self):
+        self.writer_dict['writer'].close()
+
+
+def train_derived(args, context=None):
+
+    if (args.warnings_enabled == False):
+        warnings.filterwarnings("ignore")
+
+
+    torch.cuda.manual_seed(args.random_seed)
+
+    # with args.distributed, the batch sizes are per rank from here
+    init_distributed(args)
+
+    # networks and optimizers are rebuilt for every call, only the context is reused
+    if context is None:
+        context = TrainingContext(args)
+
+    train_loader = context.dataset.train
+    run = DerivedRun(args, train_loader)
+
+    # train loop
+    for epoch in tqdm(range(int(run.start_epoch), int(args.max_epoch)), desc='total progress'):
+        if context.dataset.train_sampler is not None:
+            context.dataset.train_sampler.set_epoch(epoch)
+        try:
+            train(args, run.gen_net, run.dis_net, run.gen_optimizer, run.dis_optimizer, run.gen_avg_param,
+                  train_loader, epoch, run.writer_dict, run.lr_schedulers(), run.monitor)
+        except EarlyTermination as e:
+            run.logger.info(f'=> early termination: {e}')
+            run.close()
+            # the caller decides what a predicted score is worth
+            raise
+        run.end_epoch(epoch)
+
+    run.close()
+    if args.distributed:
+        cleanup_distributed()
+    return run.best_inception
+
+
+def train_derived_lockstep(args_list, context=None):
+    """
+    Train several derived GANs in one process, in lockstep on the same real
+    minibatches, and return their best inception scores in order. They share
+    the data pipeline and the inception graphs. args_list only differ in the
+    architecture and in the inheritance and resume options.
+    """
+    args = args_list[0]
+    if (args.warnings_enabled == False):
+        warnings.filterwarnings("ignore")
+
+    torch.cuda.manual_seed(args.random_seed)
+
+    if context is None:
+        context = TrainingContext(args)
+
+    train_loader = context.dataset.train
+    runs = []
+    for idx, run_args in enumerate(args_list):
+        assert run_args.early_stop_threshold is None, 'early stopping is not supported in lockstep training'
+        assert run_args.max_epoch == args.max_epoch
+        assert not run_args.distributed, 'lockstep runs are trained in a single process'
+        init_distributed(run_args)
+        # experiment directories are named after the time, keep them apart
+        run_args.exp_name = f'{run_args.exp_name}_{idx}'
+        runs.append(DerivedRun(run_args, train_loader))
+    start_epoch = runs[0].start_epoch
+    assert all(run.start_epoch == start_epoch for run in runs), 'lockstep runs must resume from the same epoch'
+
+    for epoch in tqdm(range(int(start_epoch), int(args.max_epoch)), desc='total progress'):
+        train_lockstep(args, [run.gen_net for run in runs], [run.dis_net for run in runs],
+                       [run.gen_optimizer for run in runs], [run.dis_optimizer for run in runs],
+                       [run.gen_avg_param for run in runs], train_loader, epoch,
+                       [run.writer_dict for run in runs], [run.lr_schedulers() for run in runs],
+                       args.stack_discriminators)
+        for run in runs:
+            run.end_epoch(epoch)
+
+    for run in runs:
+        run.close()
+    return [run.best_inception for run in runs]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import torch
+from torch.nn.utils.spectral_norm import SpectralNorm
+
+COMPILE_MODES = ('eager', 'compile')
+
+
+def compile_model(net, mode='eager'):
+    """
+    Compile a model whose architecture is fixed. Compilation is in place,
+    so the parameters, state dict and attributes of net are unchanged.
+    Without nn.Module.compile (torch < 2.2) the model runs eager, and a
+    compiled model falls back to eager on any graph the compiler fails on.
+    Spectral normalized models stay eager: the power iteration updates its
+    buffers in place on every call, which breaks the backward of compiled
+    graphs when the model runs twice before it, as the discriminator does.
+    """
+    if mode == 'eager':
+        return net
+    if mode != 'compile':
+        raise NotImplementedError('{} unknown compile mode'.format(mode))
+    if not hasattr(net, 'compile'):
+        warnings.warn(f'torch {torch.__version__} cannot compile modules, running eager')
+        return net
+    if has_spectral_norm(net):
+        warnings.warn(f'{type(net).__name__} uses spectral normalization, running eager')
+        return net
+    import torch._dynamo
+    torch._dynamo.config.suppress_errors = True
+    net.compile()
+    return net
+
+
+def has_spectral_norm(net):
+    return any(isinstance(hook, SpectralNorm) for m in net.modules() for hook in m._forward_pre_hooks.values())
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Data parallel training of one derived GAN over processes, with the gloo backend.
+import os
+from datetime import timedelta
+
+import torch
+import torch.distributed as dist
+
+# rank 0 validates with the inception graph while the other ranks wait for it
+PROCESS_GROUP_TIMEOUT = timedelta(hours=4)
+
+
+def init_distributed(args):
+    """
+    Join the process group described by the torchrun environment variables
+    (RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR, MASTER_PORT) when
+    args.distributed, and set args.rank, args.local_rank and args.world_size.
+    The batch sizes are divided among the ranks, so that a step of all ranks
+    sees the minibatch a single process would.
+    """
+    if not args.distributed:
+        args.rank, args.local_rank, args.world_size = 0, 0, 1
+        return
+    if not dist.is_initialized():
+        dist.init_process_group('gloo', init_method='env://', timeout=PROCESS_GROUP_TIMEOUT)
+    args.rank = dist.get_rank()
+    args.local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    args.world_size = dist.get_world_size()
+    assert args.dis_batch_size % args.world_size == 0 and args.gen_batch_size % args.world_size == 0, \
+        f'batch sizes {args.dis_batch_size} and {args.gen_batch_size} do not split over {args.world_size} ranks'
+    args.dis_batch_size //= args.world_size
+    args.gen_batch_size //= args.world_size
+
+
+def cleanup_distributed():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def is_main_process():
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+
+def get_device(args):
+    """
+    The GPU of the local rank when there is one, the CPU otherwise
+    """
+    if torch.cuda.is_available():
+        return torch.device('cuda', args.local_rank % torch.cuda.device_count())
+    return torch.device('cpu')
+
+
+def broadcast_module(module):
+    """
+    Copy the parameters and buffers of rank 0 to every rank
+    """
+    if not dist.is_initialized():
+        return
+    with torch.no_grad():
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            dist.broadcast(tensor.data, 0)
+
+
+def all_reduce_grads(module):
+    """
+    Average the gradients of module over the ranks, in a single all-reduce.
+    Every rank trains the same architecture, so the same parameters have a gradient.
+    """
+    if not dist.is_initialized() or dist.get_world_size() == 1:
+        return
+    grads = [p.grad for p in module.parameters() if p.grad is not None]
+    if not grads:
+        return
+    flat = torch.cat([grad.reshape(-1) for grad in grads])
+    dist.all_reduce(flat)
+    flat /= dist.get_world_size()
+    offset = 0
+    for grad in grads:
+        grad.copy_(flat[offset:offset + grad.numel()].view_as(grad))
+        offset += grad.numel()
+
+
+class NullWriter(object):
+    """
+    Stands in for the SummaryWriter on the ranks that do not log
+    """
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
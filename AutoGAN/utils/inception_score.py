@@ -61,6 +61,9 @@ def get_inception_score(images, splits=10):
 # This function is called automatically.
 def _init_inception():
     global softmax
+    if softmax is not None:
+        # already initialized in this process
+        return
     if not os.path.exists(MODEL_DIR):
         os.makedirs(MODEL_DIR)
     filename = DATA_URL.split('/')[-1]
@@ -75,7 +78,8 @@ def _init_inception():
         print()
         statinfo = os.stat(filepath)
         print('Succesfully downloaded', filename, statinfo.st_size, 'bytes.')
-    tarfile.open(filepath, 'r:gz').extractall(MODEL_DIR)
+    if not os.path.exists(os.path.join(MODEL_DIR, 'classify_image_graph_def.pb')):
+        tarfile.open(filepath, 'r:gz').extractall(MODEL_DIR)
     with tf.gfile.FastGFile(os.path.join(
             MODEL_DIR, 'classify_image_graph_def.pb'), 'rb') as f:
         graph_def = tf.GraphDef()
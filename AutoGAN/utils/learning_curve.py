@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Learning curve extrapolation used to stop hopeless runs early.
+
+import logging
+import math
+
+import numpy as np
+import torch
+
+from ..functions import get_is, load_params, copy_params
+
+logger = logging.getLogger(__name__)
+
+
+class EarlyTermination(Exception):
+    def __init__(self, step, predicted_score):
+        super(EarlyTermination, self).__init__(
+            'stopped at step {} with predicted final score {:.4f}'.format(step, predicted_score))
+        self.step = step
+        self.predicted_score = predicted_score
+
+
+class LearningCurve(object):
+    """
+    Inception score as a function of training steps, fitted as
+    score = a + b * log(step). The logarithm keeps growing, so the
+    extrapolation is optimistic for saturating runs and errs on the
+    side of not stopping them.
+    """
+    def __init__(self):
+        self.steps = []
+        self.scores = []
+
+    def add(self, step, score):
+        self.steps.append(step)
+        self.scores.append(score)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def predict(self, step):
+        """
+        :return: mean and standard deviation of the predicted score at step
+        """
+        x = np.log(np.asarray(self.steps, dtype=np.float64))
+        y = np.asarray(self.scores, dtype=np.float64)
+        design = np.stack([np.ones_like(x), x], axis=1)
+        coef, _, _, _ = np.linalg.lstsq(design, y, rcond=None)
+        x_new = np.array([1.0, math.log(step)])
+        mean = float(x_new @ coef)
+        dof = len(x) - 2
+        if dof <= 0:
+            return mean, float('inf')
+        sigma2 = float(np.sum((y - design @ coef) ** 2)) / dof
+        # standard error of the prediction for a new observation
+        var = sigma2 * (1.0 + x_new @ np.linalg.pinv(design.T @ design) @ x_new)
+        return mean, math.sqrt(max(var, 0.0))
+
+
+class EarlyStopMonitor(object):
+    """
+    Scores the moving average generator every freq steps on a few images and
+    raises EarlyTermination once the extrapolated final score is confidently
+    below threshold: mean + confidence * std < threshold.
+    """
+    def __init__(self, args, final_step):
+        self.threshold = args.early_stop_threshold
+        self.freq = args.early_stop_freq
+        self.num_imgs = args.early_stop_num_imgs
+        self.min_points = args.early_stop_min_points
+        self.confidence = args.early_stop_confidence
+        self.final_step = final_step
+        self.args = args
+        self.curve = LearningCurve()
+
+    def __call__(self, step, gen_net, gen_avg_param):
+        if step == 0 or step % self.freq != 0:
+            return
+        backup_param = copy_params(gen_net)
+        load_params(gen_net, gen_avg_param)
+        # probes are not trained on, no graph is needed for sampling
+        with torch.no_grad():
+            score = get_is(self.args, gen_net, self.num_imgs)
+        load_params(gen_net, backup_param)
+        gen_net.train()
+
+        self.curve.add(step, score)
+        if len(self.curve) < self.min_points:
+            return
+        mean, std = self.curve.predict(self.final_step)
+        logger.info(f'step {step}: IS {score:.4f}, predicted final IS {mean:.4f} +- {std:.4f}')
+        if mean + self.confidence * std < self.threshold:
+            raise EarlyTermination(step, mean)
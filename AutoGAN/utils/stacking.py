@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+
+import torch
+
+try:
+    from torch.func import functional_call, stack_module_state, vmap
+except ImportError:
+    functional_call = stack_module_state = vmap = None
+
+
+def can_stack(modules):
+    """
+    Whether modules can run as one vmapped module: torch.func is available,
+    they have the same parameters and buffers, and no forward hook, such as
+    spectral normalization's, updates their state in place
+    """
+    if vmap is None or len(modules) < 2:
+        return False
+    shapes = [[(name, tuple(t.shape)) for name, t in m.state_dict().items()] for m in modules]
+    if any(s != shapes[0] for s in shapes):
+        return False
+    return not any(sub._forward_pre_hooks or sub._forward_hooks for m in modules for sub in m.modules())
+
+
+class StackedModules(object):
+    """
+    Structurally identical modules run as a single vmapped module, so that
+    each layer is one batched operation over all of them.
+
+    Parameters are stacked along a new first dimension by stack() and the
+    gradients of the stacked parameters are handed back to the parameters
+    of every module by scatter_grads(), so optimizers, moving averages and
+    checkpoints keep working on the individual modules.
+    """
+    def __init__(self, modules):
+        self.modules = list(modules)
+        self.base = deepcopy(self.modules[0]).to('meta')
+        self.params, self.buffers = None, None
+
+        def call(params, buffers, x):
+            return functional_call(self.base, (params, buffers), (x,))
+        self._shared = vmap(call, in_dims=(0, 0, None))
+        self._batched = vmap(call, in_dims=(0, 0, 0))
+
+    def stack(self):
+        """
+        Restack the current parameters of the modules, after they were updated
+        """
+        self.params, self.buffers = stack_module_state(self.modules)
+
+    def __call__(self, x, shared=False):
+        """
+        Run module k on x[k], or every module on x when shared
+        """
+        if self.params is None:
+            self.stack()
+        return (self._shared if shared else self._batched)(self.params, self.buffers, x)
+
+    def scatter_grads(self):
+        """
+        Add the gradients of the stacked parameters to the parameters of the modules
+        """
+        for name, stacked in self.params.items():
+            if stacked.grad is None:
+                continue
+            for module, grad in zip(self.modules, stacked.grad.unbind(0)):
+                p = module.get_parameter(name)
+                p.grad = grad.clone() if p.grad is None else p.grad + grad
@@ -24,8 +24,10 @@ def create_logger(log_dir, phase='train'):
                         format=head)
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    console = logging.StreamHandler()
-    logging.getLogger('').addHandler(console)
+    # avoid duplicated console output when called again in the same process
+    if not any(type(h) is logging.StreamHandler for h in logger.handlers):
+        console = logging.StreamHandler()
+        logger.addHandler(console)
 
     return logger
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+""" Per iteration cost of derived GAN training on the CPU, eager against torch.compile.
+
+    An iteration is what train in AutoGAN/functions.py does for one
+    minibatch with n_critic 1: a hinge loss discriminator step, a generator
+    step and the moving average of the generator weights. The generator is
+    either the shared_gan supernet switched to the architecture or its
+    LeanGenerator. Sampling a batch in eval mode, as validate does, is
+    timed separately. The first iteration, which includes compilation,
+    is reported on its own.
+
+    Usage: python benchmarks/compile_bench.py [--arch 0 1 0 ...] [--iters 20]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from AutoGAN.models_search.shared_gan import Generator, Discriminator, init_weights
+from AutoGAN.models_search.lean_gan import LeanGenerator
+from AutoGAN.utils.compilation import compile_model, COMPILE_MODES
+from evolution.population import Population
+from evolution.search_space import arch_from_serial
+
+
+def build(args, lean, mode):
+    torch.manual_seed(args.seed)
+    if lean:
+        gen_net = LeanGenerator(args=args)
+    else:
+        gen_net = Generator(args=args)
+        gen_net.set_arch(args.arch, cur_stage=2)
+    dis_net = Discriminator(args=args)
+    dis_net.cur_stage = 2
+    init_weights(gen_net, 'xavier_uniform')
+    init_weights(dis_net, 'xavier_uniform')
+    gen_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, gen_net.parameters()), 2e-4, (0.0, 0.9))
+    dis_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, dis_net.parameters()), 2e-4, (0.0, 0.9))
+    gen_avg_param = [p.detach().clone() for p in gen_net.parameters()]
+    return (compile_model(gen_net, mode), compile_model(dis_net, mode), gen_optimizer, dis_optimizer, gen_avg_param)
+
+
+def train_iteration(args, gen_net, dis_net, gen_optimizer, dis_optimizer, gen_avg_param, real_imgs):
+    z = torch.randn(args.batch_size, args.latent_dim)
+    dis_optimizer.zero_grad()
+    real_validity = dis_net(real_imgs)
+    fake_validity = dis_net(gen_net(z).detach())
+    d_loss = torch.mean(F.relu(1.0 - real_validity)) + torch.mean(F.relu(1 + fake_validity))
+    d_loss.backward()
+    dis_optimizer.step()
+
+    gen_optimizer.zero_grad()
+    gen_z = torch.randn(args.batch_size, args.latent_dim)
+    g_loss = -torch.mean(dis_net(gen_net(gen_z)))
+    g_loss.backward()
+    gen_optimizer.step()
+
+    with torch.no_grad():
+        for p, avg_p in zip(gen_net.parameters(), gen_avg_param):
+            avg_p.mul_(0.999).add_(p, alpha=0.001)
+
+
+def sample(args, gen_net):
+    gen_net.eval()
+    with torch.no_grad():
+        gen_net(torch.randn(args.batch_size, args.latent_dim))
+    gen_net.train()
+
+
+def timed(fn, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--arch', nargs='+', type=int, default=None,
+                        help='architecture vector, a random one by default')
+    parser.add_argument('--gf_dim', type=int, default=64)
+    parser.add_argument('--df_dim', type=int, default=64)
+    parser.add_argument('--bottom_width', type=int, default=4)
+    parser.add_argument('--latent_dim', type=int, default=128)
+    parser.add_argument('--d_spectral_norm', type=int, default=1)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--iters', type=int, default=20, help='timed iterations per configuration')
+    parser.add_argument('--warmup', type=int, default=3, help='iterations run before timing, after the first one')
+    parser.add_argument('--modes', nargs='+', default=list(COMPILE_MODES), choices=COMPILE_MODES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    if args.arch is None:
+        args.arch = arch_from_serial(Population.gen_random(1, rng=np.random.RandomState(args.seed)).genomes[0].tolist())
+    real_imgs = torch.rand(args.batch_size, 3, args.bottom_width * 8, args.bottom_width * 8) * 2 - 1
+    print(f"arch {args.arch}, gf_dim {args.gf_dim}, df_dim {args.df_dim}, batch {args.batch_size}, "
+          f"{torch.get_num_threads()} threads, torch {torch.__version__}")
+    print(f"{'generator':<10}{'mode':<9}{'first it (s)':>13}{'train (ms/it)':>15}{'sample (ms)':>13}{'speedup':>9}")
+
+    baseline = None
+    for lean in (False, True):
+        for mode in args.modes:
+            nets = build(args, lean, mode)
+            iteration = lambda: train_iteration(args, *nets, real_imgs)
+            first = timed(iteration, 1)[0] + timed(lambda: sample(args, nets[0]), 1)[0]
+            timed(iteration, args.warmup)
+            train_ms = float(np.median(timed(iteration, args.iters))) * 1e3
+            sample_ms = float(np.median(timed(lambda: sample(args, nets[0]), args.iters))) * 1e3
+            baseline = baseline or train_ms
+            print(f"{'lean' if lean else 'supernet':<10}{mode:<9}{first:>13.1f}{train_ms:>15.1f}{sample_ms:>13.1f}"
+                  f"{baseline / train_ms:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+""" Microbenchmark of the genome operations used by evo_train.
+
+    Compares the slotted genome classes against the previous
+    dataclass implementation (reproduced below with the legacy_ prefix),
+    and reports the per genome cost of the vectorized Population.
+
+    Usage: python benchmarks/genome_bench.py [--number 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+from dataclasses import fields, astuple, asdict
+from random import choice, uniform
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from evolution.dna import DNA
+from evolution.cell_dna import DNAProperties
+from evolution.population import Population
+from evolution.history import GenomeHistory
+
+
+def legacy_from_serial(cls, s):
+    field_list = fields(cls)
+    params = []
+    for idx, f in enumerate(field_list):
+        params.append(f.type[list(f.type.__members__)[s[idx]]])
+    return cls(*params)
+
+def legacy_gen_random(cls, history):
+    params = []
+    for f in fields(cls):
+        params.append(f.type[choice(list(f.type.__members__))])
+    parameters = cls(*params)
+    history.append(asdict(parameters))
+    return parameters
+
+def legacy_get_field_options(cls, field_idx):
+    return list(fields(cls)[field_idx].type)
+
+def legacy_serialize(parameters):
+    return [v.value for v in astuple(parameters)]
+
+def legacy_mutate(parameters, mutation_probability, history):
+    current_parameters = asdict(parameters)
+    new_parameters = asdict(parameters)
+    for idx, (k, p) in enumerate(current_parameters.items()):
+        rand = uniform(0, 1)
+        possible_choices = legacy_get_field_options(type(parameters), idx)
+        possible_choices.remove(p.value)
+        if (rand < mutation_probability):
+            new_parameters[k] = choice(possible_choices)
+    parameters = legacy_from_serial(type(parameters), list(new_parameters.values()))
+    history.append(asdict(parameters))
+    return parameters
+
+def legacy_evolve(parameters, evolution_matrix, history):
+    current_parameters = legacy_serialize(parameters)
+    for idx, p in enumerate(current_parameters):
+        possible_choices = legacy_get_field_options(type(parameters), idx)
+        current_parameters[idx] = np.random.choice(possible_choices, p=evolution_matrix[idx])
+    parameters = legacy_from_serial(type(parameters), current_parameters)
+    history.append(asdict(parameters))
+    return parameters
+
+def fold_skip(values):
+    skip = values[len(values)-2:]
+    return values[:len(values)-2] + [skip[0] * 2 + skip[1]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000, help='calls per measurement')
+    args = parser.parse_args()
+
+    properties = DNAProperties(mutation_probability=0.1)
+    genome_history = GenomeHistory()
+    dna = DNA.gen_random(history=genome_history)
+    dna.set_properties(properties)
+    param_types = [type(c.parameters) for c in dna.cells]
+    cells = [c.parameters for c in dna.cells]
+    evo_matrix = Population.gen_random(64).evolution_matrix(np.zeros(64))
+    cell_matrices = []
+    position = 0
+    for t in param_types:
+        cell_matrices.append(evo_matrix[position:position + t.parameter_count()])
+        position += t.parameter_count()
+
+    # Both paths record the genome history: the legacy path as per cell
+    # parameter dicts, the current one in the columnar GenomeHistory
+    history = []
+    cases = [
+        ('gen_random',
+         lambda: [legacy_gen_random(t, history) for t in param_types],
+         lambda: DNA.gen_random(history=genome_history)),
+        ('mutate',
+         lambda: [legacy_mutate(p, 0.1, history) for p in cells],
+         lambda: dna.mutate()),
+        ('evolve',
+         lambda: [legacy_evolve(p, m, history) for p, m in zip(cells, cell_matrices)],
+         lambda: dna.evolve(evo_matrix)),
+        ('serialize',
+         lambda: sum((legacy_serialize(p) for p in cells), []),
+         lambda: dna.serialize()),
+        ('to_arch',
+         lambda: fold_skip(sum((legacy_serialize(p) for p in cells), [])),
+         lambda: fold_skip(dna.serialize())),
+    ]
+
+    print(f"{'operation':<12}{'dataclass us':>14}{'slotted us':>12}{'speedup':>10}")
+    for name, legacy, current in cases:
+        history.clear()
+        t_legacy = timeit.timeit(legacy, number=args.number) / args.number * 1e6
+        t_current = timeit.timeit(current, number=args.number) / args.number * 1e6
+        print(f"{name:<12}{t_legacy:>14.2f}{t_current:>12.2f}{t_legacy / t_current:>9.1f}x")
+
+    n_genomes = 10000
+    population = Population.gen_random(n_genomes)
+    scores = np.random.rand(n_genomes)
+    t_pop = timeit.timeit(lambda: (population.evolve(evo_matrix), population.mutate(0.1),
+                                   population.evolution_matrix(scores)), number=10) / 10
+    print(f"Population of {n_genomes}: evolve + mutate + evolution_matrix "
+          f"{t_pop * 1e3:.2f} ms ({t_pop / n_genomes * 1e6:.3f} us per genome)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+""" Build the per op cost lookup table of the generator search space.
+
+    Every searchable choice of AutoGAN/models_search/building_blocks_search.py
+    is run once on this machine, in isolation, for the given channels,
+    resolution and batch size. Its median latency, FLOPs, layer output memory
+    and parameters are stored in a table that evolution.cost_table.CostTable
+    uses to estimate the cost of any architecture without building it.
+    A few random architectures are then built in full to check the estimates.
+
+    Usage: python benchmarks/op_cost_table.py [--output op_costs.json] [--batch_size 1]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from AutoGAN.models_search.shared_gan import Generator
+from AutoGAN.models_search.building_blocks_search import UP_TYPE
+from evolution.cost_table import (CostTable, CELL_SKIP_INPUTS, FIXED_KEY, N_CONV, N_NORM, N_UP,
+                                  conv_key, shortcut_key, skip_key)
+from evolution.population import Population
+from evolution.search_space import arch_from_serial
+
+
+def layer_flops(module, inputs, output):
+    """ Multiply-adds counted twice, for the layers that dominate the cost """
+    if isinstance(module, nn.Conv2d):
+        kh, kw = module.kernel_size
+        return 2 * output.numel() * (module.in_channels // module.groups) * kh * kw
+    if isinstance(module, nn.ConvTranspose2d):
+        kh, kw = module.kernel_size
+        return 2 * inputs[0].numel() * (module.out_channels // module.groups) * kh * kw
+    if isinstance(module, nn.Linear):
+        return 2 * output.numel() * module.in_features
+    if isinstance(module, (nn.BatchNorm2d, nn.InstanceNorm2d)):
+        return 2 * output.numel()
+    return 0
+
+
+def profile(fn, n_repeats, modules, device):
+    """ Median latency in microseconds, then FLOPs, layer output bytes
+        and parameters of the layers among modules that fn runs on device
+    """
+    calls = []
+    hooks = [m.register_forward_hook(lambda m, i, o: calls.append((m, i, o)))
+             for m in modules if not list(m.children())]
+    with torch.no_grad():
+        fn()
+    for hook in hooks:
+        hook.remove()
+    flops = sum(layer_flops(m, i, o) for m, i, o in calls)
+    activation_bytes = sum(o.numel() * o.element_size() for _, _, o in calls)
+    params = sum(p.numel() for m in {id(m): m for m, _, _ in calls}.values() for p in m.parameters(recurse=False))
+
+    times = []
+    with torch.no_grad():
+        fn()
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            times.append(time.perf_counter() - start)
+    return [float(np.median(times)) * 1e6, float(flops), float(activation_bytes), float(params)]
+
+
+def measure_ops(gen, args, device):
+    def features(res):
+        return torch.randn(args.batch_size, args.gf_dim, res, res, device=device)
+
+    modules = list(gen.modules())
+    cells = [gen.cell1, gen.cell2, gen.cell3]
+    out_res = [args.bottom_width * 2 ** (c + 1) for c in range(len(cells))]
+    ops = {}
+
+    z = torch.randn(args.batch_size, args.latent_dim, device=device)
+    final = features(out_res[-1])
+    ops[FIXED_KEY] = profile(lambda: (gen.l1(z), gen.to_rgb(final)), args.n_repeats, modules, device)
+
+    for c, cell in enumerate(cells):
+        x = features(args.bottom_width * 2 ** c)
+        for conv in range(N_CONV):
+            first, second = (cell.pre_conv1, cell.pre_conv2) if conv else (cell.post_conv1, cell.post_conv2)
+            for norm in range(N_NORM):
+                for up in range(N_UP):
+                    first.set_arch(up, norm)
+                    second.set_arch(up, norm)
+                    ops[conv_key(c, conv, norm, up)] = profile(lambda: second(first(x)), args.n_repeats,
+                                                               modules, device)
+
+        for up in range(N_UP):
+            if UP_TYPE[up] == 'deconv':
+                shortcut = lambda: cell.c_sc(cell.deconv_sc(x))
+            else:
+                shortcut = lambda: cell.c_sc(F.interpolate(x, scale_factor=2, mode=UP_TYPE[up]))
+            ops[shortcut_key(c, up)] = profile(shortcut, args.n_repeats, modules, device)
+
+            for i in range(CELL_SKIP_INPUTS[c]):
+                # skip input i is the output of the first conv block of cell i
+                ft = features(out_res[i])
+                ht = out_res[c]
+                if UP_TYPE[up] == 'deconv':
+                    upsample = getattr(cell, f'skip_deconvx{ht // out_res[i]}')
+                    skip = lambda: cell.skip_in_ops[i](upsample(ft))
+                else:
+                    skip = lambda: cell.skip_in_ops[i](F.interpolate(ft, size=(ht, ht), mode=UP_TYPE[up]))
+                ops[skip_key(c, i, up)] = profile(skip, args.n_repeats, modules, device)
+    return ops
+
+
+def check_estimates(gen, table, args, device):
+    """ Compare the estimated and measured latency of full generators """
+    modules = list(gen.modules())
+    archs = [arch_from_serial(g) for g in Population.gen_random(args.n_check).genomes.tolist()]
+    z = torch.randn(args.batch_size, args.latent_dim, device=device)
+    estimates = table.estimate_many(np.array(archs))[:, 0]
+    errors = []
+    for arch, estimate in zip(archs, estimates):
+        gen.set_arch(arch, cur_stage=2)
+        measured = profile(lambda: gen(z), args.n_repeats, modules, device)[0]
+        errors.append(abs(estimate - measured) / measured)
+        print(f"{arch}: estimated {estimate:.0f} us, measured {measured:.0f} us")
+    print(f"mean absolute latency error {np.mean(errors) * 100:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default='op_costs.json', help='file the cost table is written to')
+    parser.add_argument('--gf_dim', type=int, default=256)
+    parser.add_argument('--bottom_width', type=int, default=4)
+    parser.add_argument('--latent_dim', type=int, default=128)
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--n_repeats', type=int, default=20, help='timed runs per op')
+    parser.add_argument('--n_check', type=int, default=5, help='random architectures to check the estimates on')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    gen = Generator(args=args).to(device).eval()
+
+    setup = {
+        'gf_dim': args.gf_dim,
+        'bottom_width': args.bottom_width,
+        'latent_dim': args.latent_dim,
+        'batch_size': args.batch_size,
+        'device': args.device,
+        'threads': torch.get_num_threads(),
+        'torch': torch.__version__,
+    }
+    table = CostTable(measure_ops(gen, args, device), setup)
+    table.save(args.output)
+    print(f"Wrote {len(table.ops)} op costs to {args.output}")
+    if args.n_check:
+        check_estimates(gen, table, args, device)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+""" CPU core placement of worker processes. Kept free of the training
+    stack so that processes not training GANs can import it.
+"""
+import os
+import multiprocessing
+
+from typing import List, Sequence
+
+
+def available_cores() -> List[int]:
+    """ CPU cores this process is allowed to run on """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+def split_cores(cores: Sequence[int], n_workers: int) -> List[List[int]]:
+    """ Split cores into n_workers contiguous, near equal subsets.
+        Workers share cores round robin when there are fewer cores than workers.
+    """
+    if len(cores) < n_workers:
+        return [[cores[i % len(cores)]] for i in range(n_workers)]
+    subsets = []
+    start = 0
+    for i in range(n_workers):
+        size = len(cores) // n_workers + (1 if i < len(cores) % n_workers else 0)
+        subsets.append(list(cores[start:start + size]))
+        start += size
+    return subsets
+
+def pin_process(cores: List[int], n_threads: int) -> None:
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(n_threads)
+    os.environ["MKL_NUM_THREADS"] = str(n_threads)
+    import torch
+    torch.set_num_threads(n_threads)
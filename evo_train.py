@@ -2,19 +2,40 @@
 
 import os
 import sys
+import argparse
 
 import multiprocessing
+from functools import partial
 import numpy as np
 import logging
-from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED
 
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 from evolution.dna import DNA
 from evolution.cell_dna import DNAProperties
-from gan_train import train_gan
+from evolution.fitness_cache import FitnessCache
+from evolution.population import Population
+from evolution.search_space import arch_from_serial
+from evolution.canonical import equivalence_classes
+from evolution.surrogate import SurrogateModel
+from evolution.archive import CheckpointArchive
+from evolution.snapshot import save_snapshot, load_snapshot
+from evolution.history import GenomeHistory, NO_PARENT
+from evolution.pareto import ParetoArchive
+from evolution.cost_table import CostTable
+from evolution.proxy_table import ProxyTable
+from gan_train import train_gan, training_config, measure_generator_cost
+from cores import available_cores, split_cores
+from scoring_pool import ScoringPool, TrainingPool
+from multi_fidelity import HalvingSchedule, hyperband
+from supernet_eval import SupernetScorer
+from job_queue import JobQueue, QueuePool
+from islands import Transport, QueueTransport, TcpTransport, migration_message, ring_destination, parse_addresses
 
 evo_train_logger = logging.getLogger("evo_train")
 
+# children bred again at most this many times when degenerate
+MAX_BREED_ATTEMPTS = 10
+
 def init_logger():
     """ Initalize evo_train_logger """
     evo_train_logger.setLevel(logging.INFO)
@@ -32,10 +53,124 @@ def init_logger():
     evo_train_logger.addHandler(ch)
 
 
-def generate_new_dna(n_dna:int, properties: DNAProperties) -> List[DNA]:
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--population_size', type=int, default=5,
+                        help='number of DNAs in the population')
+    parser.add_argument('--n_epochs', type=int, default=10,
+                        help='number of evolution generations')
+    parser.add_argument('--mutation_probability', type=float, default=0.10,
+                        help='initial mutation probability, divided by 3 every generation')
+    parser.add_argument('--train_epochs', type=int, default=1,
+                        help='number of epochs each candidate GAN is trained for')
+    parser.add_argument('--cache_path', type=str, default='fitness_cache.json',
+                        help='file of the persistent fitness cache, empty to disable caching')
+    parser.add_argument('--cache_max_entries', type=int, default=10000,
+                        help='maximum number of cached scores, least recently used are evicted first')
+    parser.add_argument('--cache_max_age', type=float, default=None,
+                        help='maximum age of a cached score in seconds')
+    parser.add_argument('--mode', type=str, default='generational', choices=['generational', 'steady_state'],
+                        help='generational waits for the whole population every generation, '
+                             'steady_state breeds a new child as soon as any worker is idle')
+    parser.add_argument('--max_evaluations', type=int, default=None,
+                        help='number of DNAs scored in steady_state mode, '
+                             'defaults to the generational budget population_size * (n_epochs + 1)')
+    parser.add_argument('--scoring', type=str, default='full', choices=['full', 'halving'],
+                        help='full trains every candidate for train_epochs, '
+                             'halving uses successive halving / Hyperband budgets')
+    parser.add_argument('--evaluator', type=str, default='train', choices=['train', 'supernet'],
+                        help='train scores every candidate by training it, supernet trains one shared_gan '
+                             'supernet every generation and scores candidates on its shared weights')
+    parser.add_argument('--supernet_epoch', type=int, default=1,
+                        help='epochs the supernet is trained for every generation')
+    parser.add_argument('--supernet_num_eval_imgs', type=int, default=5000,
+                        help='number of images sampled to score a candidate on the supernet')
+    parser.add_argument('--sh_min_epoch', type=int, default=1,
+                        help='epochs of the first successive halving rung')
+    parser.add_argument('--sh_eta', type=int, default=3,
+                        help='budget growth and promotion factor between rungs')
+    parser.add_argument('--sh_rungs', type=int, default=3,
+                        help='number of successive halving rungs')
+    parser.add_argument('--hyperband_brackets', type=int, default=1,
+                        help='number of Hyperband brackets, 1 is plain successive halving')
+    parser.add_argument('--early_stop_percentile', type=float, default=None,
+                        help='stop training a candidate once its learning curve predicts a final score confidently '
+                             'below this percentile of the scores seen so far (needs at least one worker)')
+    parser.add_argument('--surrogate_oversample', type=int, default=1,
+                        help='breed this many times more offspring and train only the best ones '
+                             'predicted by a surrogate model, 1 disables the surrogate')
+    parser.add_argument('--surrogate_min_samples', type=int, default=10,
+                        help='number of scored DNAs before the surrogate is used')
+    parser.add_argument('--inherit_weights', action='store_true',
+                        help='initialize every candidate from the checkpoint of the closest trained architecture, '
+                             'reinitializing only the modules whose genes differ (needs at least one worker)')
+    parser.add_argument('--continue_training', action='store_true',
+                        help='resume architectures that survive a generation from their checkpoint for '
+                             'train_epochs more epochs instead of retraining them (needs at least one worker)')
+    parser.add_argument('--snapshot_path', type=str, default='evo_snapshot.pkl',
+                        help='file the state of the run is atomically saved to after every generation, '
+                             'empty to disable snapshots')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the run saved in snapshot_path from the generation it was at')
+    parser.add_argument('--history_path', type=str, default=None,
+                        help='memory-mapped file of the genome history, kept in memory by default')
+    parser.add_argument('--multi_objective', action='store_true',
+                        help='NSGA-II selection on inception score, generator latency and active parameter count, '
+                             'the Pareto front of all scored architectures is printed at the end')
+    parser.add_argument('--latency_batch_size', type=int, default=1,
+                        help='batch size the generator latency is measured with')
+    parser.add_argument('--cost_table', type=str, default='',
+                        help='op cost table built by benchmarks/op_cost_table.py, used to estimate the generator '
+                             'latency and parameters instead of measuring every architecture')
+    parser.add_argument('--proxy_table', type=str, default='',
+                        help='zero-cost proxy table built by zero_cost.py: the initial population is drawn from '
+                             'its best genomes and offspring it found degenerate are bred again')
+    parser.add_argument('--proxy_top_fraction', type=float, default=0.05,
+                        help='fraction of the best scanned genomes the initial population is drawn from')
+    parser.add_argument('--islands', type=int, default=1,
+                        help='number of island populations run as local processes, each with its own workers')
+    parser.add_argument('--migration_interval', type=int, default=2,
+                        help='generations between two migrations to the next island')
+    parser.add_argument('--migration_size', type=int, default=1,
+                        help='number of best DNAs sent to the next island on every migration')
+    parser.add_argument('--island_addresses', type=str, default='',
+                        help='host:port of every island of a run over TCP, comma separated; '
+                             'this process runs the island at --island_id')
+    parser.add_argument('--island_id', type=int, default=0,
+                        help='island run by this process in a TCP run')
+    parser.add_argument('--job_queue', type=str, default='',
+                        help='SQLite job queue file: candidates are trained by queue_worker.py processes '
+                             'sharing this file instead of local workers')
+    parser.add_argument('--queue_poll_interval', type=float, default=5.0,
+                        help='seconds between two checks of the job queue for results')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of parallel training processes, 0 trains serially in a fresh process per DNA')
+    parser.add_argument('--threads_per_worker', type=int, default=None,
+                        help='torch threads per training process, defaults to its share of the CPU cores')
+    parser.add_argument('--lockstep', type=int, default=1,
+                        help='candidates a worker trains together on the same minibatches, '
+                             'capped at its share of the queue while other workers are idle')
+    return parser.parse_args(args=args)
+
+
+def generate_new_dna(
+    n_dna:int, 
+    properties: DNAProperties, 
+    history: Optional[GenomeHistory] = None, 
+    proxies: Optional[ProxyTable] = None, 
+    top_fraction: float = 0.05
+) -> List[DNA]:
+    """ Uniformly random DNAs, or DNAs drawn from the top_fraction
+        best genomes of a zero-cost proxy table
+    """
+    if proxies is not None:
+        genomes = proxies.sample(n_dna, top_fraction)
+        fitness = proxies.genome_fitness(genomes)
+        evo_train_logger.info(f"Seeded {n_dna} DNAs from the proxy table, proxy fitness {fitness.min():.3f} to {fitness.max():.3f}")
+        return [DNA.from_serial(g, prop=properties, history=history) for g in genomes.tolist()]
     dna_list = []
     for i in range(n_dna):
-        dna_list.append(DNA.gen_random())
+        dna_list.append(DNA.gen_random(history=history))
     return dna_list
 
 def output_dna(dna_list: List[DNA], scores:List[float]) -> None:
@@ -48,36 +183,130 @@ def output_dna(dna_list: List[DNA], scores:List[float]) -> None:
         evo_train_logger.info(f"{d.serialize()} : {scores[idx]}")
 
 
-def score_dna(dna: DNA) -> float:
+def score_arch(arch: List[int], max_epoch: int = 1, cache: Optional[FitnessCache] = None) -> float:
+    """ Train the GAN of an architecture and return its inception score.
+        A cached score for the same architecture and
+        training configuration is returned without training.
+    """
+    config = training_config(max_epoch)
+    if cache is not None:
+        reward = cache.get(arch, config)
+        if reward is not None:
+            return reward
+    reward = train_gan(arch, max_epoch)
+    if cache is not None:
+        cache.put(arch, config, reward)
+    return reward
+
+def score_dna(dna: DNA, max_epoch: int = 1, cache: Optional[FitnessCache] = None) -> float:
     """ Create a GAN using the DNA,
         train the GAN and return the inception score.
         Training uses train_derived from AutoGAN
     """
-    reward = train_gan(to_arch(dna), 1)
-    return reward
+    return score_arch(to_arch(dna), max_epoch, cache)
 
-def scoring_step(dna_list: List[DNA]) -> List[float]:
-    """ Score each DNA """
+def scoring_step(
+    dna_list: List[DNA], 
+    max_epoch: int = 1, 
+    cache: Optional[FitnessCache] = None, 
+    pool: Optional[TrainingPool] = None,
+    schedule: Optional[HalvingSchedule] = None,
+    overrides: Optional[dict] = None,
+    supernet: Optional[SupernetScorer] = None,
+    archive: Optional[CheckpointArchive] = None,
+    inherit_weights: bool = False,
+    continue_training: bool = False
+) -> List[float]:
+    """ Score each DNA, training one DNA per functional equivalence
+        class, and only the classes missing from the cache.
+        Training runs in parallel when a pool is given, with multi-fidelity
+        budgets when a halving schedule is given. Overrides are extra
+        AutoGAN options of pool jobs. With a supernet, the supernet is trained
+        on the population distribution and the DNAs are scored on its weights.
+        Checkpoints of pool jobs are recorded in the archive, if given.
+        With inherit_weights, pool jobs start from the weights of the closest
+        archived architecture. With continue_training, archived architectures
+        are not retrained but resumed from their checkpoint for max_epoch more epochs,
+        into a new checkpoint so that the one of the shorter budget stays valid.
+    """
+    classes = list(equivalence_classes([to_arch(d) for d in dna_list]).values())
+    class_archs = [to_arch(dna_list[members[0]]) for members in classes]
+    if supernet is not None:
+        # Scores depend on the current supernet weights and are not cached
+        supernet.train(generate_evolution_matrix(dna_list, [0.0 for _ in dna_list]))
+        class_scores = supernet.score(class_archs)
+    elif schedule is not None:
+        if pool is None:
+            raise Exception("Multi-fidelity scoring needs at least one worker.")
+        class_scores = hyperband(class_archs, schedule, pool, cache, overrides)
+    elif pool is None:
+        class_scores = []
+        for arch in class_archs:
+            print(arch)
+            class_scores.append(score_arch(arch, max_epoch, cache))
+    else:
+        # Architectures trained in earlier generations resume from their checkpoint for max_epoch more epochs
+        budgets = [max_epoch for _ in class_archs]
+        resume_paths : List[Optional[str]] = [None for _ in class_archs]
+        if archive is not None and continue_training:
+            for idx, arch in enumerate(class_archs):
+                entry = archive.get(arch)
+                if entry is not None:
+                    budgets[idx] = entry.epochs + max_epoch
+                    resume_paths[idx] = entry.checkpoint_dir
+        configs = [training_config(budget) for budget in budgets]
 
-    # scores = []
-    # with ThreadPoolExecutor(max_workers=min(multiprocessing.cpu_count(), 4)) as executor:
-    #     futures = []            
-    #     for d in dna_list:
-    #         futures.append(executor.submit(score_dna, d))
-    #     futures = wait(futures, timeout=None, return_when=ALL_COMPLETED)[0]
+        class_scores = [cache.get(arch, config) if cache is not None else None for arch, config in zip(class_archs, configs)]
+        missing = [idx for idx, s in enumerate(class_scores) if s is None]
+        if archive is not None:
+            for idx, score in enumerate(class_scores):
+                if score is not None:
+                    archive.record(class_archs[idx], cache.checkpoint_dir(class_archs[idx], configs[idx]), budgets[idx], score)
+            job_overrides = [
+                dict(overrides or {}, **{"--load_path": resume_paths[idx]}) if resume_paths[idx] 
+                else inherit_overrides(class_archs[idx], archive, overrides) if inherit_weights
+                else overrides
+                for idx in missing
+            ]
+        else:
+            job_overrides = [overrides] * len(missing)
+        results = pool.map_results([class_archs[idx] for idx in missing], [budgets[idx] for idx in missing], job_overrides)
+        for idx, result in zip(missing, results):
+            class_scores[idx] = result.score
+            # extrapolated scores of runs stopped early only rank this generation
+            if result.early_terminated:
+                continue
+            if cache is not None:
+                cache.put(class_archs[idx], configs[idx], result.score, result.checkpoint_dir)
+            if archive is not None:
+                archive.record(class_archs[idx], result.checkpoint_dir, budgets[idx], result.score)
+        if continue_training:
+            evo_train_logger.info(f"Continued training of {sum(1 for p in resume_paths if p)} surviving architectures")
 
-    #     for f in futures:
-    #         scores.append(f.result())
-    scores = []
-    for d in dna_list:
-        print(to_arch(d))
-        scores.append(score_dna(d))
+    scores = [0.0 for _ in dna_list]
+    for members, score in zip(classes, class_scores):
+        for idx in members:
+            scores[idx] = score
+    evo_train_logger.info(f"Scored {len(classes)} equivalence classes for {len(dna_list)} DNAs")
+    if cache is not None:
+        evo_train_logger.info(f"Fitness cache: {cache.stats()}")
     return scores
 
-def generation_step(dna_list: List[DNA], scores: List[List[float]], properties: DNAProperties) -> List[DNA]:
+def generation_step(
+    dna_list: List[DNA], 
+    scores: List[List[float]], 
+    properties: DNAProperties, 
+    surrogate: Optional[SurrogateModel] = None, 
+    oversample: int = 1
+) -> List[DNA]:
     """ Set new properties (usually mutation probability)
-        Evolve and mutate a list of DNAs and return the list
+        Evolve and mutate a list of DNAs and return the list.
+        With a trained surrogate, oversample times more offspring are
+        bred and only the best predicted ones are returned.
     """
+    if surrogate is not None and surrogate.is_ready() and oversample > 1:
+        return screen_offspring(dna_list, scores, properties, surrogate, oversample)
+
     for d in dna_list:
         d.set_properties(properties)
     
@@ -92,67 +321,506 @@ def generation_step(dna_list: List[DNA], scores: List[List[float]], properties:
 
     return dna_list
 
+def screen_offspring(
+    dna_list: List[DNA], 
+    scores: List[float], 
+    properties: DNAProperties, 
+    surrogate: SurrogateModel, 
+    oversample: int
+) -> List[DNA]:
+    """ Breed len(dna_list) * oversample candidates from the evolution
+        matrix and keep the len(dna_list) best according to the surrogate
+    """
+    candidates = Population.gen_random(len(dna_list) * oversample, [type(c.parameters) for c in dna_list[0].cells])
+    candidates.evolve(generate_evolution_matrix(dna_list, scores))
+    candidates.mutate(properties.mutation_probability)
+    predictions = surrogate.predict(candidates.genomes)
+    # Identical offspring get identical predictions, keep one of each and only
+    # fall back on the best duplicates when there are too few distinct offspring
+    _, unique = np.unique(candidates.genomes, axis=0, return_index=True)
+    duplicates = np.setdiff1d(np.arange(len(candidates)), unique)
+    ranked = np.concatenate([unique[np.argsort(-predictions[unique])], duplicates[np.argsort(-predictions[duplicates])]])
+    best = ranked[:len(dna_list)]
+    evo_train_logger.info(
+        f"Surrogate kept {len(best)} of {len(candidates)} offspring, "
+        f"predicted scores {predictions[best].min():.3f} to {predictions[best].max():.3f}"
+    )
+    # offspring k is bred in the slot of dna_list[k % len(dna_list)], as generation_step evolves each DNA in place
+    return [candidates.dna(idx, properties, dna_list[0].history, dna_list[idx % len(dna_list)].history_id)
+            for idx in best]
+
 def to_arch(dna: DNA) -> List[int]:
     """ Convert DNA to architecture string
         expected by AutoGAN trainer
     """
-    values = dna.serialize()   
-    skip = values[len(values)-2:]
-    skip = skip[0] * 2 + skip[1]
-    values = values[:len(values)-2]
-    values.append(skip)
-    return values
+    return arch_from_serial(dna.serialize())
 
 def generate_evolution_matrix(dna_list: List[DNA], scores: List[int]) -> List[List[float]]:
     """ Generate a probability distribution of evolutopn parameters
-        based on inception scores from the scoring step
+        based on inception scores from the scoring step.
+        The DNAs are copied into a genome matrix, the population is kept as DNA objects.
     """
-    param_options = []
-    evo_matrix = []
+    return Population.from_dna_list(dna_list).evolution_matrix(scores)
 
-    for c in dna_list[0].cells:
-        for idx, _ in enumerate(c.serialize()):
-            param_options.append(len(c.parameters.get_field_options(idx)))
+def early_stop_overrides(args, scores: List[float]) -> Optional[dict]:
+    """ Early termination threshold at the configured percentile of scores """
+    if args.early_stop_percentile is None or not scores:
+        return None
+    return {"--early_stop_threshold": float(np.percentile(scores, args.early_stop_percentile))}
 
-    for i in range(len(dna_list[0].serialize())):
-        p = [0 for _ in range(param_options[i])]
-        for d_idx, d in enumerate(dna_list):
-            p[d.serialize()[i]] += np.exp(scores[d_idx])
-        p_sum = sum(p)
-        p = [x / p_sum for x in p]
-        evo_matrix.append(p)
+def inherit_overrides(arch: List[int], archive: CheckpointArchive, overrides: Optional[dict] = None) -> Optional[dict]:
+    """ Add the options initializing a training run from the
+        checkpoint of the closest archived architecture
+    """
+    parent = archive.nearest(arch)
+    if parent is None:
+        return overrides
+    return dict(overrides or {}, **{"--inherit_path": parent.checkpoint_dir, "--inherit_arch": list(parent.arch)})
 
-    return evo_matrix
-    
+def breed_child(
+    evo_matrix: List[List[float]], 
+    properties: DNAProperties, 
+    history: Optional[GenomeHistory] = None, 
+    proxies: Optional[ProxyTable] = None,
+    parent: int = NO_PARENT
+) -> DNA:
+    """ Sample a child from an evolution matrix and mutate it,
+        again while the proxy table found it degenerate.
+        The child is recorded in history as a child of parent.
+    """
+    for _ in range(MAX_BREED_ATTEMPTS):
+        child = DNA.gen_random(history=history, parent=parent)
+        child.set_properties(properties)
+        child.evolve(evo_matrix)
+        child.mutate()
+        if proxies is None or not proxies.is_degenerate([child.serialize()])[0]:
+            break
+    return child
+
+def breed_dna(dna_list: List[DNA], scores: List[float], properties: DNAProperties, proxies: Optional[ProxyTable] = None) -> DNA:
+    """ Sample a child from the evolution distribution of
+        a scored population and mutate it, as a child of the best DNA
+    """
+    parent = dna_list[int(np.argmax(scores))].history_id
+    evo_matrix = generate_evolution_matrix(dna_list, scores)
+    return breed_child(evo_matrix, properties, dna_list[0].history, proxies, parent)
+
+def replace_degenerate(
+    dna_list: List[DNA], 
+    evo_matrix: List[List[float]], 
+    properties: DNAProperties, 
+    proxies: ProxyTable
+) -> List[DNA]:
+    """ Breed a new child from evo_matrix in place of every
+        DNA the proxy table found degenerate, as a child of that DNA
+    """
+    degenerate = proxies.is_degenerate([d.serialize() for d in dna_list])
+    if degenerate.any():
+        evo_train_logger.info(f"Breeding {int(degenerate.sum())} degenerate offspring again")
+    return [
+        breed_child(evo_matrix, properties, d.history, proxies, d.history_id) if bad else d
+        for d, bad in zip(dna_list, degenerate)
+    ]
+
+def steady_state_evolution(
+    args, 
+    cache: Optional[FitnessCache], 
+    pool: TrainingPool, 
+    archive: Optional[CheckpointArchive] = None,
+    history: Optional[GenomeHistory] = None,
+    proxies: Optional[ProxyTable] = None
+) -> Tuple[List[DNA], List[float]]:
+    """ Asynchronous evolution without generation barriers.
+        Whenever a worker finishes, its DNA replaces the worst one of
+        the population and a child bred from the current population
+        is handed to the idle worker straight away.
+    """
+    config = training_config(args.train_epochs)
+    n_evaluations = args.max_evaluations or args.population_size * (args.n_epochs + 1)
+    population : List[DNA] = []
+    scores : List[float] = []
+    in_flight = {}
+    submitted = 0
+    evaluated = 0
+    initial = generate_new_dna(
+        args.population_size, DNAProperties(mutation_probability=args.mutation_probability), history,
+        proxies, args.proxy_top_fraction
+    )
+
+    def insert(dna: DNA, score: float) -> None:
+        if history is not None:
+            history.set_scores([dna.history_id], [score])
+        population.append(dna)
+        scores.append(score)
+        if len(population) > args.population_size:
+            worst = int(np.argmin(scores))
+            del population[worst]
+            del scores[worst]
+        output_dna([dna], [score])
+
+    while evaluated < n_evaluations:
+        # Keep every worker busy
+        while submitted < n_evaluations and len(in_flight) < pool.n_workers:
+            # Mutation probability decays by 3 every population_size evaluations, as in generational mode
+            mut_prob = args.mutation_probability / (3 ** (submitted // args.population_size))
+            properties = DNAProperties(mutation_probability=mut_prob)
+            if submitted < args.population_size:
+                dna = initial[submitted]
+            elif not population:
+                dna = DNA.gen_random(prop=properties, history=history)
+            else:
+                dna = breed_dna(population, scores, properties, proxies)
+            submitted += 1
+
+            arch = to_arch(dna)
+            score = cache.get(arch, config) if cache is not None else None
+            if score is None:
+                overrides = early_stop_overrides(args, scores)
+                if args.inherit_weights:
+                    overrides = inherit_overrides(arch, archive, overrides)
+                pool.submit(submitted, arch, args.train_epochs, overrides)
+                in_flight[submitted] = dna
+            else:
+                insert(dna, score)
+                evaluated += 1
+
+        if not in_flight:
+            continue
+        result = pool.next_result()
+        score = result.score
+        dna = in_flight.pop(result.job_id)
+        arch = to_arch(dna)
+        if cache is not None and not result.early_terminated:
+            cache.put(arch, config, score, result.checkpoint_dir)
+        if archive is not None and not result.early_terminated:
+            archive.record(arch, result.checkpoint_dir, args.train_epochs, score)
+        insert(dna, score)
+        evaluated += 1
+        evo_train_logger.info(f"Evaluated {evaluated}/{n_evaluations}")
+
+    if cache is not None:
+        evo_train_logger.info(f"Fitness cache: {cache.stats()}")
+    return population, scores
+
+def main(args, migrate: Optional[Callable] = None) -> Tuple[List[DNA], List[float]]:
+    """ Run the search on one population and return the final population with its scores.
+        migrate(epoch, dna_list, scores) is called on every scored generation before breeding
+        and returns the population and scores to breed from.
+    """
+    cache = None
+    if args.cache_path:
+        cache = FitnessCache(args.cache_path, args.cache_max_entries, args.cache_max_age)
+
+    cost_table = None
+    if args.multi_objective and args.cost_table:
+        # checked before any worker is started: the table must describe the generator
+        # that is trained and the latency that is asked for
+        cost_table = CostTable.load(args.cost_table)
+        config = training_config(1)
+        cost_table.check_setup(gf_dim=config["--gf_dim"], bottom_width=config["--bottom_width"],
+                               latent_dim=config["--latent_dim"], batch_size=args.latency_batch_size)
+
+    if args.scoring == 'halving':
+        # multi-fidelity scoring trains every rung itself, from scratch or from the rung below
+        if args.evaluator == 'supernet':
+            raise Exception("The supernet evaluator does not support multi-fidelity scoring.")
+        if args.mode == 'steady_state':
+            raise Exception("Multi-fidelity scoring is only supported in generational mode.")
+        if args.inherit_weights or args.continue_training:
+            raise Exception("Weight inheritance and continued training do not support multi-fidelity scoring.")
+
+    pool = None
+    supernet = None
+    if args.evaluator == 'supernet':
+        if args.mode == 'steady_state':
+            raise Exception("The supernet evaluator only supports generational mode.")
+        supernet = SupernetScorer(args.supernet_epoch, args.supernet_num_eval_imgs)
+    elif args.job_queue:
+        pool = QueuePool(JobQueue(args.job_queue), max(args.workers, 1), args.queue_poll_interval)
+    elif args.workers > 0:
+        pool = ScoringPool(args.workers, args.threads_per_worker, args.lockstep)
+    if args.lockstep > 1 and not isinstance(pool, ScoringPool):
+        raise Exception("Lockstep training needs local workers.")
+
+    archive = None
+    if args.inherit_weights or args.continue_training:
+        if pool is None:
+            raise Exception("Weight inheritance and continued training need at least one worker.")
+        archive = CheckpointArchive()
+
+    history = GenomeHistory(path=args.history_path)
+
+    proxies = None
+    if args.proxy_table:
+        proxies = ProxyTable(args.proxy_table, readonly=True)
+        evo_train_logger.info(f"Proxy table {args.proxy_table} covers {proxies.coverage() * 100:.1f}% of the search space")
+
+    if args.mode == 'steady_state':
+        if args.resume:
+            raise Exception("Resuming is only supported in generational mode.")
+        if pool is None:
+            raise Exception("steady_state mode needs at least one worker.")
+        population, scores = steady_state_evolution(args, cache, pool, archive, history, proxies)
+        print("\n FINAL: \n")
+        evo_train_logger.info("\n FINAL: \n")
+        output_dna(population, scores)
+        pool.close()
+        return population, scores
+
+    schedule = None
+    if args.scoring == 'halving':
+        schedule = HalvingSchedule(args.sh_min_epoch, args.sh_eta, args.sh_rungs, args.hyperband_brackets)
 
-def main():
     # Initialize mutation probability
-    mut_prob = 0.10
+    mut_prob = args.mutation_probability
     properties = DNAProperties(mutation_probability=mut_prob)
 
-    # Initialize dna uniformly
-    dna_list = generate_new_dna(5, properties)
-    n_epochs = 10
+    # Initialize dna uniformly, or from the best genomes of the proxy table
+    dna_list = generate_new_dna(args.population_size, properties, history, proxies, args.proxy_top_fraction)
+    n_epochs = args.n_epochs
+    score_history : List[float] = []
+    start_epoch = 0
+
+    surrogate = None
+    if args.surrogate_oversample > 1:
+        surrogate = SurrogateModel(min_samples=args.surrogate_min_samples)
+
+    pareto = None
+    if args.multi_objective:
+        if cost_table is not None:
+            cost_func = partial(estimated_generator_cost, cost_table)
+        else:
+            cost_func = partial(measure_generator_cost, batch_size=args.latency_batch_size)
+        pareto = ParetoArchive(cost_func, args.population_size)
 
-    for epoch in range(n_epochs):
+    snapshot = load_snapshot(args.snapshot_path) if args.resume and args.snapshot_path else None
+    if args.resume and snapshot is None:
+        raise Exception(f"No snapshot to resume from at '{args.snapshot_path}'.")
+    if snapshot is not None:
+        # Everything scored before the snapshot is kept, the run continues with the unscored offspring
+        start_epoch = snapshot["epoch"]
+        dna_list = snapshot["dna_list"]
+        mut_prob = snapshot["mutation_probability"]
+        score_history = snapshot["score_history"]
+        # the DNAs share the restored history
+        history = dna_list[0].history
+        if snapshot["surrogate"] is not None:
+            surrogate = snapshot["surrogate"]
+        if archive is not None and snapshot["archive"] is not None:
+            archive = snapshot["archive"]
+        if pareto is not None and snapshot.get("pareto") is not None:
+            pareto = snapshot["pareto"]
+        if supernet is not None and snapshot.get("supernet") is not None:
+            supernet.load_state_dict(snapshot["supernet"])
+        evo_train_logger.info(f"Resumed from {args.snapshot_path} at epoch {start_epoch}")
+
+    for epoch in range(start_epoch, n_epochs):
         properties = DNAProperties(mutation_probability=mut_prob)
         print(f"\n EPOCH: {epoch}\n")
         evo_train_logger.info(f"\n EPOCH: {epoch}\n")
-        inception_scores = scoring_step(dna_list)
+        inception_scores = scoring_step(
+            dna_list, args.train_epochs, cache, pool, schedule, early_stop_overrides(args, score_history), supernet,
+            archive, args.inherit_weights, args.continue_training
+        )
+        score_history += inception_scores
+        history.set_scores([d.history_id for d in dna_list], inception_scores)
         output_dna(dna_list, inception_scores)
 
-        dna_list = generation_step(dna_list, inception_scores, properties)
+        if surrogate is not None:
+            surrogate.add(np.array([d.serialize() for d in dna_list]), inception_scores)
+            if surrogate.rank_correlations:
+                evo_train_logger.info(
+                    f"Surrogate rank correlation: {surrogate.rank_correlations[-1]:.3f} "
+                    f"(mean {np.mean(surrogate.rank_correlations):.3f})"
+                )
+
+        if migrate is not None:
+            dna_list, inception_scores = migrate(epoch, dna_list, inception_scores)
+
+        if pareto is not None:
+            # breed from the NSGA-II elite, weighted by Pareto rank and crowding instead of score
+            pareto.add([d.serialize() for d in dna_list], [to_arch(d) for d in dna_list], inception_scores,
+                       [d.history_id for d in dna_list])
+            # the elite continues the lineage of the scored genomes it was selected from
+            dna_list = [
+                DNA.from_serial(pareto.genomes[idx], prop=properties, history=history, parent=pareto.history_ids[idx])
+                for idx in pareto.elite
+            ]
+            inception_scores = pareto.elite_fitness().tolist()
+
+        history.next_generation()
+        evo_matrix = generate_evolution_matrix(dna_list, inception_scores) if proxies is not None else None
+        dna_list = generation_step(dna_list, inception_scores, properties, surrogate, args.surrogate_oversample)
+        if proxies is not None:
+            dna_list = replace_degenerate(dna_list, evo_matrix, properties, proxies)
 
         mut_prob /= 3
 
+        if args.snapshot_path:
+            save_snapshot(args.snapshot_path, {
+                "epoch": epoch + 1,
+                "dna_list": dna_list,
+                "mutation_probability": mut_prob,
+                "score_history": score_history,
+                "surrogate": surrogate,
+                "archive": archive,
+                "pareto": pareto,
+                "supernet": supernet.state_dict() if supernet is not None else None,
+            })
+
     final_dna_list = dna_list
-    final_scores = scoring_step(final_dna_list)
+    final_scores = scoring_step(
+        final_dna_list, args.train_epochs, cache, pool, schedule, early_stop_overrides(args, score_history), supernet,
+        archive, args.inherit_weights, args.continue_training
+    )
 
     print("\n FINAL: \n")
     evo_train_logger.info("\n FINAL: \n")
     output_dna(final_dna_list, final_scores)
-    
+    history.set_scores([d.history_id for d in final_dna_list], final_scores)
+    best = history.best()[0]
+    evo_train_logger.info(
+        f"{len(history)} genomes in the history, best {history.genes[best].tolist()} : {history.scores[best]} "
+        f"over {len(history.lineage(best))} versions"
+    )
+
+    if pareto is not None:
+        pareto.add([d.serialize() for d in final_dna_list], [to_arch(d) for d in final_dna_list], final_scores)
+        output_pareto_front(pareto)
+
+    if pool is not None:
+        pool.close()
+    if supernet is not None:
+        supernet.close()
+    return final_dna_list, final_scores
+
+def estimated_generator_cost(table: CostTable, arch: List[int]) -> Tuple[float, float]:
+    """ Latency in milliseconds and parameters of a generator, from the op cost table """
+    cost = table.estimate(arch)
+    return cost.latency_us / 1e3, cost.params
+
+def output_pareto_front(pareto: ParetoArchive) -> None:
+    """ Print the architectures no other one beats on both score and serving cost """
+    print("\n PARETO FRONT (inception score, latency ms, parameters): \n")
+    evo_train_logger.info("\n PARETO FRONT (inception score, latency ms, parameters): \n")
+    for idx in pareto.front():
+        score, latency, n_params = pareto.objectives[idx]
+        line = f"{pareto.genomes[idx]} : {-score:.4f}, {latency:.2f} ms, {int(n_params)}"
+        print(line)
+        evo_train_logger.info(line)
+
+def island_path(path: Optional[str], island_id: int) -> Optional[str]:
+    """ Per island variant of a file option, islands do not share files """
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.island{island_id}{ext}"
+
+def integrate_migrants(dna_list: List[DNA], scores: List[float], messages: List[dict]) -> Tuple[List[DNA], List[float]]:
+    """ Immigrants, best first, replace the worst DNAs they outscore.
+        Genomes already in the population are ignored.
+    """
+    dna_list = list(dna_list)
+    scores = list(scores)
+    immigrants = [(score, genome) for message in messages for genome, score in zip(message["genomes"], message["scores"])]
+    lineages = {
+        tuple(genome): lineage
+        for message in messages for genome, lineage in zip(message["genomes"], message.get("lineages", []))
+    }
+    present = {tuple(d.serialize()) for d in dna_list}
+    for score, genome in sorted(immigrants, key=lambda m: m[0], reverse=True):
+        worst = int(np.argmin(scores))
+        if score <= scores[worst] or tuple(genome) in present:
+            continue
+        present.discard(tuple(dna_list[worst].serialize()))
+        history = dna_list[worst].history
+        parent = NO_PARENT
+        if history is not None:
+            # ancestors of the migrant on its source island, oldest first, the last one is the migrant
+            for ancestor in lineages.get(tuple(genome), [])[:-1]:
+                parent = history.append(ancestor, parent)
+        dna = DNA.from_serial(genome, prop=dna_list[worst].properties, history=history, parent=parent)
+        if dna.history is not None:
+            dna.history.set_scores([dna.history_id], [score])
+        dna_list[worst] = dna
+        scores[worst] = score
+        present.add(tuple(genome))
+    return dna_list, scores
+
+def run_island(args, island_id: int, n_islands: int, transport: Transport) -> Tuple[List[DNA], List[float]]:
+    """ Evolve one island, sending its best DNAs to the next island of the
+        ring every migration_interval generations and taking in the
+        migrants received meanwhile
+    """
+    island_args = argparse.Namespace(**vars(args))
+    island_args.cache_path = island_path(args.cache_path, island_id)
+    island_args.snapshot_path = island_path(args.snapshot_path, island_id)
+    island_args.history_path = island_path(args.history_path, island_id)
+
+    def migrate(epoch: int, dna_list: List[DNA], scores: List[float]) -> Tuple[List[DNA], List[float]]:
+        if (epoch + 1) % args.migration_interval == 0:
+            best = np.argsort(scores)[::-1][:args.migration_size]
+            destination = ring_destination(island_id, n_islands)
+            transport.send(destination, migration_message(
+                island_id, [dna_list[idx].serialize() for idx in best], [scores[idx] for idx in best],
+                [dna_list[idx].get_evolution_history() for idx in best]
+            ))
+            evo_train_logger.info(f"Island {island_id} sent {len(best)} migrants to island {destination}")
+        messages = transport.receive()
+        if messages:
+            evo_train_logger.info(f"Island {island_id} received migrants from islands {[m['source'] for m in messages]}")
+        return integrate_migrants(dna_list, scores, messages)
+
+    return main(island_args, migrate)
+
+def _local_island(args, island_id: int, cores: List[int], queues: list, results: multiprocessing.Queue) -> None:
+    if hasattr(os, "sched_setaffinity"):
+        # the island's workers split this island's cores among themselves
+        os.sched_setaffinity(0, cores)
+    population, scores = run_island(args, island_id, args.islands, QueueTransport(queues, island_id))
+    results.put((island_id, [d.serialize() for d in population], scores))
+
+def run_local_islands(args) -> None:
+    """ Run args.islands islands as processes of this machine,
+        each on its own share of the CPU cores
+    """
+    queues = QueueTransport.create_queues(args.islands)
+    results : multiprocessing.Queue = multiprocessing.Queue()
+    processes = []
+    for island_id, cores in enumerate(split_cores(available_cores(), args.islands)):
+        # Not daemonic so that the islands can start their own workers
+        p = multiprocessing.Process(target=_local_island, args=(args, island_id, cores, queues, results))
+        p.start()
+        processes.append(p)
+    finals = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    genomes = [genome for _, island_genomes, _ in sorted(finals) for genome in island_genomes]
+    scores = [score for _, _, island_scores in sorted(finals) for score in island_scores]
+    print("\n FINAL (all islands): \n")
+    evo_train_logger.info("\n FINAL (all islands): \n")
+    output_dna([DNA.from_serial(genome) for genome in genomes], scores)
+
+def run(args) -> None:
+    """ Run a single population, the local islands of args.islands,
+        or the island args.island_id of a TCP connected run
+    """
+    if (args.islands > 1 or args.island_addresses) and args.mode != 'generational':
+        raise Exception("Islands only support generational mode.")
+    if args.island_addresses:
+        addresses = parse_addresses(args.island_addresses)
+        transport = TcpTransport(addresses, args.island_id)
+        try:
+            run_island(args, args.island_id, len(addresses), transport)
+        finally:
+            transport.close()
+    elif args.islands > 1:
+        run_local_islands(args)
+    else:
+        main(args)
+
 
 if __name__ == "__main__":
     init_logger()
-    main()
+    run(parse_args())
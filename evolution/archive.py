@@ -0,0 +1,49 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+class ArchiveEntry(NamedTuple):
+    arch: Tuple[int, ...]
+    checkpoint_dir: str
+    epochs: int
+    score: float
+
+class CheckpointArchive:
+    """ Checkpoint directory of every trained architecture, with
+        nearest neighbour lookup by number of differing genes
+    """
+    def __init__(self):
+        self.entries : Dict[Tuple[int, ...], ArchiveEntry] = {}
+        self._matrix : Optional[np.ndarray] = None
+        self._keys : List[Tuple[int, ...]] = []
+        return
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, arch: Sequence[int]) -> bool:
+        return tuple(int(a) for a in arch) in self.entries
+
+    def record(self, arch: Sequence[int], checkpoint_dir: Optional[str], epochs: int, score: float) -> None:
+        if not checkpoint_dir:
+            return
+        key = tuple(int(a) for a in arch)
+        self.entries[key] = ArchiveEntry(key, checkpoint_dir, epochs, float(score))
+        self._matrix = None
+        return
+
+    def get(self, arch: Sequence[int]) -> Optional[ArchiveEntry]:
+        return self.entries.get(tuple(int(a) for a in arch))
+
+    def nearest(self, arch: Sequence[int]) -> Optional[ArchiveEntry]:
+        """ Archived architecture with the fewest differing genes,
+            the best scoring one on ties
+        """
+        if not self.entries:
+            return None
+        if self._matrix is None:
+            self._keys = list(self.entries)
+            self._matrix = np.array(self._keys, dtype=np.int64)
+        distances = (self._matrix != np.asarray(arch, dtype=np.int64)).sum(axis=1)
+        candidates = np.flatnonzero(distances == distances.min())
+        best = max(candidates, key=lambda idx: self.entries[self._keys[idx]].score)
+        return self.entries[self._keys[best]]
@@ -0,0 +1,36 @@
+from .search_space import SearchSpace
+from typing import Dict, List
+import numpy as np
+
+# Every gene is read by Cell.set_arch and changes the network: the first conv
+# block of every Cell always upsamples, so the upsample gene is never unused.
+# No gene can be canonicalized away, architectures are deduplicated by
+# exact identity.
+
+def equivalence_classes(archs: List[List[int]], space: SearchSpace = None) -> Dict[int, List[int]]:
+    """ Group identical architectures by their rank,
+        mapping each class to the indices of its members
+    """
+    space = space if space is not None else SearchSpace()
+    if not archs:
+        return {}
+    ranks = space.arch_rank_many(np.array(archs, dtype=np.int64))
+    classes : Dict[int, List[int]] = {}
+    for idx, rank in enumerate(ranks.tolist()):
+        classes.setdefault(rank, []).append(idx)
+    return classes
+
+def collapse_report(space: SearchSpace = None, batch_size: int = 65536) -> Dict[str, float]:
+    """ How much of the search space collapses into equivalence classes """
+    space = space if space is not None else SearchSpace()
+    n_classes = space.count_distinct_archs(batch_size)
+    return {
+        "genomes": space.size,
+        "equivalence_classes": n_classes,
+        "collapse_ratio": 1.0 - n_classes / space.size,
+    }
+
+
+if __name__ == "__main__":
+    for k, v in collapse_report().items():
+        print(f"{k}: {v}")
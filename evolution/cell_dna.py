@@ -1,4 +1,4 @@
-from .parameters import Parameters
+from .parameters import Parameters, field_table
 from dataclasses import dataclass, astuple, fields, asdict
 from typing import Type, TypeVar, List, Callable, Any, Sequence, Tuple
 from random import choice, uniform
@@ -14,16 +14,13 @@ class DNAProperties:
     mutation_probability_args : Tuple = (0, 1)
 
 class CellDNA:
+    __slots__ = ('parameters', 'properties')
+
     def __init__(self, parameters: Parameters, properties: DNAProperties = DNAProperties()):
         self.parameters = parameters
         self.properties = properties
-        self.parameter_history : List[dict] = []
-        self._append_history()
         return
 
-    def _append_history(self):
-        self.parameter_history.append(self.parameters.to_dict())
-
     def __repr__(self):
         return repr(self.parameters.to_dict())
 
@@ -35,17 +32,14 @@ class CellDNA:
         return self.parameters.serialize()
 
     def mutate(self) -> None:
-        current_parameters = self.parameters.to_dict()
-        new_parameters = self.parameters.to_dict()
-        for idx, (k, p) in enumerate(current_parameters.items()):
+        new_parameters = self.serialize()
+        options = field_table(type(self.parameters)).options
+        for idx, p in enumerate(new_parameters):
             rand = self.properties.mutation_probability_func(*self.properties.mutation_probability_args)
-            possible_choices = self.parameters.get_field_options(idx)
-            possible_choices.remove(p.value)
             if (rand < self.properties.mutation_probability):
-                new_parameters[k] = self.properties.choice_func(possible_choices)
-        new_parameters = list(new_parameters.values())
+                possible_choices = [o for o in options[idx] if o != p]
+                new_parameters[idx] = self.properties.choice_func(possible_choices)
         self.parameters = self.parameters.from_serial(new_parameters)
-        self._append_history()
         return
 
     def set_properties(self, properties: DNAProperties) -> None:
@@ -54,12 +48,9 @@ class CellDNA:
 
     def evolve(self, evolution_matrix: List[List[float]]):
         current_parameters = self.serialize()
+        options = field_table(type(self.parameters)).options
         for idx, p in enumerate(current_parameters):
-            possible_choices = self.parameters.get_field_options(idx)
-            current_parameters[idx] = np.random.choice(possible_choices, p=evolution_matrix[idx])
+            # option values are their indices, sampling an index avoids converting the options to an array
+            current_parameters[idx] = np.random.choice(len(options[idx]), p=evolution_matrix[idx])
         self.parameters = self.parameters.from_serial(current_parameters)
-        self._append_history()
         return
-
-    def get_evolution_history(self) -> List[Parameters]:
-        return self.parameter_history.copy()
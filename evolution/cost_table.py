@@ -0,0 +1,146 @@
+import json
+import os
+from typing import Dict, Iterator, List, NamedTuple, Sequence
+import numpy as np
+
+COST_TABLE_VERSION = 1
+
+# Gene positions inside the architecture vector of a cell,
+# as read by Cell.set_arch in AutoGAN/models_search/building_blocks_search.py
+CONV, NORM, UP, SHORTCUT, SKIP = range(5)
+CELL_OFFSETS = (0, 4, 9)
+
+# Number of skip inputs of every cell, as built by shared_gan.Generator
+CELL_SKIP_INPUTS = (0, 1, 2)
+N_CONV, N_NORM, N_UP = 2, 3, 3
+
+class OpCost(NamedTuple):
+    latency_us: float
+    flops: float
+    activation_bytes: float
+    params: float
+
+def conv_key(cell: int, conv: int, norm: int, up: int) -> str:
+    """ Both conv blocks of a cell, including the upsampling of the first one """
+    return f"cell{cell}.conv.{conv}.{norm}.{up}"
+
+def shortcut_key(cell: int, up: int) -> str:
+    return f"cell{cell}.shortcut.{up}"
+
+def skip_key(cell: int, skip_input: int, up: int) -> str:
+    """ Upsampling and 1x1 conv of the skip_input-th skip connection of a cell """
+    return f"cell{cell}.skip{skip_input}.{up}"
+
+FIXED_KEY = "fixed"
+
+def all_op_keys() -> Iterator[str]:
+    yield FIXED_KEY
+    for cell, n_skip in enumerate(CELL_SKIP_INPUTS):
+        for conv in range(N_CONV):
+            for norm in range(N_NORM):
+                for up in range(N_UP):
+                    yield conv_key(cell, conv, norm, up)
+        for up in range(N_UP):
+            yield shortcut_key(cell, up)
+            for skip_input in range(n_skip):
+                yield skip_key(cell, skip_input, up)
+
+def active_skip_inputs(cell: int, skip: int) -> List[int]:
+    """ Skip inputs a cell uses, the lowest bit of the skip gene is the last input
+        (Cell.set_arch in AutoGAN/models_search/building_blocks_search.py)
+    """
+    n_skip = CELL_SKIP_INPUTS[cell]
+    return [i for i in range(n_skip) if (skip >> (n_skip - 1 - i)) & 1]
+
+def op_keys(arch: Sequence[int]) -> List[str]:
+    """ Keys of the ops a generator architecture runs """
+    keys = [FIXED_KEY]
+    for cell, offset in enumerate(CELL_OFFSETS):
+        up = arch[offset + UP]
+        keys.append(conv_key(cell, arch[offset + CONV], arch[offset + NORM], up))
+        if arch[offset + SHORTCUT]:
+            keys.append(shortcut_key(cell, up))
+        if CELL_SKIP_INPUTS[cell]:
+            keys += [skip_key(cell, i, up) for i in active_skip_inputs(cell, arch[offset + SKIP])]
+    return keys
+
+class CostTable:
+    """ Measured cost of every op choice of the generator search space,
+        for the setup (channels, resolution, batch size, device) it was
+        measured with. The cost of an architecture is the sum of the costs
+        of its ops, so it is estimated without building the model.
+        Tables are built by benchmarks/op_cost_table.py.
+    """
+    def __init__(self, ops: Dict[str, Sequence[float]], setup: dict):
+        self.ops = {key: OpCost(*cost) for key, cost in ops.items()}
+        self.setup = setup
+        missing = [key for key in all_op_keys() if key not in self.ops]
+        if missing:
+            raise Exception(f"Cost table is missing {len(missing)} ops, e.g. {missing[0]}")
+
+        # dense arrays indexed by gene values, for estimate_many
+        n_cells = len(CELL_OFFSETS)
+        self._fixed = np.array(self.ops[FIXED_KEY])
+        self._conv = np.zeros((n_cells, N_CONV, N_NORM, N_UP, len(OpCost._fields)))
+        self._shortcut = np.zeros((n_cells, N_UP, len(OpCost._fields)))
+        self._skip = np.zeros((n_cells, max(CELL_SKIP_INPUTS), N_UP, len(OpCost._fields)))
+        for cell, n_skip in enumerate(CELL_SKIP_INPUTS):
+            for conv in range(N_CONV):
+                for norm in range(N_NORM):
+                    for up in range(N_UP):
+                        self._conv[cell, conv, norm, up] = self.ops[conv_key(cell, conv, norm, up)]
+            for up in range(N_UP):
+                self._shortcut[cell, up] = self.ops[shortcut_key(cell, up)]
+                for skip_input in range(n_skip):
+                    self._skip[cell, skip_input, up] = self.ops[skip_key(cell, skip_input, up)]
+        return
+
+    def check_setup(self, **expected) -> None:
+        """ Raise if the table was measured for another generator or batch size than expected """
+        mismatches = [f"{key} {self.setup.get(key)} instead of {value}"
+                      for key, value in expected.items() if self.setup.get(key) != value]
+        if mismatches:
+            raise Exception(f"Cost table was measured with {', '.join(mismatches)}")
+        return
+
+    @classmethod
+    def load(cls, path: str) -> "CostTable":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != COST_TABLE_VERSION:
+            raise Exception(f"Unsupported cost table version {data.get('version')} in {path}")
+        return cls(data["ops"], data["setup"])
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({
+                "version": COST_TABLE_VERSION,
+                "setup": self.setup,
+                "ops": {key: list(cost) for key, cost in self.ops.items()},
+            }, f, indent=1, sort_keys=True)
+        return
+
+    def estimate(self, arch: Sequence[int]) -> OpCost:
+        """ Cost of one architecture vector, as expected by Generator.set_arch """
+        total = np.zeros(len(OpCost._fields))
+        for key in op_keys(arch):
+            total += self.ops[key]
+        return OpCost(*total.tolist())
+
+    def estimate_many(self, archs: np.ndarray) -> np.ndarray:
+        """ Costs of many architectures at once, one row per architecture
+            and one column per OpCost field
+        """
+        archs = np.asarray(archs, dtype=np.int64)
+        total = np.tile(self._fixed, (len(archs), 1))
+        for cell, offset in enumerate(CELL_OFFSETS):
+            up = archs[:, offset + UP]
+            total += self._conv[cell, archs[:, offset + CONV], archs[:, offset + NORM], up]
+            total += self._shortcut[cell, up] * (archs[:, offset + SHORTCUT] > 0)[:, None]
+            n_skip = CELL_SKIP_INPUTS[cell]
+            for skip_input in range(n_skip):
+                active = (archs[:, offset + SKIP] >> (n_skip - 1 - skip_input)) & 1
+                total += self._skip[cell, skip_input, up] * active[:, None]
+        return total
@@ -1,19 +1,46 @@
 from .parameters import Parameters, FirstCellParameters, SecondCellParameters, ThirdCellParameters
 from .cell_dna import DNAProperties, CellDNA
+from .history import GenomeHistory, NO_PARENT
 from dataclasses import dataclass, astuple, fields, asdict
-from typing import Type, TypeVar, List, Callable, Any, Sequence, Tuple
+from typing import Type, TypeVar, List, Callable, Any, Sequence, Tuple, Optional
 from random import choice, uniform
 import numpy as np  
 
 D = TypeVar('D', bound='DNA')
 class DNA:
-    def __init__(self, parameters: List[Parameters], properties: DNAProperties = DNAProperties()):
+    """ Genome made of one CellDNA per generator cell.
+        With a GenomeHistory, every version of the genome is appended to
+        it and history_id is the id of the current one.
+    """
+    __slots__ = ('cells', 'properties', 'history', 'history_id')
+
+    def __init__(
+        self, 
+        parameters: List[Parameters], 
+        properties: DNAProperties = DNAProperties(), 
+        history: Optional[GenomeHistory] = None,
+        parent: int = NO_PARENT
+    ):
         self.cells = []
         for param in parameters:
             self.cells.append(CellDNA(param, properties))
         self.properties = properties
+        self.history = history
+        self.history_id = parent
+        self._append_history()
+        return
+
+    def _append_history(self) -> None:
+        if self.history is not None:
+            self.history_id = self.history.append(self.serialize(), self.history_id)
         return
 
+    def get_evolution_history(self) -> List[List[int]]:
+        """ Serialized versions of this genome, oldest first """
+        if self.history is None:
+            return [self.serialize()]
+        return self.history.genes[self.history.lineage(self.history_id)[::-1]].tolist()
+
     def __repr__(self):
         r = ""
         for c in self.cells:
@@ -24,12 +51,31 @@ class DNA:
     def gen_random(
         cls:D, 
         param_types: List[Type[Parameters]] = [FirstCellParameters, SecondCellParameters, ThirdCellParameters], 
-        prop: DNAProperties = DNAProperties()
+        prop: DNAProperties = DNAProperties(),
+        history: Optional[GenomeHistory] = None,
+        parent: int = NO_PARENT
     ) -> D:         
         params = [] 
         for param_type in param_types:
             params.append(param_type.gen_random())
-        return DNA(params, prop)
+        return DNA(params, prop, history, parent)
+
+    @classmethod
+    def from_serial(
+        cls:D, 
+        s: List[int], 
+        param_types: List[Type[Parameters]] = [FirstCellParameters, SecondCellParameters, ThirdCellParameters], 
+        prop: DNAProperties = DNAProperties(),
+        history: Optional[GenomeHistory] = None,
+        parent: int = NO_PARENT
+    ) -> D:
+        params = []
+        position = 0
+        for param_type in param_types:
+            param_count = param_type.parameter_count()
+            params.append(param_type.from_serial(s[position:(position+param_count)]))
+            position += param_count
+        return DNA(params, prop, history, parent)
 
     def serialize(self) -> List[int]:
         s = []
@@ -40,6 +86,7 @@ class DNA:
     def mutate(self) -> None:
         for c in self.cells:
             c.mutate()
+        self._append_history()
         return
 
     def set_properties(self, properties: DNAProperties) -> None:
@@ -56,4 +103,5 @@ class DNA:
                 evolution_matrix[position:(position+param_count)]
             )
             position += param_count
+        self._append_history()
         return
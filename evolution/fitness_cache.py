@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+CACHE_VERSION = 1
+
+class FitnessCache:
+    """ Persistent cache of inception scores keyed by architecture
+        and training configuration.
+
+        Entries are stored as JSON on disk and evicted by age
+        (seconds since they were scored) and by count
+        (least recently used first).
+    """
+    def __init__(self, path: str, max_entries: int = 10000, max_age: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries : Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+        return
+
+    @staticmethod
+    def key(arch: List[int], config: Dict[str, Any]) -> str:
+        blob = json.dumps({"arch": [int(a) for a in arch], "config": config}, sort_keys=True, default=str)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CACHE_VERSION:
+            return
+        self.entries = data["entries"]
+        self.evict()
+        return
+
+    def save(self) -> None:
+        """ Atomically write the cache to disk """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return
+
+    def evict(self) -> int:
+        """ Drop expired entries, then the least recently used ones
+            until at most max_entries remain. Returns the number evicted.
+        """
+        n_before = len(self.entries)
+        if self.max_age is not None:
+            now = time.time()
+            self.entries = {
+                k: e for k, e in self.entries.items() if now - e["created"] <= self.max_age
+            }
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            by_access = sorted(self.entries.items(), key=lambda item: item[1]["accessed"])
+            self.entries = dict(by_access[len(self.entries) - self.max_entries:])
+        return n_before - len(self.entries)
+
+    def get(self, arch: List[int], config: Dict[str, Any]) -> Optional[float]:
+        entry = self.entries.get(self.key(arch, config))
+        if entry is None or (self.max_age is not None and time.time() - entry["created"] > self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["accessed"] = time.time()
+        return entry["score"]
+
+    def checkpoint_dir(self, arch: List[int], config: Dict[str, Any]) -> Optional[str]:
+        """ Checkpoint directory of a cached run, if it was recorded """
+        entry = self.entries.get(self.key(arch, config))
+        if entry is None:
+            return None
+        return entry.get("checkpoint_dir")
+
+    def put(self, arch: List[int], config: Dict[str, Any], score: float, checkpoint_dir: Optional[str] = None) -> None:
+        now = time.time()
+        self.entries[self.key(arch, config)] = {
+            "arch": [int(a) for a in arch],
+            "score": float(score),
+            "checkpoint_dir": checkpoint_dir,
+            "created": now,
+            "accessed": now,
+        }
+        self.evict()
+        self.save()
+        return
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,168 @@
+from .parameters import Parameters, FirstCellParameters, SecondCellParameters, ThirdCellParameters, field_table
+from typing import Type, List, Optional, Sequence
+import numpy as np
+import os
+
+NO_PARENT = -1
+
+def _record_dtype(n_genes: int) -> np.dtype:
+    return np.dtype([
+        ('parent', np.int64),
+        ('generation', np.int32),
+        ('score', np.float64),
+        ('genes', np.int8, (n_genes,)),
+    ])
+
+class GenomeHistory:
+    """ Append-only columnar log of every genome ever created.
+
+        Row i is the genome with id i: its genes, the id of the genome
+        it was derived from (NO_PARENT for fresh ones), the generation
+        it was created in and its score (NaN until scored).
+        Rows live in one preallocated structured array, doubled when full,
+        or in a memory-mapped file when a path is given.
+    """
+    def __init__(
+        self,
+        param_types: Sequence[Type[Parameters]] = (FirstCellParameters, SecondCellParameters, ThirdCellParameters),
+        capacity: int = 1024,
+        path: Optional[str] = None
+    ):
+        self.param_types = list(param_types)
+        self.option_counts = np.array([len(o) for t in self.param_types for o in field_table(t).options], dtype=np.int64)
+        self.offsets = np.append(0, np.cumsum(self.option_counts)[:-1])
+        self.dtype = _record_dtype(len(self.option_counts))
+        self.path = path
+        self.generation = 0
+        self.size = 0
+        self.records = self._allocate(max(capacity, 1))
+        return
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.path is None:
+            return np.zeros(capacity, dtype=self.dtype)
+        # r+ keeps the rows already written and grows the file to the requested shape
+        mode = 'r+' if self.size and os.path.exists(self.path) else 'w+'
+        return np.memmap(self.path, dtype=self.dtype, mode=mode, shape=(capacity,))
+
+    def _reserve(self, n: int) -> None:
+        capacity = len(self.records)
+        if self.size + n <= capacity:
+            return
+        while self.size + n > capacity:
+            capacity *= 2
+        if self.path is None:
+            records = self._allocate(capacity)
+            records[:self.size] = self.records[:self.size]
+            self.records = records
+        else:
+            self.records.flush()
+            del self.records
+            self.records = self._allocate(capacity)
+        return
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def genes(self) -> np.ndarray:
+        return self.records['genes'][:self.size]
+
+    @property
+    def parents(self) -> np.ndarray:
+        return self.records['parent'][:self.size]
+
+    @property
+    def generations(self) -> np.ndarray:
+        return self.records['generation'][:self.size]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.records['score'][:self.size]
+
+    def next_generation(self) -> None:
+        """ Genomes appended from now on belong to the next generation """
+        self.generation += 1
+        return
+
+    def append(self, genes: Sequence[int], parent: int = NO_PARENT) -> int:
+        """ Record one genome and return its id """
+        self._reserve(1)
+        genome_id = self.size
+        self.records[genome_id] = (parent, self.generation, np.nan, genes)
+        self.size += 1
+        return genome_id
+
+    def append_many(self, genes: np.ndarray, parents: Optional[Sequence[int]] = None) -> np.ndarray:
+        """ Record a genome matrix, one genome per row, and return their ids """
+        genes = np.asarray(genes).reshape(-1, len(self.option_counts))
+        n = len(genes)
+        self._reserve(n)
+        rows = self.records[self.size:self.size + n]
+        rows['genes'] = genes
+        rows['parent'] = NO_PARENT if parents is None else np.asarray(parents)
+        rows['generation'] = self.generation
+        rows['score'] = np.nan
+        ids = np.arange(self.size, self.size + n)
+        self.size += n
+        return ids
+
+    def set_scores(self, ids: Sequence[int], scores: Sequence[float]) -> None:
+        self.records['score'][np.asarray(ids, dtype=np.int64)] = scores
+        return
+
+    def lineage(self, genome_id: int) -> np.ndarray:
+        """ Ids from genome_id back to its root ancestor """
+        return self.lineages([genome_id])[:, 0]
+
+    def lineages(self, ids: Sequence[int]) -> np.ndarray:
+        """ Ancestor ids of several genomes at once, one column per genome:
+            row k holds the k-th ancestor, NO_PARENT past the root.
+            Each step follows the parent column for all genomes together.
+        """
+        parents = self.parents
+        current = np.asarray(ids, dtype=np.int64)
+        steps = [current]
+        while (current != NO_PARENT).any():
+            current = np.where(current == NO_PARENT, NO_PARENT, parents[np.maximum(current, 0)])
+            steps.append(current)
+        return np.stack(steps[:-1])
+
+    def gene_frequencies(self, generation: Optional[int] = None) -> List[np.ndarray]:
+        """ Frequency of every option of every gene, over all genomes
+            or over the genomes of one generation
+        """
+        genes = self.genes
+        if generation is not None:
+            genes = genes[self.generations == generation]
+        counts = np.bincount((genes + self.offsets).ravel(), minlength=int(self.option_counts.sum()))
+        total = max(len(genes), 1)
+        return np.split(counts / total, np.cumsum(self.option_counts)[:-1])
+
+    def gene_frequencies_by_generation(self) -> np.ndarray:
+        """ Option frequencies of every generation in one call,
+            shape (n_generations, total number of options)
+        """
+        n_options = int(self.option_counts.sum())
+        n_generations = int(self.generations.max()) + 1 if self.size else 0
+        cells = self.generations[:, None].astype(np.int64) * n_options + self.genes + self.offsets
+        counts = np.bincount(cells.ravel(), minlength=n_generations * n_options).reshape(n_generations, n_options)
+        sizes = np.bincount(self.generations, minlength=n_generations)
+        return counts / np.maximum(sizes, 1)[:, None]
+
+    def best(self, n: int = 1) -> np.ndarray:
+        """ Ids of the n best scored genomes """
+        scores = np.where(np.isnan(self.scores), -np.inf, self.scores)
+        return np.argsort(-scores, kind='mergesort')[:n]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['records'] = np.array(self.records[:self.size])
+        return state
+
+    def __setstate__(self, state):
+        records = state.pop('records')
+        self.__dict__.update(state)
+        self.records = self._allocate(max(len(records), 1))
+        self.records[:len(records)] = records
+        return
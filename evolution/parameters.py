@@ -1,6 +1,7 @@
 from enum import Enum, IntEnum
 from dataclasses import dataclass, astuple, fields, asdict
-from typing import Type, TypeVar, List, Any
+from functools import lru_cache
+from typing import Type, TypeVar, List, Any, NamedTuple, Tuple
 from random import choice
 
 class ConvolutionBlock(IntEnum):
@@ -27,28 +28,54 @@ class Skip(IntEnum):
 
 P = TypeVar('P', bound='Parameters')
 
-@dataclass 
+class FieldTable(NamedTuple):
+    """ Per class field information, computed once """
+    names: Tuple[str, ...]
+    types: Tuple[Type[IntEnum], ...]
+    member_names: Tuple[List[str], ...]
+    options: Tuple[Tuple[IntEnum, ...], ...]
+
+@lru_cache(maxsize=None)
+def field_table(cls: Type[P]) -> FieldTable:
+    field_list = fields(cls)
+    return FieldTable(
+        names=tuple(f.name for f in field_list),
+        types=tuple(f.type for f in field_list),
+        member_names=tuple(list(f.type.__members__) for f in field_list),
+        options=tuple(tuple(f.type) for f in field_list),
+    )
+
+@lru_cache(maxsize=None)
+def _decode(cls: Type[P], s: Tuple[int, ...]) -> P:
+    table = field_table(cls)
+    if (len(table.names) != len(s)):
+        raise Exception(f"Bad field length:{len(s)} should be: {len(table.names)}")
+    return cls._from_serial([options[v] for options, v in zip(table.options, s)])
+
+@dataclass(frozen=True)
 class Parameters: 
+    """ Immutable set of genes. Instances are shared between DNAs,
+        from_serial returns the same object for the same genes.
+    """
+    __slots__ = ('_serial',)
+
+    def __post_init__(self):
+        # encode once, serialize is called on every access
+        object.__setattr__(self, '_serial', tuple(int(getattr(self, name)) for name in field_table(type(self)).names))
+
     @classmethod
     def gen_random(cls: Type[P], choice_func=choice) -> P:
-        field_list = fields(cls)
+        table = field_table(cls)
         params = []
-        for f in field_list:
-            param_choice = choice_func(list(f.type.__members__))
-            param_choice = f.type[param_choice]
+        for t, member_names in zip(table.types, table.member_names):
+            param_choice = choice_func(member_names)
+            param_choice = t[param_choice]
             params.append(param_choice)
         return cls._from_serial(params)
 
     @classmethod
     def from_serial(cls: Type[P], s: List[int]) -> P:
-        field_list = fields(cls)
-        if (len(field_list) != len(s)):
-            raise Exception(f"Bad field length:{len(s)} should be: {len(field_list)}")
-        params = []
-        for idx, f in enumerate(field_list):
-            param = f.type[list(f.type.__members__)[s[idx]]]
-            params.append(param)
-        return cls._from_serial(params)
+        return _decode(cls, tuple(int(v) for v in s))
             
     @classmethod
     def _from_serial(cls: Type[P], s: List[int]) -> P:
@@ -56,43 +83,46 @@ class Parameters:
     
     @classmethod
     def get_field_options(cls: Type[P], field_idx:int) -> List[Any]:
-        field_list = fields(cls)
-        if (field_idx >= len(field_list)):
+        options = field_table(cls).options
+        if (field_idx >= len(options)):
             raise Exception(f"Field at idx: {field_idx} does not exist.")
-        return list(field_list[field_idx].type)
+        return list(options[field_idx])
 
     @classmethod
     def parameter_count(cls: Type[P]) -> int:
-        return len(fields(cls))
+        return len(field_table(cls).names)
 
     def serialize(self) -> List[int]:
-        values = astuple(self)
-        values = list(values)
-        for idx, v in enumerate(values):
-            values[idx] = v.value
-        return values
+        return list(self._serial)
 
     def to_dict(self) -> dict:
-        values = asdict(self)
-        return values 
+        # same result as asdict, enum members are not copied by it either
+        return {name: getattr(self, name) for name in field_table(type(self)).names}
+
+    def __reduce__(self):
+        # frozen slotted dataclasses cannot be unpickled attribute by attribute
+        return (type(self), tuple(getattr(self, name) for name in field_table(type(self)).names))
 
-@dataclass
+@dataclass(frozen=True)
 class FirstCellParameters(Parameters):
+    __slots__ = ('conv_block', 'normalization', 'upsample', 'shortcut')
     conv_block : ConvolutionBlock
     normalization : Normalization
     upsample: Upsample
     shortcut : Shortcut
 
-@dataclass
+@dataclass(frozen=True)
 class SecondCellParameters(Parameters):
+    __slots__ = ('conv_block', 'normalization', 'upsample', 'shortcut', 'skip_from_1')
     conv_block : ConvolutionBlock
     normalization : Normalization
     upsample: Upsample 
     shortcut : Shortcut
     skip_from_1: Skip
 
-@dataclass
+@dataclass(frozen=True)
 class ThirdCellParameters(Parameters):
+    __slots__ = ('conv_block', 'normalization', 'upsample', 'shortcut', 'skip_from_1', 'skip_from_2')
     conv_block : ConvolutionBlock
     normalization : Normalization
     upsample: Upsample
@@ -0,0 +1,126 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+def dominates(objectives: np.ndarray) -> np.ndarray:
+    """ Dominance matrix of objectives to minimize, one row per solution:
+        entry (i, j) is True when i is no worse than j everywhere and better somewhere
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    no_worse = (objectives[:, None, :] <= objectives[None, :, :]).all(axis=2)
+    better = (objectives[:, None, :] < objectives[None, :, :]).any(axis=2)
+    return no_worse & better
+
+def non_dominated_sort(objectives: np.ndarray) -> np.ndarray:
+    """ Pareto rank of every solution, 0 for the non-dominated front,
+        1 for the front once rank 0 is removed, and so on
+    """
+    dominance = dominates(objectives)
+    n_dominators = dominance.sum(axis=0)
+    ranks = np.full(len(dominance), -1, dtype=np.int64)
+    rank = 0
+    while (ranks < 0).any():
+        front = (n_dominators == 0) & (ranks < 0)
+        ranks[front] = rank
+        n_dominators = n_dominators - dominance[front].sum(axis=0)
+        rank += 1
+    return ranks
+
+def crowding_distance(objectives: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+    """ NSGA-II crowding distance within each front, infinite at the
+        extremes of every objective
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    distance = np.zeros(len(objectives))
+    for rank in np.unique(ranks):
+        members = np.flatnonzero(ranks == rank)
+        for m in range(objectives.shape[1]):
+            values = objectives[members, m]
+            order = members[np.argsort(values, kind="mergesort")]
+            span = values.max() - values.min()
+            distance[order[0]] = distance[order[-1]] = np.inf
+            if len(order) > 2 and span > 0:
+                sorted_values = objectives[order, m]
+                distance[order[1:-1]] += (sorted_values[2:] - sorted_values[:-2]) / span
+    return distance
+
+def nsga2_order(objectives: np.ndarray) -> np.ndarray:
+    """ Indices from best to worst: by Pareto rank, then by decreasing crowding distance """
+    ranks = non_dominated_sort(objectives)
+    crowding = crowding_distance(objectives, ranks)
+    return np.lexsort((-crowding, ranks))
+
+def nsga2_fitness(objectives: np.ndarray) -> np.ndarray:
+    """ Scalar fitness for the exp(score) weighting of the evolution matrix:
+        minus the Pareto rank, plus up to 0.5 for the least crowded solutions
+        of a front so that they are preferred within it
+    """
+    ranks = non_dominated_sort(objectives)
+    crowding = crowding_distance(objectives, ranks)
+    finite = np.where(np.isinf(crowding), 0.0, crowding)
+    bonus = np.where(np.isinf(crowding), 1.0, finite / (1.0 + finite))
+    return -ranks + 0.5 * bonus
+
+def pareto_front(objectives: np.ndarray) -> np.ndarray:
+    """ Indices of the non-dominated solutions """
+    return np.flatnonzero(~dominates(objectives).any(axis=0))
+
+class ParetoArchive:
+    """ Every scored genome with its objectives, all minimized:
+        minus the inception score, then the costs returned by cost_func(arch).
+        The elite is the best population_size genomes found so far,
+        by Pareto rank then crowding distance, as NSGA-II's
+        selection over parents and offspring.
+    """
+    def __init__(self, cost_func: Callable[[List[int]], Sequence[float]], population_size: int):
+        self.cost_func = cost_func
+        self.population_size = population_size
+        self.costs : Dict[Tuple[int, ...], Tuple[float, ...]] = {}
+        self.genomes : List[List[int]] = []
+        # GenomeHistory id of every scored genome, -1 without history
+        self.history_ids : List[int] = []
+        self.objectives = np.zeros((0, 0))
+        self.elite = np.zeros(0, dtype=np.int64)
+        return
+
+    def cost(self, arch: Sequence[int]) -> Tuple[float, ...]:
+        key = tuple(int(a) for a in arch)
+        if key not in self.costs:
+            self.costs[key] = tuple(float(c) for c in self.cost_func(list(key)))
+        return self.costs[key]
+
+    def add(
+        self,
+        genomes: Sequence[Sequence[int]],
+        archs: Sequence[Sequence[int]],
+        scores: Sequence[float],
+        history_ids: Optional[Sequence[int]] = None
+    ) -> None:
+        """ Record a scored generation and select the new elite from it and the previous elite """
+        rows = np.array([(-float(score),) + self.cost(arch) for arch, score in zip(archs, scores)])
+        first = len(self.genomes)
+        self.genomes += [list(g) for g in genomes]
+        self.history_ids += [int(i) for i in history_ids] if history_ids is not None else [-1] * len(genomes)
+        self.objectives = rows if first == 0 else np.concatenate([self.objectives, rows])
+
+        candidates = np.sort(np.concatenate([self.elite, np.arange(first, len(self.genomes))]))
+        # a genome scored several times competes once, with its latest score
+        _, last = np.unique(np.array([self.genomes[i] for i in candidates])[::-1], axis=0, return_index=True)
+        unique = candidates[len(candidates) - 1 - last]
+        # the best duplicates fill the elite when fewer distinct genomes remain
+        duplicates = np.setdiff1d(candidates, unique)
+        ranked = np.concatenate([unique[nsga2_order(self.objectives[unique])],
+                                 duplicates[nsga2_order(self.objectives[duplicates])]])
+        self.elite = ranked[:self.population_size]
+        return
+
+    def elite_fitness(self) -> np.ndarray:
+        return nsga2_fitness(self.objectives[self.elite])
+
+    def front(self) -> np.ndarray:
+        """ Indices of the non-dominated genomes among all scored ones, best score first.
+            A genome scored several times counts with its latest score.
+        """
+        _, last = np.unique(np.array(self.genomes)[::-1], axis=0, return_index=True)
+        latest = len(self.genomes) - 1 - last
+        front = latest[pareto_front(self.objectives[latest])]
+        return front[np.argsort(self.objectives[front, 0], kind="mergesort")]
@@ -0,0 +1,102 @@
+from .parameters import Parameters, FirstCellParameters, SecondCellParameters, ThirdCellParameters, field_table
+from .cell_dna import DNAProperties
+from .dna import DNA
+from .history import GenomeHistory, NO_PARENT
+from typing import Type, TypeVar, List, Optional, Sequence
+import numpy as np
+
+P = TypeVar('P', bound='Population')
+
+def option_counts(param_types: Sequence[Type[Parameters]]) -> np.ndarray:
+    """ Number of options of every gene, in serialization order """
+    return np.array([len(o) for t in param_types for o in field_table(t).options], dtype=np.int64)
+
+class Population:
+    """ A population of DNAs stored as one integer genome matrix,
+        one row per DNA and one column per gene.
+
+        mutate, evolve and evolution_matrix operate on the whole
+        matrix at once. Rows are converted to DNA objects on access.
+        DNAs are not views on a row but copies: they are pickled into
+        snapshots and migration messages on their own, carry their own
+        DNAProperties (choice functions included) and history id, and
+        share their Parameters with every DNA with the same genes.
+    """
+    def __init__(
+        self,
+        genomes: np.ndarray,
+        param_types: Sequence[Type[Parameters]] = (FirstCellParameters, SecondCellParameters, ThirdCellParameters)
+    ):
+        self.param_types = list(param_types)
+        self.option_counts = option_counts(self.param_types)
+        self.genomes = np.asarray(genomes, dtype=np.int64).reshape(-1, len(self.option_counts))
+        return
+
+    @classmethod
+    def gen_random(
+        cls: Type[P],
+        n_dna: int,
+        param_types: Sequence[Type[Parameters]] = (FirstCellParameters, SecondCellParameters, ThirdCellParameters),
+        rng: Optional[np.random.RandomState] = None
+    ) -> P:
+        rng = rng if rng is not None else np.random
+        counts = option_counts(param_types)
+        return cls((rng.random_sample((n_dna, len(counts))) * counts).astype(np.int64), param_types)
+
+    @classmethod
+    def from_dna_list(cls: Type[P], dna_list: List[DNA]) -> P:
+        param_types = [type(c.parameters) for c in dna_list[0].cells]
+        return cls(np.array([d.serialize() for d in dna_list]), param_types)
+
+    def __len__(self):
+        return self.genomes.shape[0]
+
+    def __getitem__(self, idx: int) -> DNA:
+        return self.dna(idx)
+
+    def dna(
+        self,
+        idx: int,
+        properties: DNAProperties = DNAProperties(),
+        history: Optional[GenomeHistory] = None,
+        parent: int = NO_PARENT
+    ) -> DNA:
+        """ DNA object for one row of the genome matrix, recorded in history as a child of parent """
+        return DNA.from_serial(self.genomes[idx].tolist(), self.param_types, properties, history, parent)
+
+    def to_dna_list(self, properties: DNAProperties = DNAProperties(), history: Optional[GenomeHistory] = None) -> List[DNA]:
+        return [self.dna(idx, properties, history) for idx in range(len(self))]
+
+    def mutate(self, mutation_probability: float, rng: Optional[np.random.RandomState] = None) -> None:
+        """ Replace each gene, with the given probability, by
+            one of its other options chosen uniformly
+        """
+        rng = rng if rng is not None else np.random
+        mask = rng.random_sample(self.genomes.shape) < mutation_probability
+        # An offset in [1, n_options) never maps a gene back onto itself
+        offsets = 1 + (rng.random_sample(self.genomes.shape) * (self.option_counts - 1)).astype(np.int64)
+        mutated = (self.genomes + offsets) % self.option_counts
+        self.genomes = np.where(mask, mutated, self.genomes)
+        return
+
+    def evolve(self, evolution_matrix: List[List[float]], rng: Optional[np.random.RandomState] = None) -> None:
+        """ Resample every gene from its categorical distribution in the evolution matrix """
+        rng = rng if rng is not None else np.random
+        cdf = np.zeros((len(self.option_counts), self.option_counts.max()))
+        for idx, p in enumerate(evolution_matrix):
+            cdf[idx, :len(p)] = np.cumsum(p)
+            cdf[idx, len(p):] = np.inf
+        cdf[np.arange(len(self.option_counts)), self.option_counts - 1] = np.inf
+        u = rng.random_sample(self.genomes.shape)
+        # The number of cdf entries not above u is the sampled option
+        self.genomes = (u[:, :, None] >= cdf[None, :, :]).sum(axis=2).astype(np.int64)
+        return
+
+    def evolution_matrix(self, scores: Sequence[float]) -> List[List[float]]:
+        """ Per gene distribution of options weighted by exp(score) """
+        weights = np.exp(np.asarray(scores, dtype=np.float64))
+        n_genes = len(self.option_counts)
+        counts = np.zeros((n_genes, self.option_counts.max()))
+        np.add.at(counts, (np.broadcast_to(np.arange(n_genes), self.genomes.shape), self.genomes), weights[:, None])
+        counts /= counts.sum(axis=1, keepdims=True)
+        return [counts[idx, :n].tolist() for idx, n in enumerate(self.option_counts)]
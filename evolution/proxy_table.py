@@ -0,0 +1,119 @@
+from .search_space import SearchSpace
+from typing import Optional, Sequence
+import numpy as np
+import os
+
+# Training-free proxies computed by zero_cost.py, and the sign
+# that makes larger values better for each of them
+PROXIES = ('grad_norm', 'jacob_cov', 'separability')
+PROXY_SIGNS = (1.0, 1.0, -1.0)
+
+NOT_SCANNED, SCANNED, DEGENERATE = 0, 1, 2
+
+PROXY_DTYPE = np.dtype([(name, np.float32) for name in PROXIES] + [('status', np.uint8)])
+
+def percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """ Rank of every value divided by the number of values, in [0, 1) """
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="mergesort")] = np.arange(len(values))
+    return ranks / max(len(values), 1)
+
+class ProxyTable:
+    """ Zero-cost proxy scores of every genome of the search space,
+        one row per SearchSpace rank, in a .npy file.
+
+        The file is memory-mapped so that several scanning processes
+        can fill disjoint rank ranges of it, and a scan can be stopped
+        and continued. Rows start NOT_SCANNED, the fitness of a genome
+        is the mean percentile rank of its proxies among the scanned
+        genomes that are not DEGENERATE.
+    """
+    def __init__(self, path: str, space: Optional[SearchSpace] = None, readonly: bool = False):
+        self.path = path
+        self.space = space if space is not None else SearchSpace()
+        if os.path.exists(path):
+            self.records = np.lib.format.open_memmap(path, mode='r' if readonly else 'r+')
+            if self.records.dtype != PROXY_DTYPE or self.records.shape != (self.space.size,):
+                raise Exception(f"{path} is not a proxy table of this search space.")
+        else:
+            if readonly:
+                raise Exception(f"No proxy table at '{path}'.")
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self.records = np.lib.format.open_memmap(path, mode='w+', dtype=PROXY_DTYPE, shape=(self.space.size,))
+        self._fitness = None
+        return
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def status(self) -> np.ndarray:
+        return self.records['status']
+
+    def coverage(self) -> float:
+        """ Fraction of the search space scanned so far """
+        return float(np.count_nonzero(self.status != NOT_SCANNED)) / len(self)
+
+    def write(self, ranks: np.ndarray, proxies: np.ndarray, degenerate: np.ndarray) -> None:
+        """ Store the proxies of the genomes at ranks, one column per entry of PROXIES """
+        ranks = np.asarray(ranks, dtype=np.int64)
+        proxies = np.asarray(proxies, dtype=np.float32)
+        for column, name in enumerate(PROXIES):
+            self.records[name][ranks] = proxies[:, column]
+        self.records['status'][ranks] = np.where(degenerate, DEGENERATE, SCANNED)
+        self._fitness = None
+        return
+
+    def flush(self) -> None:
+        if isinstance(self.records, np.memmap):
+            self.records.flush()
+        return
+
+    def fitness(self) -> np.ndarray:
+        """ Combined proxy score of every genome, higher is better:
+            NaN when not scanned, -inf when degenerate
+        """
+        if self._fitness is None:
+            fitness = np.full(len(self), np.nan)
+            fitness[self.status == DEGENERATE] = -np.inf
+            healthy = np.flatnonzero(self.status == SCANNED)
+            if len(healthy):
+                fitness[healthy] = np.mean([
+                    percentile_ranks(sign * self.records[name][healthy].astype(np.float64))
+                    for name, sign in zip(PROXIES, PROXY_SIGNS)
+                ], axis=0)
+            self._fitness = fitness
+        return self._fitness
+
+    def genome_fitness(self, genomes: Sequence[Sequence[int]]) -> np.ndarray:
+        return self.fitness()[self.space.rank_many(np.asarray(genomes).reshape(-1, len(self.space.option_counts)))]
+
+    def is_degenerate(self, genomes: Sequence[Sequence[int]]) -> np.ndarray:
+        """ Mask of the genomes the scan found degenerate, unscanned genomes are not """
+        ranks = self.space.rank_many(np.asarray(genomes).reshape(-1, len(self.space.option_counts)))
+        return self.status[ranks] == DEGENERATE
+
+    def _ranked_fitness(self) -> np.ndarray:
+        fitness = self.fitness()
+        return np.where(np.isnan(fitness), -np.inf, fitness)
+
+    def best(self, n: int) -> np.ndarray:
+        """ Genomes of the n best scanned genomes, best first """
+        fitness = self._ranked_fitness()
+        n = min(n, len(fitness))
+        top = np.argpartition(-fitness, n - 1)[:n]
+        return self.space.unrank_many(top[np.argsort(-fitness[top], kind="mergesort")])
+
+    def sample(self, n: int, top_fraction: float = 0.1, rng: Optional[np.random.RandomState] = None) -> np.ndarray:
+        """ n distinct genomes drawn uniformly among the top_fraction best
+            healthy genomes scanned, without replacement while possible
+        """
+        rng = rng if rng is not None else np.random
+        healthy = np.count_nonzero(self.status == SCANNED)
+        if healthy == 0:
+            raise Exception(f"The proxy table '{self.path}' has no scanned genome.")
+        n_top = min(healthy, max(n, int(np.ceil(top_fraction * healthy))))
+        fitness = self._ranked_fitness()
+        top = np.argpartition(-fitness, n_top - 1)[:n_top]
+        return self.space.unrank_many(rng.choice(top, size=n, replace=n > n_top))
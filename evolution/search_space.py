@@ -0,0 +1,88 @@
+from .parameters import Parameters, FirstCellParameters, SecondCellParameters, ThirdCellParameters
+from .population import option_counts
+from typing import Type, List, Iterator, Sequence
+import numpy as np
+
+def arch_from_serial(values: List[int]) -> List[int]:
+    """ Fold the two skip genes of the last cell into the single
+        skip value of the architecture vector expected by AutoGAN
+    """
+    values = list(values)
+    skip = values[len(values)-2:]
+    skip = skip[0] * 2 + skip[1]
+    values = values[:len(values)-2]
+    values.append(skip)
+    return values
+
+class SearchSpace:
+    """ Dense integer indexing of every genome of the search space.
+
+        Genomes are mixed radix numbers, the first gene being the most
+        significant digit, so rank and unrank are a dot product and
+        a few divisions. The same indexing is available for the
+        architecture vectors produced by arch_from_serial.
+    """
+    def __init__(
+        self,
+        param_types: Sequence[Type[Parameters]] = (FirstCellParameters, SecondCellParameters, ThirdCellParameters)
+    ):
+        self.param_types = list(param_types)
+        self.option_counts = option_counts(self.param_types)
+        self.strides = self._strides(self.option_counts)
+        self.size = int(np.prod(self.option_counts))
+
+        self.arch_option_counts = np.append(
+            self.option_counts[:-2], self.option_counts[-2] * self.option_counts[-1]
+        )
+        self.arch_strides = self._strides(self.arch_option_counts)
+        self.arch_size = int(np.prod(self.arch_option_counts))
+        return
+
+    @staticmethod
+    def _strides(counts: np.ndarray) -> np.ndarray:
+        return np.append(np.cumprod(counts[::-1])[::-1][1:], 1).astype(np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def rank(self, genome: Sequence[int]) -> int:
+        return int(np.dot(self.strides, genome))
+
+    def unrank(self, idx: int) -> List[int]:
+        if not 0 <= idx < self.size:
+            raise Exception(f"Genome index {idx} is out of range [0, {self.size}).")
+        return ((idx // self.strides) % self.option_counts).tolist()
+
+    def rank_many(self, genomes: np.ndarray) -> np.ndarray:
+        return np.asarray(genomes, dtype=np.int64) @ self.strides
+
+    def unrank_many(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        return (ids[:, None] // self.strides) % self.option_counts
+
+    def iter_genomes(self, batch_size: int = 4096) -> Iterator[np.ndarray]:
+        """ Stream the whole space in rank order, batch_size genomes at a time """
+        for start in range(0, self.size, batch_size):
+            yield self.unrank_many(np.arange(start, min(start + batch_size, self.size)))
+
+    def __iter__(self) -> Iterator[List[int]]:
+        for batch in self.iter_genomes():
+            yield from batch.tolist()
+
+    def to_arch_many(self, genomes: np.ndarray) -> np.ndarray:
+        """ Vectorized arch_from_serial """
+        genomes = np.asarray(genomes, dtype=np.int64)
+        return np.concatenate([genomes[:, :-2], genomes[:, -2:-1] * 2 + genomes[:, -1:]], axis=1)
+
+    def arch_rank(self, arch: Sequence[int]) -> int:
+        return int(np.dot(self.arch_strides, arch))
+
+    def arch_rank_many(self, archs: np.ndarray) -> np.ndarray:
+        return np.asarray(archs, dtype=np.int64) @ self.arch_strides
+
+    def count_distinct_archs(self, batch_size: int = 65536) -> int:
+        """ Number of distinct architecture vectors over the whole space """
+        seen = np.zeros(self.arch_size, dtype=bool)
+        for batch in self.iter_genomes(batch_size):
+            seen[self.arch_rank_many(self.to_arch_many(batch))] = True
+        return int(seen.sum())
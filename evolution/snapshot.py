@@ -0,0 +1,43 @@
+import os
+import pickle
+import random
+import numpy as np
+from typing import Any, Dict, Optional
+
+SNAPSHOT_VERSION = 1
+
+def rng_state() -> Dict[str, Any]:
+    """ States of the Python and NumPy global random generators """
+    return {"python": random.getstate(), "numpy": np.random.get_state()}
+
+def set_rng_state(state: Dict[str, Any]) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    return
+
+def save_snapshot(path: str, state: Dict[str, Any]) -> None:
+    """ Atomically pickle the state of an evolutionary run,
+        a crash while writing leaves the previous snapshot intact
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "state": state, "rng": rng_state()}, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """ Load the state saved by save_snapshot and restore the random
+        generators, None if there is no snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    if data.get("version") != SNAPSHOT_VERSION:
+        raise Exception(f"Unsupported snapshot version {data.get('version')} in {path}")
+    set_rng_state(data["rng"])
+    return data["state"]
@@ -0,0 +1,112 @@
+from .parameters import Parameters, FirstCellParameters, SecondCellParameters, ThirdCellParameters
+from .population import option_counts
+from typing import Type, List, Optional, Sequence
+import numpy as np
+
+def rank_correlation(a: Sequence[float], b: Sequence[float]) -> float:
+    """ Spearman rank correlation, ties get their average rank """
+    def ranks(x):
+        x = np.asarray(x, dtype=np.float64)
+        order = np.argsort(x, kind="mergesort")
+        r = np.empty(len(x))
+        r[order] = np.arange(len(x))
+        # average the ranks of tied values
+        _, inverse, counts = np.unique(x, return_inverse=True, return_counts=True)
+        sums = np.bincount(inverse, weights=r)
+        return sums[inverse] / counts[inverse]
+    ra, rb = ranks(a), ranks(b)
+    if ra.std() == 0 or rb.std() == 0:
+        return 0.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+class SurrogateModel:
+    """ Small MLP regressor from one-hot encoded genomes to inception scores,
+        retrained online on every scored genome.
+
+        Before each refit, the scores of the new genomes are compared with
+        what the current model predicted for them. The history of these
+        out-of-sample rank correlations tells whether the surrogate
+        is worth using.
+    """
+    def __init__(
+        self,
+        param_types: Sequence[Type[Parameters]] = (FirstCellParameters, SecondCellParameters, ThirdCellParameters),
+        hidden_size: int = 32,
+        n_steps: int = 500,
+        learning_rate: float = 0.01,
+        weight_decay: float = 1e-3,
+        min_samples: int = 10,
+        seed: int = 0
+    ):
+        counts = option_counts(param_types)
+        self.offsets = np.append(0, np.cumsum(counts)[:-1])
+        self.n_inputs = int(counts.sum())
+        self.hidden_size = hidden_size
+        self.n_steps = n_steps
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.min_samples = min_samples
+        self.rng = np.random.RandomState(seed)
+        self.genomes = np.zeros((0, len(counts)), dtype=np.int64)
+        self.scores = np.zeros(0)
+        self.rank_correlations : List[float] = []
+        self.weights : Optional[List[np.ndarray]] = None
+        return
+
+    def encode(self, genomes: np.ndarray) -> np.ndarray:
+        genomes = np.asarray(genomes, dtype=np.int64)
+        x = np.zeros((len(genomes), self.n_inputs))
+        x[np.arange(len(genomes))[:, None], genomes + self.offsets] = 1.0
+        return x
+
+    def is_ready(self) -> bool:
+        return self.weights is not None and len(self.scores) >= self.min_samples
+
+    def add(self, genomes: np.ndarray, scores: Sequence[float]) -> None:
+        """ Record newly scored genomes and refit the model """
+        genomes = np.asarray(genomes, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        if self.weights is not None and len(scores) > 1:
+            self.rank_correlations.append(rank_correlation(self.predict(genomes), scores))
+        self.genomes = np.concatenate([self.genomes, genomes])
+        self.scores = np.concatenate([self.scores, scores])
+        self.fit()
+        return
+
+    def fit(self) -> None:
+        """ Full batch Adam on the mean squared error of standardized scores """
+        x = self.encode(self.genomes)
+        self.y_mean = self.scores.mean()
+        self.y_std = self.scores.std() if self.scores.std() > 0 else 1.0
+        y = ((self.scores - self.y_mean) / self.y_std)[:, None]
+
+        scale = 1.0 / np.sqrt(self.n_inputs)
+        w = [
+            self.rng.randn(self.n_inputs, self.hidden_size) * scale,
+            np.zeros(self.hidden_size),
+            self.rng.randn(self.hidden_size, 1) / np.sqrt(self.hidden_size),
+            np.zeros(1),
+        ]
+        m = [np.zeros_like(p) for p in w]
+        v = [np.zeros_like(p) for p in w]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for step in range(1, self.n_steps + 1):
+            h = np.tanh(x @ w[0] + w[1])
+            out = h @ w[2] + w[3]
+            d_out = 2.0 * (out - y) / len(y)
+            d_h = (d_out @ w[2].T) * (1.0 - h ** 2)
+            grads = [x.T @ d_h, d_h.sum(0), h.T @ d_out, d_out.sum(0)]
+            for i in range(len(w)):
+                g = grads[i] + self.weight_decay * w[i]
+                m[i] = beta1 * m[i] + (1 - beta1) * g
+                v[i] = beta2 * v[i] + (1 - beta2) * g ** 2
+                m_hat = m[i] / (1 - beta1 ** step)
+                v_hat = v[i] / (1 - beta2 ** step)
+                w[i] = w[i] - self.learning_rate * m_hat / (np.sqrt(v_hat) + eps)
+        self.weights = w
+        return
+
+    def predict(self, genomes: np.ndarray) -> np.ndarray:
+        w = self.weights
+        h = np.tanh(self.encode(genomes) @ w[0] + w[1])
+        return (h @ w[2] + w[3])[:, 0] * self.y_std + self.y_mean
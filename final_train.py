@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" Final training of one architecture, data parallel over processes.
+
+    Every process trains the same generator and discriminator on its shard
+    of the dataset and the gradients are averaged with the gloo backend
+    after every step. Rank 0 validates and writes the logs and checkpoints.
+
+    On one machine, the processes are started here and pinned to their
+    share of the CPU cores:
+
+        python final_train.py --procs 8 --max_epoch 320 --arch 0 1 0 ...
+
+    Over several machines, start it with torchrun on every node instead:
+
+        torchrun --nnodes 2 --nproc_per_node 8 --rdzv_backend c10d --rdzv_endpoint host:29500 \\
+            final_train.py --max_epoch 320 --arch 0 1 0 ...
+"""
+import argparse
+import os
+import socket
+
+import torch.multiprocessing as mp
+
+import gan_train
+from cores import available_cores, pin_process, split_cores
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--arch', nargs='+', type=int, required=True,
+                        help='architecture vector to train')
+    parser.add_argument('--max_epoch', type=int, required=True,
+                        help='number of epochs to train for')
+    parser.add_argument('--procs', type=int, default=1,
+                        help='processes to start on this machine when not launched by torchrun')
+    parser.add_argument('--load_path', type=str, default=None,
+                        help='experiment directory to resume training from')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='torch threads per process, defaults to its share of the CPU cores')
+    return parser.parse_args(args=args)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def train(args) -> None:
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    local_procs = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+    cores = split_cores(available_cores(), local_procs)[local_rank]
+    pin_process(cores, args.threads if args.threads else len(cores))
+
+    overrides = {"--distributed": True, "--load_path": args.load_path}
+    result = gan_train.run_training(args.arch, args.max_epoch, None, overrides)
+    if os.environ.get('RANK', '0') == '0':
+        print(f"=> inception score {result.score}, checkpoints in {result.checkpoint_dir}")
+
+
+def _spawned(local_rank: int, args, port: int) -> None:
+    os.environ.update({
+        'MASTER_ADDR': '127.0.0.1',
+        'MASTER_PORT': str(port),
+        'RANK': str(local_rank),
+        'LOCAL_RANK': str(local_rank),
+        'WORLD_SIZE': str(args.procs),
+        'LOCAL_WORLD_SIZE': str(args.procs),
+    })
+    train(args)
+
+
+def main(args) -> None:
+    if 'RANK' in os.environ:
+        # started by torchrun
+        train(args)
+    else:
+        mp.spawn(_spawned, args=(args, free_port()), nprocs=args.procs)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,6 +1,17 @@
-from typing import List
-from AutoGAN.train_derived import train_derived
+from typing import List, NamedTuple, Optional
+from AutoGAN.train_derived import train_derived, train_derived_lockstep, TrainingContext, init_weights
+from AutoGAN.models_search.shared_gan import Generator, Discriminator
+from AutoGAN.models_search.lean_gan import LeanGenerator
+from AutoGAN.functions import train_supernet, get_is
+from AutoGAN.utils.learning_curve import EarlyTermination
+from evolution.search_space import arch_from_serial
 import AutoGAN.cfg
+import io
+import numpy as np
+import os
+import time
+import torch
+import uuid
 
 from multiprocessing import Process, Queue
 
@@ -16,6 +27,7 @@ args = dict([
     ("--latent_dim", 128),
     ("--gf_dim", 256),
     ("--df_dim", 128),
+    ("--lean_gen", True),
     ("--g_spectral_norm", False),
     ("--d_spectral_norm", True),
     ("--g_lr", 0.0002),
@@ -29,19 +41,183 @@ args = dict([
     ("--calc_fid", False),
     ("--warnings_enabled", False),
     ("--num_eval_imgs", 10000),
+    ("--random_seed", 12345),
 ])
 
-def _train_gan(arch: List[int], max_epoch: int, q):
-    args["--max_epoch"] = max_epoch
+def training_config(max_epoch: int) -> dict:
+    """ Training options a score depends on, for a given epoch budget """
+    config = dict(args)
+    config["--max_epoch"] = max_epoch
+    return config
+
+class TrainingResult(NamedTuple):
+    score: float
+    # experiment directory, usable as --load_path to resume training, None without a checkpoint
+    checkpoint_dir: Optional[str]
+    # the score is the extrapolation of a run stopped early, not a full budget score
+    early_terminated: bool = False
+
+def _parse_args(arch: List[int], max_epoch: int, overrides: Optional[dict] = None):
+    """ Build AutoGAN arguments, overrides are options that do not change
+        what is being trained (resume paths, early stopping...)
+    """
+    config = training_config(max_epoch)
+    config.update(overrides or {})
     args_list = []
-    for k, v in args.items():
-        args_list.extend([k, str(v)])
-    args_list.append("--arch")
-    for item in arch:
-        args_list.append(str(item))
-
-    result = train_derived(AutoGAN.cfg.parse_args(args=args_list))   
-    q.put(result)
+    for k, v in config.items():
+        if v is None:
+            continue
+        if isinstance(v, (list, tuple)):
+            args_list.append(k)
+            args_list.extend(str(item) for item in v)
+        else:
+            args_list.extend([k, str(v)])
+    if arch:
+        args_list.append("--arch")
+        for item in arch:
+            args_list.append(str(item))
+    return AutoGAN.cfg.parse_args(args=args_list)
+
+def _job_overrides(overrides: Optional[dict]) -> dict:
+    """ Give a job its own experiment directory: directories are named after the
+        second they are created in, which parallel workers and hosts share
+    """
+    job_overrides = dict(overrides or {})
+    if job_overrides.get("--exp_name") is None:
+        job_overrides["--exp_name"] = f"{args['--exp_name']}_{uuid.uuid4().hex[:12]}"
+    return job_overrides
+
+def _checkpoint_dir(train_args) -> Optional[str]:
+    """ Experiment directory of a finished run, if it saved a checkpoint. Ranks other than 0
+        of a data parallel run and runs stopped in their first epoch have none.
+    """
+    if not train_args.path_helper:
+        return None
+    if not os.path.exists(os.path.join(train_args.path_helper['ckpt_path'], 'checkpoint.pth')):
+        return None
+    # resumed or inherited from by other workers, whose working directory may differ
+    return os.path.abspath(train_args.path_helper['prefix'])
+
+def create_context() -> TrainingContext:
+    """ Load the inception graphs and the dataset once for a long-lived worker """
+    return TrainingContext(_parse_args([], 1))
+
+def run_training(
+    arch: List[int], 
+    max_epoch: int, 
+    context: TrainingContext = None, 
+    overrides: Optional[dict] = None
+) -> TrainingResult:
+    """ Train a derived GAN in the calling process and return its inception score
+        and checkpoint directory. Passing a context reuses its inception graphs and dataset.
+    """
+    train_args = _parse_args(arch, max_epoch, _job_overrides(overrides))
+    try:
+        score = train_derived(train_args, context)
+        early_terminated = False
+    except EarlyTermination as e:
+        score = e.predicted_score
+        early_terminated = True
+    return TrainingResult(score, _checkpoint_dir(train_args), early_terminated)
+
+def run_training_lockstep(
+    archs: List[List[int]],
+    max_epoch: int,
+    context: TrainingContext = None,
+    overrides_list: Optional[List[Optional[dict]]] = None
+) -> List[TrainingResult]:
+    """ Train several derived GANs in lockstep in the calling process, on the same
+        real minibatches, and return their results in order. They must start from
+        scratch or from a parent (no --load_path) and not stop early.
+    """
+    overrides_list = overrides_list or [None] * len(archs)
+    args_list = [_parse_args(arch, max_epoch, _job_overrides(overrides))
+                 for arch, overrides in zip(archs, overrides_list)]
+    scores = train_derived_lockstep(args_list, context)
+    return [TrainingResult(score, _checkpoint_dir(train_args)) for score, train_args in zip(scores, args_list)]
+
+class SupernetEvaluator:
+    """ One-shot evaluator: a single shared_gan supernet is trained on
+        genomes sampled from the population distribution, and each
+        architecture is scored by switching the supernet to it.
+        The supernet keeps its weights between calls.
+    """
+    def __init__(self, context: TrainingContext):
+        self.context = context
+        self.args = _parse_args([], 1)
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.gen_net = Generator(args=self.args).to(self.device)
+        self.dis_net = Discriminator(args=self.args).to(self.device)
+        init_weights(self.gen_net, self.args.init_type)
+        init_weights(self.dis_net, self.args.init_type)
+        self.gen_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, self.gen_net.parameters()),
+                                              self.args.g_lr, (self.args.beta1, self.args.beta2))
+        self.dis_optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, self.dis_net.parameters()),
+                                              self.args.d_lr, (self.args.beta1, self.args.beta2))
+
+    def train(self, evolution_matrix: List[List[float]], n_epoch: int) -> None:
+        """ Train the supernet, sampling every gene of every iteration's
+            architecture from the evolution matrix
+        """
+        def sample_arch() -> List[int]:
+            genome = [int(np.random.choice(len(p), p=p)) for p in evolution_matrix]
+            return arch_from_serial(genome)
+
+        train_supernet(self.args, self.gen_net, self.dis_net, self.gen_optimizer, self.dis_optimizer,
+                       self.context.dataset.train, sample_arch, n_epoch)
+
+    def score(self, archs: List[List[int]], num_img: int) -> List[float]:
+        scores = []
+        for arch in archs:
+            self.gen_net.set_arch(arch, cur_stage=2)
+            with torch.no_grad():
+                scores.append(float(get_is(self.args, self.gen_net, num_img)))
+        return scores
+
+    def state_dict(self) -> bytes:
+        """ Serialized weights and optimizer states of the supernet """
+        buffer = io.BytesIO()
+        torch.save({
+            'gen_state_dict': self.gen_net.state_dict(),
+            'dis_state_dict': self.dis_net.state_dict(),
+            'gen_optimizer': self.gen_optimizer.state_dict(),
+            'dis_optimizer': self.dis_optimizer.state_dict(),
+        }, buffer)
+        return buffer.getvalue()
+
+    def load_state_dict(self, state: bytes) -> None:
+        checkpoint = torch.load(io.BytesIO(state), map_location=self.device)
+        self.gen_net.load_state_dict(checkpoint['gen_state_dict'])
+        self.dis_net.load_state_dict(checkpoint['dis_state_dict'])
+        self.gen_optimizer.load_state_dict(checkpoint['gen_optimizer'])
+        self.dis_optimizer.load_state_dict(checkpoint['dis_optimizer'])
+
+class GeneratorCost(NamedTuple):
+    # median forward time of one batch, in milliseconds
+    latency_ms: float
+    # parameters of the lean generator, the shared_gan generator holds every option
+    n_params: int
+
+def measure_generator_cost(arch: List[int], batch_size: int = 1, n_repeats: int = 10) -> GeneratorCost:
+    """ Measure the serving cost of a derived generator on the CPU of the calling process """
+    gen_args = _parse_args(arch, 1)
+    gen_net = LeanGenerator(args=gen_args)
+    z = torch.randn(batch_size, gen_args.latent_dim)
+    n_params = sum(p.numel() for p in gen_net.parameters())
+
+    gen_net.eval()
+    times = []
+    with torch.no_grad():
+        gen_net(z)
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            gen_net(z)
+            times.append(time.perf_counter() - start)
+    return GeneratorCost(float(np.median(times)) * 1e3, int(n_params))
+
+def _train_gan(arch: List[int], max_epoch: int, q):
+    result = run_training(arch, max_epoch)
+    q.put(result.score)
     return
 
 def train_gan(arch: List[int], max_epoch: int) -> float:
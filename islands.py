@@ -0,0 +1,135 @@
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+
+from abc import ABC, abstractmethod
+from multiprocessing import Queue
+from typing import List, Optional, Sequence, Tuple
+
+islands_logger = logging.getLogger("evo_train")
+
+
+def migration_message(
+    source: int,
+    genomes: Sequence[Sequence[int]],
+    scores: Sequence[float],
+    lineages: Optional[Sequence[Sequence[Sequence[int]]]] = None
+) -> dict:
+    """ Migrants are sent as plain serialized genomes with their scores and,
+        so that the receiving island can record their ancestry, the serialized
+        versions each genome went through, oldest first
+    """
+    message = {
+        "source": source,
+        "genomes": [[int(g) for g in genome] for genome in genomes],
+        "scores": [float(s) for s in scores],
+    }
+    if lineages is not None:
+        message["lineages"] = [[[int(g) for g in version] for version in lineage] for lineage in lineages]
+    return message
+
+def ring_destination(island_id: int, n_islands: int) -> int:
+    """ Islands form a ring, each one sending its migrants to the next """
+    return (island_id + 1) % n_islands
+
+def parse_addresses(addresses: str) -> List[Tuple[str, int]]:
+    """ Parse 'host:port,host:port,...', one address per island """
+    parsed = []
+    for address in addresses.split(","):
+        host, port = address.strip().rsplit(":", 1)
+        parsed.append((host, int(port)))
+    return parsed
+
+
+class Transport(ABC):
+    """ Delivers migration messages between the islands of a run.
+        Delivery is best effort and never blocks the evolution:
+        receive returns whatever arrived since its last call.
+    """
+    @abstractmethod
+    def send(self, destination: int, message: dict) -> None:
+        pass
+
+    @abstractmethod
+    def receive(self) -> List[dict]:
+        pass
+
+    def close(self) -> None:
+        return
+
+
+class QueueTransport(Transport):
+    """ Islands running as processes of one machine, one multiprocessing queue per island """
+    def __init__(self, queues: List[Queue], island_id: int):
+        self.queues = queues
+        self.island_id = island_id
+        return
+
+    @staticmethod
+    def create_queues(n_islands: int) -> List[Queue]:
+        return [Queue() for _ in range(n_islands)]
+
+    def send(self, destination: int, message: dict) -> None:
+        self.queues[destination].put(message)
+        return
+
+    def receive(self) -> List[dict]:
+        messages = []
+        while True:
+            try:
+                messages.append(self.queues[self.island_id].get_nowait())
+            except queue.Empty:
+                return messages
+
+
+class _MessageHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.server.inbox.put(json.loads(line.decode("utf-8")))
+
+
+class _MessageServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class TcpTransport(Transport):
+    """ Islands anywhere on the network, each listening on its own address.
+        A message is one line of JSON sent over a short-lived connection,
+        messages to islands that are not reachable are dropped.
+    """
+    def __init__(self, addresses: List[Tuple[str, int]], island_id: int, timeout: float = 10.0):
+        self.addresses = addresses
+        self.island_id = island_id
+        self.timeout = timeout
+        host, port = addresses[island_id]
+        self.server = _MessageServer((host, port), _MessageHandler)
+        self.server.inbox = queue.Queue()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return
+
+    def send(self, destination: int, message: dict) -> None:
+        try:
+            with socket.create_connection(self.addresses[destination], timeout=self.timeout) as connection:
+                connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        except OSError as e:
+            islands_logger.warning(f"Island {self.island_id} could not reach island {destination}: {e}")
+        return
+
+    def receive(self) -> List[dict]:
+        messages = []
+        while True:
+            try:
+                messages.append(self.server.inbox.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        return
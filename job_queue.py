@@ -0,0 +1,216 @@
+import json
+import os
+import sqlite3
+import time
+
+from contextlib import contextmanager
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from gan_train import training_config
+from scoring_pool import JobResult, TrainingPool
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    arch TEXT NOT NULL,
+    max_epoch INTEGER NOT NULL,
+    overrides TEXT,
+    config TEXT,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    score REAL,
+    checkpoint_dir TEXT,
+    early_terminated INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class Job(NamedTuple):
+    id: int
+    arch: List[int]
+    max_epoch: int
+    overrides: Optional[dict]
+    attempts: int
+    # training options the score is cached under, None if not given
+    config: Optional[dict]
+
+
+class JobQueue:
+    """ Durable training job queue in an SQLite file.
+
+        Any number of processes, on any host that sees the file, can
+        lease queued jobs. A lease expires unless its worker heartbeats,
+        and expired jobs go back to the queue, so workers can come and
+        go during a run. Jobs failing max_attempts times are marked failed.
+    """
+    def __init__(self, path: str, lease_seconds: float = 600.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=60.0)
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+        return
+
+    @contextmanager
+    def _transaction(self):
+        """ One connection per transaction, so that the queue can be used from
+            any thread or process. BEGIN IMMEDIATE takes the write lock up front,
+            two workers can never lease the same job.
+        """
+        db = sqlite3.connect(self.path, timeout=60.0, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, arch: List[int], max_epoch: int, overrides: Optional[dict] = None, config: Optional[dict] = None) -> int:
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO jobs (arch, max_epoch, overrides, config, status, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (json.dumps([int(a) for a in arch]), int(max_epoch), json.dumps(overrides),
+                 json.dumps(config, sort_keys=True), QUEUED, now, now)
+            )
+            return cursor.lastrowid
+
+    def _requeue_expired(self, db: sqlite3.Connection, now: float) -> int:
+        db.execute(
+            "UPDATE jobs SET status = ?, error = 'lease expired', updated = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+            (FAILED, now, LEASED, now, self.max_attempts)
+        )
+        return db.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, updated = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (QUEUED, now, LEASED, now)
+        ).rowcount
+
+    def requeue_expired(self) -> int:
+        """ Put the jobs whose lease expired back in the queue, return how many """
+        with self._transaction() as db:
+            return self._requeue_expired(db, time.time())
+
+    def lease(self, worker: str) -> Optional[Job]:
+        """ Take the oldest queued job, None if there is none """
+        now = time.time()
+        with self._transaction() as db:
+            self._requeue_expired(db, now)
+            row = db.execute(
+                "SELECT id, arch, max_epoch, overrides, attempts, config FROM jobs "
+                "WHERE status = ? ORDER BY id LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (LEASED, worker, now + self.lease_seconds, now, row[0])
+            )
+        return Job(row[0], json.loads(row[1]), row[2], json.loads(row[3]), row[4] + 1, json.loads(row[5]))
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """ Extend the lease of a job, False if the worker lost it """
+        now = time.time()
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (now + self.lease_seconds, now, job_id, LEASED, worker)
+            ).rowcount == 1
+
+    def complete(self, job_id: int, score: float, checkpoint_dir: Optional[str], early_terminated: bool = False) -> None:
+        """ Record the result of a job. A job finished twice, after its lease
+            expired and was retried, keeps the first result.
+        """
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, score = ?, checkpoint_dir = ?, early_terminated = ?, "
+                "lease_expires = NULL, updated = ? WHERE id = ? AND status != ?",
+                (DONE, float(score), checkpoint_dir, int(early_terminated), time.time(), job_id, DONE)
+            )
+        return
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """ Requeue a job its worker failed to train, or mark it failed after max_attempts """
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "worker = NULL, lease_expires = NULL, error = ?, updated = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (self.max_attempts, FAILED, QUEUED, error, time.time(), job_id, LEASED, worker)
+            )
+        return
+
+    def results(self, job_ids: List[int]) -> Dict[int, Any]:
+        """ Status, score, checkpoint directory, early termination and error of finished jobs among job_ids """
+        if not job_ids:
+            return {}
+        with self._transaction() as db:
+            rows = db.execute(
+                f"SELECT id, status, score, checkpoint_dir, early_terminated, error FROM jobs "
+                f"WHERE status IN (?, ?) AND id IN ({','.join('?' for _ in job_ids)})",
+                [DONE, FAILED] + [int(j) for j in job_ids]
+            ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def counts(self) -> Dict[str, int]:
+        with self._transaction() as db:
+            return dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class QueuePool(TrainingPool):
+    """ ScoringPool interface on top of a JobQueue: jobs are trained by
+        independent queue_worker.py processes instead of local workers.
+        n_workers is the number of jobs kept in flight in steady state mode.
+    """
+    def __init__(self, queue: JobQueue, n_workers: int = 1, poll_interval: float = 5.0):
+        self.queue = queue
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self.jobs : Dict[int, Any] = {}
+        self.pending = 0
+        return
+
+    def submit(self, job_id: Any, arch: List[int], max_epoch: int, overrides: Optional[dict] = None) -> None:
+        queue_id = self.queue.enqueue(arch, max_epoch, overrides, training_config(max_epoch))
+        self.jobs[queue_id] = job_id
+        self.pending += 1
+        return
+
+    def next_result(self) -> JobResult:
+        """ Block until any submitted job finishes and return its result """
+        if self.pending == 0:
+            raise Exception("No pending jobs.")
+        while True:
+            self.queue.requeue_expired()
+            finished = self.queue.results(list(self.jobs))
+            for queue_id, (status, score, checkpoint_dir, early_terminated, error) in sorted(finished.items()):
+                job_id = self.jobs.pop(queue_id)
+                self.pending -= 1
+                if status == FAILED:
+                    raise Exception(f"Training job {job_id} failed:\n{error}")
+                return JobResult(job_id, score, checkpoint_dir, bool(early_terminated))
+            time.sleep(self.poll_interval)
@@ -0,0 +1,94 @@
+import logging
+import math
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+from evolution.fitness_cache import FitnessCache
+from gan_train import training_config
+from scoring_pool import TrainingPool
+
+multi_fidelity_logger = logging.getLogger("evo_train")
+
+@dataclass
+class HalvingSchedule:
+    """ Successive halving budgets: rung r trains for min_epoch * eta^r epochs
+        and only the best 1/eta of a rung is promoted to the next one.
+        With n_brackets > 1 the candidates are split into Hyperband brackets,
+        bracket s skipping the first s rungs.
+    """
+    min_epoch: int = 1
+    eta: int = 3
+    n_rungs: int = 3
+    n_brackets: int = 1
+
+    def budget(self, rung: int) -> int:
+        return self.min_epoch * self.eta ** rung
+
+
+def successive_halving(
+    archs: List[List[int]],
+    schedule: HalvingSchedule,
+    pool: TrainingPool,
+    cache: Optional[FitnessCache] = None,
+    first_rung: int = 0,
+    overrides: Optional[dict] = None
+) -> List[float]:
+    """ Train all architectures on a small budget and keep promoting
+        the top fraction to larger budgets. Promoted candidates resume
+        from the checkpoint of their previous rung.
+        Returns the score of each architecture at the highest rung it reached.
+    """
+    scores : List[float] = [0.0 for _ in archs]
+    checkpoints : List[Optional[str]] = [None for _ in archs]
+    candidates = list(range(len(archs)))
+    for rung in range(first_rung, schedule.n_rungs):
+        budget = schedule.budget(rung)
+        config = training_config(budget)
+        to_train = []
+        for idx in candidates:
+            score = cache.get(archs[idx], config) if cache is not None else None
+            if score is None:
+                to_train.append(idx)
+            else:
+                scores[idx] = score
+                checkpoints[idx] = cache.checkpoint_dir(archs[idx], config)
+
+        results = pool.map_results(
+            [archs[idx] for idx in to_train],
+            budget,
+            [dict(overrides or {}, **{"--load_path": checkpoints[idx]}) for idx in to_train]
+        )
+        for idx, result in zip(to_train, results):
+            scores[idx] = result.score
+            checkpoints[idx] = result.checkpoint_dir
+            if cache is not None and not result.early_terminated:
+                cache.put(archs[idx], config, result.score, result.checkpoint_dir)
+
+        multi_fidelity_logger.info(
+            f"Rung {rung}: {len(candidates)} candidates at {budget} epochs, {len(to_train)} trained"
+        )
+        n_promoted = max(1, int(math.ceil(len(candidates) / schedule.eta)))
+        candidates = sorted(candidates, key=lambda idx: scores[idx], reverse=True)[:n_promoted]
+    return scores
+
+def hyperband(
+    archs: List[List[int]],
+    schedule: HalvingSchedule,
+    pool: TrainingPool,
+    cache: Optional[FitnessCache] = None,
+    overrides: Optional[dict] = None
+) -> List[float]:
+    """ Split the architectures round robin over the brackets and run
+        successive halving in each, bracket s starting at rung s
+    """
+    n_brackets = min(schedule.n_brackets, schedule.n_rungs)
+    scores : List[float] = [0.0 for _ in archs]
+    for bracket in range(n_brackets):
+        members = list(range(bracket, len(archs), n_brackets))
+        if not members:
+            continue
+        bracket_scores = successive_halving([archs[idx] for idx in members], schedule, pool, cache, bracket, overrides)
+        for idx, score in zip(members, bracket_scores):
+            scores[idx] = score
+    return scores
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+""" Training worker of a durable job queue.
+
+    Leases jobs from the queue file given by evo_train's --job_queue,
+    trains them and writes the results back. Start as many as there
+    is compute, on any host that shares the queue file, at any time
+    during a run. Workers must share the training config of the search,
+    a job queued with another config is handed back to the queue:
+
+        python queue_worker.py --job_queue jobs.sqlite
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+import gan_train
+from job_queue import Job, JobQueue
+from cores import available_cores, pin_process
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--job_queue', type=str, required=True,
+                        help='SQLite file of the job queue')
+    parser.add_argument('--worker_id', type=str, default=None,
+                        help='name of this worker in the queue, defaults to host:pid')
+    parser.add_argument('--lease_seconds', type=float, default=600.0,
+                        help='a job is handed to another worker if not heartbeated for this long')
+    parser.add_argument('--heartbeat_interval', type=float, default=60.0,
+                        help='seconds between two lease extensions while training')
+    parser.add_argument('--poll_interval', type=float, default=5.0,
+                        help='seconds to wait before polling an empty queue again')
+    parser.add_argument('--max_jobs', type=int, default=None,
+                        help='exit after training this many jobs')
+    parser.add_argument('--exit_when_empty', action='store_true',
+                        help='exit instead of waiting when the queue is empty')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='torch threads, defaults to the cores this process may run on')
+    return parser.parse_args(args=args)
+
+
+def _heartbeat(queue: JobQueue, job_id: int, worker: str, interval: float, done: threading.Event) -> None:
+    while not done.wait(interval):
+        if not queue.heartbeat(job_id, worker):
+            print(f"=> lost the lease of job {job_id}")
+            return
+
+
+def _check_config(job: Job) -> None:
+    """ Refuse a job whose score would be cached under another training config than this worker's """
+    if job.config is None:
+        return
+    config = json.loads(json.dumps(gan_train.training_config(job.max_epoch)))
+    differences = [f"{key} {config.get(key)} instead of {value}"
+                   for key, value in sorted(job.config.items()) if config.get(key) != value]
+    differences += [f"{key} {config[key]} not in the job" for key in sorted(config) if key not in job.config]
+    if differences:
+        raise Exception(f"Training config of this worker differs from the job's: {', '.join(differences)}")
+    return
+
+
+def main(args):
+    worker = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    cores = available_cores()
+    pin_process(cores, args.threads if args.threads else len(cores))
+    queue = JobQueue(args.job_queue, args.lease_seconds)
+    context = None
+    n_jobs = 0
+    while args.max_jobs is None or n_jobs < args.max_jobs:
+        job = queue.lease(worker)
+        if job is None:
+            if args.exit_when_empty:
+                break
+            time.sleep(args.poll_interval)
+            continue
+
+        print(f"=> {worker} training job {job.id} (attempt {job.attempts}): {job.arch} for {job.max_epoch} epochs")
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(queue, job.id, worker, args.heartbeat_interval, done), daemon=True
+        )
+        heartbeat.start()
+        try:
+            _check_config(job)
+            if context is None:
+                context = gan_train.create_context()
+            result = gan_train.run_training(job.arch, job.max_epoch, context, job.overrides)
+            queue.complete(job.id, result.score, result.checkpoint_dir, result.early_terminated)
+        except Exception:
+            queue.fail(job.id, worker, traceback.format_exc())
+        finally:
+            done.set()
+            heartbeat.join()
+        n_jobs += 1
+
+
+if __name__ == "__main__":
+    main(parse_args())
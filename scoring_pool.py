@@ -0,0 +1,199 @@
+import math
+import queue
+import traceback
+
+from abc import ABC, abstractmethod
+from multiprocessing import Process, Queue, Value
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+import gan_train
+from cores import available_cores, pin_process, split_cores
+
+
+def _train_alone(task) -> bool:
+    """ Jobs resuming a checkpoint or stopping early cannot be trained in lockstep """
+    overrides = task[3] or {}
+    return overrides.get("--load_path") is not None or overrides.get("--early_stop_threshold") is not None
+
+def _lockstep_cap(lockstep: int, backlog: List[tuple], tasks: Queue, idle) -> int:
+    """ Largest batch that still leaves the workers waiting for a job their share of the queue """
+    if idle is None:
+        return lockstep
+    try:
+        queued = len(backlog) + tasks.qsize()
+    except NotImplementedError:
+        # qsize is not available on macOS
+        return lockstep
+    return max(1, min(lockstep, math.ceil(queued / (idle.value + 1))))
+
+def _worker_loop(cores: List[int], n_threads: int, tasks: Queue, results: Queue, lockstep: int = 1,
+                 idle=None) -> None:
+    pin_process(cores, n_threads)
+    # inception graphs and dataset are set up on the first job and kept warm
+    context = None
+    # tasks taken from the queue and not trained yet
+    backlog : List[tuple] = []
+    closing = False
+    while True:
+        if not backlog:
+            if closing:
+                return
+            if idle is not None:
+                with idle.get_lock():
+                    idle.value += 1
+            task = tasks.get()
+            if idle is not None:
+                with idle.get_lock():
+                    idle.value -= 1
+            if task is None:
+                return
+            backlog.append(task)
+        # take whatever else is queued, up to a lockstep batch but no more than
+        # a fair share of the queue when other workers are waiting for a job
+        cap = _lockstep_cap(lockstep, backlog, tasks, idle)
+        while not closing and len(backlog) < cap:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                closing = True
+            else:
+                backlog.append(task)
+        batch = [backlog.pop(0)]
+        if not _train_alone(batch[0]):
+            for task in list(backlog):
+                if len(batch) == cap:
+                    break
+                if not _train_alone(task) and task[2] == batch[0][2]:
+                    batch.append(task)
+                    backlog.remove(task)
+        try:
+            if context is None:
+                context = gan_train.create_context()
+            if len(batch) == 1:
+                job_id, arch, max_epoch, overrides = batch[0]
+                job_results = [gan_train.run_training(arch, max_epoch, context, overrides)]
+            else:
+                job_results = gan_train.run_training_lockstep(
+                    [task[1] for task in batch], batch[0][2], context, [task[3] for task in batch])
+            for task, result in zip(batch, job_results):
+                results.put((task[0], result, None))
+        except Exception:
+            error = traceback.format_exc()
+            for task in batch:
+                results.put((task[0], None, error))
+
+
+class JobResult(NamedTuple):
+    job_id: Any
+    score: float
+    checkpoint_dir: Optional[str]
+    # extrapolated score of a run stopped early, not to be cached or archived
+    early_terminated: bool = False
+
+
+class TrainingPool(ABC):
+    """ Trains architectures on workers, whatever runs them: jobs are
+        submitted with an id and their results come back in any order.
+        Subclasses keep the number of jobs still without a result in pending.
+    """
+    @abstractmethod
+    def submit(self, job_id: Any, arch: List[int], max_epoch: int, overrides: Optional[dict] = None) -> None:
+        pass
+
+    @abstractmethod
+    def next_result(self) -> JobResult:
+        pass
+
+    def map_results(
+        self, 
+        archs: List[List[int]], 
+        max_epoch: Union[int, List[int]], 
+        overrides: Optional[List[Optional[dict]]] = None
+    ) -> List[JobResult]:
+        """ Train every architecture and return the results in input order,
+            max_epoch is either shared or given per architecture
+        """
+        for idx, arch in enumerate(archs):
+            budget = max_epoch[idx] if isinstance(max_epoch, list) else max_epoch
+            self.submit(idx, arch, budget, overrides[idx] if overrides else None)
+        results : Dict[int, JobResult] = {}
+        failure = None
+        while self.pending:
+            try:
+                result = self.next_result()
+            except Exception as e:
+                # results left in flight would be attributed to the jobs of the next call
+                failure = failure or e
+                continue
+            results[result.job_id] = result
+        if failure is not None:
+            raise failure
+        return [results[idx] for idx in range(len(archs))]
+
+    def map(self, archs: List[List[int]], max_epoch: int) -> List[float]:
+        """ Score every architecture and return scores in input order """
+        return [result.score for result in self.map_results(archs, max_epoch)]
+
+    def close(self) -> None:
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ScoringPool(TrainingPool):
+    """ Pool of long-lived training worker processes, each pinned to
+        its own subset of CPU cores and torch thread count.
+
+        Workers load the inception graphs and the dataset once and
+        then train one architecture per job, pulling the next job
+        as soon as they are free. With lockstep > 1, a worker trains up
+        to lockstep queued jobs of the same budget together on the same
+        minibatches, fewer when that would leave other workers idle.
+    """
+    def __init__(self, n_workers: int = 1, threads_per_worker: Optional[int] = None, lockstep: int = 1):
+        self.n_workers = n_workers
+        self.tasks : Queue = Queue()
+        self.results : Queue = Queue()
+        self.pending = 0
+        self.workers : List[Process] = []
+        # number of workers waiting for a job, to split the queue fairly in lockstep
+        self.idle = Value('i', 0)
+        for cores in split_cores(available_cores(), n_workers):
+            n_threads = threads_per_worker if threads_per_worker else len(cores)
+            # Workers are not daemonic so that the DataLoader can start its own processes
+            p = Process(target=_worker_loop, args=(cores, n_threads, self.tasks, self.results, lockstep,
+                                                     self.idle))
+            p.start()
+            self.workers.append(p)
+        return
+
+    def submit(self, job_id: Any, arch: List[int], max_epoch: int, overrides: Optional[dict] = None) -> None:
+        """ Queue a training job, overrides are extra AutoGAN options such as --load_path """
+        self.tasks.put((job_id, [int(a) for a in arch], max_epoch, overrides))
+        self.pending += 1
+        return
+
+    def next_result(self) -> JobResult:
+        """ Block until any submitted job finishes and return its result """
+        if self.pending == 0:
+            raise Exception("No pending jobs.")
+        job_id, result, error = self.results.get()
+        self.pending -= 1
+        if error is not None:
+            raise Exception(f"Training job {job_id} failed:\n{error}")
+        return JobResult(job_id, result.score, result.checkpoint_dir, result.early_terminated)
+
+    def close(self) -> None:
+        for _ in self.workers:
+            self.tasks.put(None)
+        for p in self.workers:
+            p.join()
+        self.workers = []
+        return
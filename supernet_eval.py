@@ -0,0 +1,88 @@
+import traceback
+
+from multiprocessing import Process, Queue
+from typing import List, Optional
+
+import gan_train
+from cores import available_cores, pin_process
+
+
+def _supernet_loop(cores: List[int], tasks: Queue, results: Queue) -> None:
+    pin_process(cores, len(cores))
+    evaluator = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        try:
+            if evaluator is None:
+                evaluator = gan_train.SupernetEvaluator(gan_train.create_context())
+            command, payload = task
+            if command == "train":
+                evolution_matrix, n_epoch = payload
+                evaluator.train(evolution_matrix, n_epoch)
+                results.put((None, None))
+            elif command == "score":
+                archs, num_img = payload
+                results.put((evaluator.score(archs, num_img), None))
+            elif command == "save":
+                results.put((evaluator.state_dict(), None))
+            elif command == "load":
+                evaluator.load_state_dict(payload)
+                results.put((None, None))
+            else:
+                raise Exception(f"Unknown supernet command: {command}")
+        except Exception:
+            results.put((None, traceback.format_exc()))
+
+
+class SupernetScorer:
+    """ Long-lived process owning a shared_gan supernet.
+        The supernet is trained a little every generation and
+        candidates are scored on its shared weights.
+    """
+    def __init__(self, n_epoch: int = 1, num_img: int = 5000, cores: Optional[List[int]] = None):
+        self.n_epoch = n_epoch
+        self.num_img = num_img
+        self.tasks : Queue = Queue()
+        self.results : Queue = Queue()
+        # Not daemonic so that the DataLoader can start its own processes
+        self.process = Process(target=_supernet_loop,
+                               args=(cores if cores else available_cores(), self.tasks, self.results))
+        self.process.start()
+        return
+
+    def _call(self, command: str, payload):
+        self.tasks.put((command, payload))
+        result, error = self.results.get()
+        if error is not None:
+            raise Exception(f"Supernet {command} failed:\n{error}")
+        return result
+
+    def train(self, evolution_matrix: List[List[float]]) -> None:
+        """ Train the supernet for n_epoch epochs on genomes sampled from the evolution matrix """
+        self._call("train", (evolution_matrix, self.n_epoch))
+        return
+
+    def score(self, archs: List[List[int]]) -> List[float]:
+        return self._call("score", ([[int(a) for a in arch] for arch in archs], self.num_img))
+
+    def state_dict(self) -> bytes:
+        """ Supernet weights and optimizer states, for the snapshot of the run """
+        return self._call("save", None)
+
+    def load_state_dict(self, state: bytes) -> None:
+        self._call("load", state)
+        return
+
+    def close(self) -> None:
+        self.tasks.put(None)
+        self.process.join()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
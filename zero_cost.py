@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+""" Zero-cost proxy scan of the whole generator search space.
+
+    Every genome is scored without training: one shared_gan Generator and
+    Discriminator are built at random initialization and switched to each
+    architecture with set_arch, so that all architectures see the same
+    weights, latent vectors and reference images. Three training-free
+    signals are stored in an evolution.proxy_table.ProxyTable:
+
+    - grad_norm: norm of the generator gradient of the hinge generator loss,
+    - jacob_cov: Jacobian covariance score of the generator w.r.t. the latent
+      vectors, high when different latent vectors are mapped differently,
+    - separability: Fisher ratio of the random discriminator features of
+      generated and reference images, low when they are hard to tell apart.
+
+    Architectures with non finite signals, a zero gradient or the same output
+    for every latent vector are marked degenerate. Batches of genome ranks
+    are scanned by parallel processes, a stopped scan continues where it was:
+
+        python zero_cost.py --output proxies.npy --workers 8
+
+    evo_train.py --proxy_table proxies.npy seeds the initial population with
+    the best genomes of the table and never breeds degenerate ones.
+"""
+import argparse
+import time
+import traceback
+
+from multiprocessing import Process, Queue
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from AutoGAN.models_search.shared_gan import Generator, Discriminator, init_weights
+from evolution.proxy_table import ProxyTable, NOT_SCANNED
+from cores import available_cores, split_cores, pin_process
+
+
+def synthetic_images(n: int, img_size: int, generator: torch.Generator) -> torch.Tensor:
+    """ Smooth random images in [-1, 1], a stand-in for real data:
+        low resolution noise upsampled to img_size
+    """
+    noise = torch.rand(n, 3, img_size // 8, img_size // 8, generator=generator) * 2 - 1
+    return F.interpolate(noise, size=(img_size, img_size), mode='bilinear', align_corners=False)
+
+
+def jacobian_covariance(jacobian: np.ndarray, k: float = 1e-5) -> float:
+    """ Score of the correlation between the per sample Jacobians,
+        higher when samples are less correlated (Mellor et al., 2020)
+    """
+    jacobian = jacobian.reshape(len(jacobian), -1).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlations = np.corrcoef(jacobian)
+    if not np.isfinite(correlations).all():
+        return float('nan')
+    eigenvalues = np.linalg.eigvalsh(correlations)
+    return float(-np.sum(np.log(eigenvalues + k) + 1.0 / (eigenvalues + k)))
+
+
+def fisher_separability(a: torch.Tensor, b: torch.Tensor) -> float:
+    """ Squared distance between the means of two sets of features over their total variance """
+    spread = a.var(dim=0, unbiased=False).sum() + b.var(dim=0, unbiased=False).sum()
+    return float((a.mean(dim=0) - b.mean(dim=0)).pow(2).sum() / (spread + 1e-8))
+
+
+class ProxyScanner:
+    """ Zero-cost proxies of architectures on one randomly initialized
+        shared_gan Generator and Discriminator. The discriminator is
+        frozen and in eval mode, its features of the reference images
+        are computed once.
+    """
+    def __init__(
+        self,
+        gf_dim: int = 32,
+        df_dim: int = 32,
+        batch_size: int = 16,
+        latent_dim: int = 128,
+        bottom_width: int = 4,
+        init_type: str = 'xavier_uniform',
+        d_spectral_norm: bool = True,
+        min_output_std: float = 1e-3,
+        reference: Optional[np.ndarray] = None,
+        seed: int = 0
+    ):
+        self.args = argparse.Namespace(gf_dim=gf_dim, df_dim=df_dim, latent_dim=latent_dim,
+                                       bottom_width=bottom_width, d_spectral_norm=d_spectral_norm)
+        self.min_output_std = min_output_std
+        torch.manual_seed(seed)
+        self.gen_net = Generator(args=self.args)
+        self.dis_net = Discriminator(args=self.args)
+        init_weights(self.gen_net, init_type)
+        init_weights(self.dis_net, init_type)
+        self.dis_net.cur_stage = 2
+        self.dis_net.eval()
+        for p in self.dis_net.parameters():
+            p.requires_grad_(False)
+        self.gen_params = list(self.gen_net.parameters())
+
+        rng = torch.Generator().manual_seed(seed)
+        self.z = torch.randn(batch_size, latent_dim, generator=rng)
+        if reference is None:
+            self.reference = synthetic_images(batch_size, bottom_width * 8, rng)
+        else:
+            self.reference = torch.as_tensor(reference[:batch_size], dtype=torch.float32)
+
+        # the input of the last linear layer is the pooled discriminator feature vector
+        self._features = None
+        self.dis_net.l5.register_forward_pre_hook(self._keep_features)
+        with torch.no_grad():
+            self.dis_net(self.reference)
+        self.reference_features = self._features
+        return
+
+    def _keep_features(self, module, inputs) -> None:
+        self._features = inputs[0]
+
+    def proxies(self, arch: List[int]) -> Tuple[List[float], bool]:
+        """ Proxies of one architecture vector in PROXIES order, and whether it is degenerate """
+        self.gen_net.set_arch(arch, cur_stage=2)
+        for p in self.gen_params:
+            p.grad = None
+        z = self.z.clone().requires_grad_(True)
+        fake = self.gen_net(z)
+        jacobian = torch.autograd.grad(fake.sum(), z, retain_graph=True)[0]
+        g_loss = -self.dis_net(fake).mean()
+        g_loss.backward()
+
+        grad_norm = float(torch.sqrt(sum(p.grad.pow(2).sum() for p in self.gen_params if p.grad is not None)))
+        values = [
+            grad_norm,
+            jacobian_covariance(jacobian.numpy()),
+            fisher_separability(self._features.detach(), self.reference_features),
+        ]
+        output_std = float(fake.detach().std(dim=0).mean())
+        degenerate = not np.isfinite(values).all() or grad_norm == 0 or not output_std >= self.min_output_std
+        return values, degenerate
+
+    def scan(self, archs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Proxies of many architectures, one row per architecture, and the degenerate mask """
+        rows = [self.proxies(arch) for arch in np.asarray(archs).tolist()]
+        return np.array([values for values, _ in rows]), np.array([degenerate for _, degenerate in rows])
+
+
+def _scan_loop(cores: List[int], n_threads: int, scanner_options: dict, path: str, tasks: Queue, results: Queue) -> None:
+    pin_process(cores, n_threads)
+    # every process builds the same networks from the same seed
+    scanner = ProxyScanner(**scanner_options)
+    table = ProxyTable(path)
+    while True:
+        ranks = tasks.get()
+        if ranks is None:
+            return
+        try:
+            archs = table.space.to_arch_many(table.space.unrank_many(ranks))
+            proxies, degenerate = scanner.scan(archs)
+            table.write(ranks, proxies, degenerate)
+            table.flush()
+            results.put((len(ranks), int(degenerate.sum()), None))
+        except Exception:
+            results.put((0, 0, traceback.format_exc()))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default='proxies.npy',
+                        help='proxy table file, created or continued')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of scanning processes, each pinned to its share of the CPU cores')
+    parser.add_argument('--batch', type=int, default=256,
+                        help='genomes scanned per task')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first genome rank to scan')
+    parser.add_argument('--stop', type=int, default=None,
+                        help='genome rank to stop at, defaults to the whole search space')
+    parser.add_argument('--gf_dim', type=int, default=32,
+                        help='generator channels of the proxy networks, the search trains with 256')
+    parser.add_argument('--df_dim', type=int, default=32)
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='latent vectors and reference images every architecture is run on')
+    parser.add_argument('--reference', type=str, default='',
+                        help='.npy file of real images in [-1, 1] (N, 3, 32, 32), smooth random images by default')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(args=args)
+
+
+def main(args):
+    table = ProxyTable(args.output)
+    stop = min(args.stop if args.stop is not None else len(table), len(table))
+    pending = np.flatnonzero(table.status[args.start:stop] == NOT_SCANNED) + args.start
+    print(f"=> {len(pending)} of {stop - args.start} genomes to scan, coverage {table.coverage() * 100:.1f}%")
+    if not len(pending):
+        return
+
+    scanner_options = dict(
+        gf_dim=args.gf_dim, df_dim=args.df_dim, batch_size=args.batch_size, seed=args.seed,
+        reference=np.load(args.reference) if args.reference else None
+    )
+    tasks : Queue = Queue()
+    results : Queue = Queue()
+    workers = [
+        Process(target=_scan_loop, args=(cores, len(cores), scanner_options, args.output, tasks, results), daemon=True)
+        for cores in split_cores(available_cores(), args.workers)
+    ]
+    for p in workers:
+        p.start()
+    batches = [pending[i:i + args.batch] for i in range(0, len(pending), args.batch)]
+    for ranks in batches:
+        tasks.put(ranks)
+
+    start_time = time.time()
+    n_scanned, n_degenerate = 0, 0
+    try:
+        for _ in batches:
+            n, degenerate, error = results.get()
+            if error is not None:
+                raise Exception(f"Proxy scan failed:\n{error}")
+            n_scanned += n
+            n_degenerate += degenerate
+            rate = n_scanned / (time.time() - start_time)
+            print(f"=> {n_scanned}/{len(pending)} genomes, {n_degenerate} degenerate, "
+                  f"{rate:.1f} genomes/s, {(len(pending) - n_scanned) / rate / 60:.1f} min left")
+    except BaseException:
+        # workers only see the end of the queue after scanning every remaining batch
+        for p in workers:
+            p.terminate()
+        # nobody reads the batches left in the queue anymore
+        tasks.cancel_join_thread()
+        raise
+    finally:
+        for _ in workers:
+            tasks.put(None)
+        for p in workers:
+            p.join()
+
+    table = ProxyTable(args.output, readonly=True)
+    print(f"=> coverage {table.coverage() * 100:.1f}%, best genomes:")
+    best = table.best(5)
+    for genome, score in zip(best.tolist(), table.genome_fitness(best)):
+        print(f"{genome} : {score:.3f}")
+
+
+if __name__ == "__main__":
+    main(parse_args())